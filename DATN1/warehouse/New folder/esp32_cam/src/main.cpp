@@ -16,6 +16,8 @@ const char* password = "12345678";
 
 
 const char* flaskServer = "http://192.168.75.106:5000/upload_image";
+// Key issued by POST /api/devices on the server
+const char* deviceKey = "CHANGE_ME";
 
 #define PWDN_GPIO_NUM       32
 #define RESET_GPIO_NUM      -1
@@ -169,6 +171,7 @@ bool sendImageToServer(camera_fb_t* fb) {
 
   http.begin(flaskServer);
   http.addHeader("Content-Type", contentType);
+  http.addHeader("X-Device-Key", deviceKey);
 
   Serial.println("Sending HTTP POST request...");
   int httpResponseCode = http.POST(buffer, bodyLength); 
@@ -4,6 +4,7 @@
 #include <HX711.h>
 #include <ArduinoJson.h>
 #include <HTTPClient.h>
+#include <Preferences.h>
 
 float temperature = 0.0, humidity = 0.0, weight = 0.0;
 
@@ -12,6 +13,14 @@ const char* password = "12345678";
 
 
 const char* flaskServer = "http://192.168.75.106:5000";
+// Key issued by POST /api/devices on the server
+const char* deviceKey = "CHANGE_ME";
+// Sent with every reading; when DEVICE_AUTH_REQUIRED is on the server uses the device bound to the key instead
+const char* deviceId = "scale-1";
+
+// Reading sequence number; the server drops a retried reading with a seq it already stored.
+// The high 32 bits are a boot counter kept in flash so seq keeps increasing after a reboot.
+uint64_t seq = 0;
 
 WebServer server(80);
 
@@ -44,11 +53,14 @@ void sendSensorData() {
   }
 
   http.addHeader("Content-Type", "application/json");
+  http.addHeader("X-Device-Key", deviceKey);
 
   DynamicJsonDocument doc(300);
   doc["temperature"] = temperature;
   doc["humidity"] = humidity;
   doc["weight"] = weight;
+  doc["device_id"] = deviceId;
+  doc["seq"] = seq++;
   String payload;
   serializeJson(doc, payload);
   Serial.print("Sensor payload: ");
@@ -89,6 +101,13 @@ void handleData() {
 void setup() {
   Serial.begin(115200);
   delay(100);
+  Preferences prefs;
+  prefs.begin("sensor", false);
+  uint32_t boots = prefs.getUInt("boots", 0) + 1;
+  prefs.putUInt("boots", boots);
+  prefs.end();
+  seq = (uint64_t)boots << 32;
+
   dht.setup(DHT_PIN, DHTesp::DHT11);
   Serial.println("DHT11 sensor initialized.");
 
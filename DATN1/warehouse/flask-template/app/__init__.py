@@ -1,37 +1,117 @@
-import os
-from flask import Flask
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from flask import Flask, current_app
 from flask_socketio import SocketIO
-from instance.database import init_db, close_db
+from .database import init_db, close_db
+from .logs import configure_logging
+from .jobs import run_exclusive
+from .repositories import server_engine
+from .socket_queue import LocalManager, socketio_options
+from .migrations import run_migrations, needs_epoch_backfill, backfill_epoch_timestamps
 
 # Initialize SocketIO at module level
 socketio = SocketIO(cors_allowed_origins="*")
 
-def create_app():
-    """Initialize the Flask application and related components."""
+logger = logging.getLogger(__name__)
+
+# Config.BLUEPRINTS name -> (module, blueprint attribute); modules are only imported when enabled
+BLUEPRINTS = {
+    'auth': ('.auth', 'auth_bp'),
+    'main': ('.routes', 'main_bp'),
+    'sensor': ('.sensor', 'sensor_bp'),
+    'qr': ('.qr', 'qr_bp'),
+    'inventory': ('.inventory', 'inventory_bp'),
+    'dashboard': ('.dashboard', 'dashboard_bp'),
+    'devices': ('.devices', 'devices_bp'),
+    'metrics': ('.metrics', 'metrics_bp'),
+    'profiling': ('.profiling', 'profiling_bp'),
+    'archive': ('.archive', 'archive_bp'),
+}
+
+def create_app(config=None):
+    """Initialize the Flask application and related components.
+
+    ``config`` is a mapping of settings applied over ``config.Config``,
+    e.g. a test database.
+
+    Timings for each step are kept in ``app.extensions['startup_report']``.
+    A blueprint's import time includes any shared modules it is first to
+    load. Use ``python -X importtime run.py`` for a full breakdown.
+    """
+    app_start = time.perf_counter()
     app = Flask(__name__, 
                 template_folder='../templates',  
                 static_folder='../static')
     
     app.config.from_object('config.Config')
+    app.config.update(config or {})
+    configure_logging(app.config)
     app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024
     
-
-    socketio.init_app(app)
+    report = app.extensions['startup_report'] = {'imports_ms': {}}
+    with _timed(report, 'socketio_init_ms'):
+        # A second app in this process (tests) replaces the module-level server; take the old one off a local:// bus
+        if socketio.server is not None and isinstance(socketio.server.manager, LocalManager):
+            socketio.server.manager.close()
+        socketio.init_app(app, **socketio_options(app.config))
+    # Clients join their topic rooms on connect whichever blueprints this worker serves
+    from .events import init_events
+    init_events(app)
 
     app.teardown_appcontext(close_db)
     
     with app.app_context():
-        init_db()
-    from .auth import auth_bp
-    from .routes import main_bp
-    from .sensor import sensor_bp
-    from .qr import qr_bp
-    from .inventory import inventory_bp
-    
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(main_bp)
-    app.register_blueprint(sensor_bp)
-    app.register_blueprint(qr_bp)
-    app.register_blueprint(inventory_bp)
-    
-    return app, socketio
\ No newline at end of file
+        with _timed(report, 'init_db_ms'):
+            if server_engine() is None:
+                init_db()
+        with _timed(report, 'migrations_ms'):
+            run_migrations()
+        if needs_epoch_backfill():
+            socketio.start_background_task(run_exclusive, app, 'epoch_backfill', _backfill_epoch_timestamps)
+
+    for name in app.config['BLUEPRINTS']:
+        module_name, attr = BLUEPRINTS[name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name, __name__)
+        report['imports_ms'][name] = _elapsed_ms(start)
+        app.register_blueprint(getattr(module, attr))
+
+    # Ingest routes check device keys even when the admin device routes are not served
+    from .devices import get_registry
+    with _timed(report, 'device_keys_ms'):
+        get_registry(app)
+    if 'metrics' in app.config['BLUEPRINTS']:
+        from .metrics import init_metrics
+        init_metrics(app)
+    if 'profiling' in app.config['BLUEPRINTS']:
+        from .profiling import init_profiling
+        init_profiling(app)
+    if 'archive' in app.config['BLUEPRINTS']:
+        from .archive import start_archiver
+        start_archiver(app)
+    if app.config['SENSOR_LISTENER']:
+        from .line_listener import start_listener
+        start_listener(app)
+
+    report['total_ms'] = _elapsed_ms(app_start)
+    logger.info("Started with blueprints %s in %.1f ms: %s", ','.join(app.config['BLUEPRINTS']),
+                report['total_ms'], report)
+
+    return app, socketio
+
+def _backfill_epoch_timestamps(renew):
+    def pause(seconds):
+        renew()
+        socketio.sleep(seconds)
+    backfill_epoch_timestamps(current_app.config['EPOCH_BACKFILL_BATCH'], pause=pause)
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+@contextmanager
+def _timed(report, key):
+    start = time.perf_counter()
+    yield
+    report[key] = _elapsed_ms(start)
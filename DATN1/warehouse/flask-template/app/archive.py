@@ -0,0 +1,261 @@
+"""Memory-mapped columnar archive of ``sensor_data`` for long-range analytics.
+
+Closed UTC days are written once to ``ARCHIVE_DIR/sensor_data/<YYYY-MM-DD>/``
+with one ``.npy`` file per column. ``timestamp_ms`` (int64, sorted) is the
+epoch index. ``temperature``, ``humidity`` and ``weight`` are float32, with
+NaN for NULL. Each day is written under a temporary name and renamed into
+place, so readers never see a partial day. ``manifest.json`` records the
+last archived day; days with no readings get no directory.
+
+A range query memory-maps only the days that overlap the range and
+binary-searches each index for the slice. It then buckets the slice with
+numpy, so pages outside the range are never read and no Python object is
+built per row. Readings after the last archived day come from the database.
+Rows that arrive late for a day that is already archived are not seen by
+archive queries, which is why a day is only archived ``ARCHIVE_GRACE_HOURS``
+after it ends.
+"""
+import calendar
+import json
+import logging
+import os
+import shutil
+import time
+from functools import lru_cache
+from flask import Blueprint, current_app, jsonify, request
+from app import socketio
+from .cache import cached_response
+from .jobs import run_exclusive
+from .migrations import needs_epoch_backfill
+from .repositories import get_repos
+from .utils import login_required, now_timestamp, HOUR_MS
+
+archive_bp = Blueprint('archive', __name__)
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 24 * HOUR_MS
+COLUMNS = ('temperature', 'humidity', 'weight')
+
+# numpy is imported by the first archive query or job (see qr.load_vision), so
+# workers never pay for it at import time
+np = None
+
+
+def load_numpy():
+    global np
+    if np is None:
+        start = time.perf_counter()
+        import numpy
+        np = numpy
+        logger.info("Loaded numpy in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
+def _day_name(day):
+    return time.strftime('%Y-%m-%d', time.gmtime(day * DAY_MS // 1000))
+
+
+def _day_number(name):
+    return calendar.timegm(time.strptime(name, '%Y-%m-%d')) * 1000 // DAY_MS
+
+
+@lru_cache(maxsize=1024)
+def _load_column(path):
+    # Archived files are immutable, so a mapping can be reused for the life of the process
+    return np.load(path, mmap_mode='r')
+
+
+class SensorArchive:
+    def __init__(self, root):
+        self.root = os.path.join(root, 'sensor_data')
+        self._manifest_path = os.path.join(self.root, 'manifest.json')
+
+    def archived_until_day(self):
+        """First day that is not archived yet, or None if nothing is."""
+        try:
+            with open(self._manifest_path) as f:
+                return json.load(f)['next_day']
+        except FileNotFoundError:
+            return None
+
+    def _set_archived_until_day(self, day):
+        tmp = self._manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'next_day': day, 'next_day_start': _day_name(day)}, f)
+        os.replace(tmp, self._manifest_path)
+
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(_day_number(name) for name in os.listdir(self.root)
+                      if not name.startswith('.') and name != 'manifest.json' and not name.endswith('.tmp'))
+
+    def write_day(self, day, chunks):
+        """Write one day from chunks of (timestamp_ms, temperature, humidity, weight) rows; returns row count."""
+        parts = {name: [] for name in ('timestamp_ms',) + COLUMNS}
+        for rows in chunks:
+            parts['timestamp_ms'].append(np.fromiter((row[0] for row in rows), np.int64, len(rows)))
+            for i, name in enumerate(COLUMNS, start=1):
+                parts[name].append(np.array([row[i] for row in rows], dtype=np.float64).astype(np.float32))
+        rows = sum(len(chunk) for chunk in parts['timestamp_ms'])
+        if rows:
+            os.makedirs(self.root, exist_ok=True)
+            final = os.path.join(self.root, _day_name(day))
+            tmp = os.path.join(self.root, f'.{_day_name(day)}.tmp')
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for name, chunks_ in parts.items():
+                np.save(os.path.join(tmp, f'{name}.npy'), np.concatenate(chunks_))
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+        self._set_archived_until_day(day + 1)
+        return rows
+
+    def day_columns(self, day):
+        directory = os.path.join(self.root, _day_name(day))
+        return {name: _load_column(os.path.join(directory, f'{name}.npy'))
+                for name in ('timestamp_ms',) + COLUMNS}
+
+
+class Buckets:
+    """Per-bucket count/sum/min/max for each column, filled one sorted segment at a time."""
+
+    def __init__(self, start_ms, end_ms, bucket_ms):
+        load_numpy()
+        self.bucket_ms = bucket_ms
+        self.first = start_ms // bucket_ms
+        self.size = (end_ms - 1) // bucket_ms - self.first + 1
+        self.count = {name: np.zeros(self.size, np.int64) for name in COLUMNS}
+        self.total = {name: np.zeros(self.size) for name in COLUMNS}
+        self.minimum = {name: np.full(self.size, np.inf) for name in COLUMNS}
+        self.maximum = {name: np.full(self.size, -np.inf) for name in COLUMNS}
+
+    def add(self, timestamps, columns):
+        index = timestamps // self.bucket_ms - self.first
+        for name in COLUMNS:
+            values = np.asarray(columns[name], dtype=np.float64)
+            valid = ~np.isnan(values)
+            bucket, values = index[valid], values[valid]
+            if not len(bucket):
+                continue
+            self.count[name] += np.bincount(bucket, minlength=self.size)
+            self.total[name] += np.bincount(bucket, weights=values, minlength=self.size)
+            # Timestamps are sorted, so each bucket is one contiguous run
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            np.minimum.at(self.minimum[name], bucket[starts], np.minimum.reduceat(values, starts))
+            np.maximum.at(self.maximum[name], bucket[starts], np.maximum.reduceat(values, starts))
+
+    def to_list(self):
+        result = []
+        filled = np.flatnonzero(sum(self.count.values()))
+        for i in filled.tolist():
+            entry = {'timestamp_ms': (self.first + i) * self.bucket_ms}
+            for name in COLUMNS:
+                count = int(self.count[name][i])
+                entry[name] = None if not count else {
+                    'count': count,
+                    'mean': round(float(self.total[name][i]) / count, 3),
+                    'min': round(float(self.minimum[name][i]), 3),
+                    'max': round(float(self.maximum[name][i]), 3),
+                }
+            result.append(entry)
+        return result
+
+
+def aggregate_range(archive, repos, start_ms, end_ms, bucket_ms):
+    """Bucket readings in [start_ms, end_ms) from the archive plus the unarchived tail."""
+    load_numpy()
+    buckets = Buckets(start_ms, end_ms, bucket_ms)
+    next_day = archive.archived_until_day()
+    archived_end = next_day * DAY_MS if next_day is not None else start_ms
+    for day in archive.days():
+        if day * DAY_MS >= min(end_ms, archived_end) or (day + 1) * DAY_MS <= start_ms:
+            continue
+        columns = archive.day_columns(day)
+        timestamps = columns['timestamp_ms']
+        lo, hi = np.searchsorted(timestamps, [start_ms, end_ms])
+        if hi > lo:
+            buckets.add(timestamps[lo:hi], {name: columns[name][lo:hi] for name in COLUMNS})
+    tail_start = max(start_ms, archived_end)
+    if tail_start < end_ms:
+        for rows in repos.sensors.iter_readings(tail_start, end_ms):
+            timestamps = np.fromiter((row[0] for row in rows), np.int64, len(rows))
+            buckets.add(timestamps, {name: np.array([row[i] for row in rows], dtype=np.float64)
+                                     for i, name in enumerate(COLUMNS, start=1)})
+    return buckets
+
+
+def archive_closed_days(archive, repos, now_ms, grace_ms, renew=None):
+    """Archive every day that ended at least ``grace_ms`` ago; returns rows written."""
+    load_numpy()
+    last_closed = (now_ms - grace_ms) // DAY_MS - 1
+    day = archive.archived_until_day()
+    if day is None:
+        first_ms = repos.sensors.first_timestamp_ms()
+        if first_ms is None:
+            return 0
+        day = first_ms // DAY_MS
+    total = 0
+    while day <= last_closed:
+        if renew:
+            renew()
+        rows = archive.write_day(day, repos.sensors.iter_readings(day * DAY_MS, (day + 1) * DAY_MS))
+        if rows:
+            logger.info("Archived %d sensor readings for %s", rows, _day_name(day))
+        total += rows
+        day += 1
+        socketio.sleep(0)
+    return total
+
+
+def get_archive(app=None):
+    app = app or current_app._get_current_object()
+    archive = app.extensions.get('sensor_archive')
+    if archive is None:
+        archive = app.extensions['sensor_archive'] = SensorArchive(app.config['ARCHIVE_DIR'])
+    return archive
+
+
+def _archive_job(app, renew):
+    # Legacy rows have no timestamp_ms until the backfill reaches them; a day archived
+    # before that would miss them for good, since archived days are never rewritten
+    if needs_epoch_backfill():
+        logger.info("Sensor archive waits for the timestamp_ms backfill to finish")
+        return 0
+    return archive_closed_days(get_archive(app), get_repos(), now_timestamp()[0],
+                               app.config['ARCHIVE_GRACE_HOURS'] * HOUR_MS, renew)
+
+
+def _archive_loop(app):
+    while True:
+        try:
+            run_exclusive(app, 'sensor_archive', lambda renew: _archive_job(app, renew))
+        except Exception:
+            logger.error("Sensor archive job failed", exc_info=True)
+        socketio.sleep(app.config['ARCHIVE_INTERVAL_SECONDS'])
+
+
+def start_archiver(app):
+    socketio.start_background_task(_archive_loop, app)
+
+
+@archive_bp.route('/api/sensor_archive', methods=['GET'])
+@login_required
+@cached_response(ttl=60)
+def sensor_archive():
+    """Bucketed mean/min/max per column over [start, end) epoch ms; defaults to the last 30 days by hour."""
+    now_ms, _ = now_timestamp()
+    try:
+        end_ms = int(request.args.get('end', now_ms))
+        start_ms = int(request.args.get('start', end_ms - 30 * DAY_MS))
+        bucket_ms = int(request.args.get('bucket', HOUR_MS))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'start, end and bucket must be integers (ms)'}), 400
+    if bucket_ms <= 0 or end_ms <= start_ms:
+        return jsonify({'status': 'error', 'message': 'Need bucket > 0 and end > start'}), 400
+    if (end_ms - 1) // bucket_ms - start_ms // bucket_ms + 1 > current_app.config['ARCHIVE_MAX_BUCKETS']:
+        return jsonify({'status': 'error', 'message': 'Too many buckets; use a larger bucket'}), 400
+
+    buckets = aggregate_range(get_archive(), get_repos(), start_ms, end_ms, bucket_ms)
+    return jsonify({'start_ms': start_ms, 'end_ms': end_ms, 'bucket_ms': bucket_ms,
+                    'buckets': buckets.to_list()})
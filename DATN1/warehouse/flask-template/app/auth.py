@@ -1,7 +1,6 @@
 from flask import Blueprint, request, render_template, redirect, url_for, flash, session
-from instance.database import get_db_connection
+from .repositories import get_repos, DuplicateError, StorageError
 from .utils import login_required
-import sqlite3
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -11,12 +10,7 @@ def login():
         user_id = request.form.get('id')
         user_pw = request.form.get('pw')
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT admin_id, password FROM admin WHERE admin_id = ? AND password = ?", (user_id, user_pw))
-        admin = cur.fetchone()
-
-        if admin:
+        if get_repos().admins.authenticate(user_id, user_pw):
             flash("Welcome, Admin.")
             session.permanent = True
             session['flag'] = True
@@ -39,14 +33,10 @@ def register():
             return redirect(url_for('auth.register'))
 
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("INSERT INTO admin (admin_id, password, tel, job_num) VALUES (?, ?, ?, ?)",
-                        (user_id, user_pw, user_tel, user_job_num))
-            conn.commit()
+            get_repos().admins.create(user_id, user_pw, user_tel, user_job_num)
             flash("Registration successful! Please log in.")
             return redirect(url_for('auth.login'))
-        except sqlite3.IntegrityError:
+        except DuplicateError:
             flash("Registration failed. User ID may already exist.")
             return redirect(url_for('auth.register'))
     return render_template('register.html')
@@ -59,10 +49,8 @@ def profile():
         flash("User not logged in.")
         return redirect(url_for('auth.login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT admin_id, tel, job_num FROM admin WHERE admin_id = ?", (user_id,))
-    user = cur.fetchone()
+    admins = get_repos().admins
+    user = admins.get(user_id)
 
     if not user:
         flash("User not found.")
@@ -78,21 +66,10 @@ def profile():
             return redirect(url_for('auth.profile'))
 
         try:
-            update_query = "UPDATE admin SET tel = ?, job_num = ?"
-            params = [new_tel, new_job_num]
-
-            if new_password:
-                update_query += ", password = ?"
-                params.append(new_password)
-
-            update_query += " WHERE admin_id = ?"
-            params.append(user_id)
-
-            cur.execute(update_query, params)
-            conn.commit()
+            admins.update_profile(user_id, new_tel, new_job_num, password=new_password)
             flash("Profile updated successfully!")
             return redirect(url_for('auth.profile'))
-        except sqlite3.Error as e:
+        except StorageError as e:
             flash(f"Failed to update profile: {str(e)}")
             return redirect(url_for('auth.profile'))
 
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+# Invalidation tags, bumped by the routes that write the matching tables
+SENSOR = 'sensor'
+SCAN = 'scan'
+INVENTORY = 'inventory'
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL or when a tag is bumped.
+
+    Each entry remembers the version of every tag it depends on, so
+    ``invalidate(tag)`` is O(1): it bumps the tag version and stale entries
+    are dropped the next time they are looked up (or evicted by LRU).
+    Versions are read before the value is computed, so a write that lands
+    while it is being computed leaves the entry stale rather than cached.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _count(self, name, stat):
+        counters = self.stats.get(name)
+        if counters is None:
+            counters = self.stats[name] = {'hits': 0, 'misses': 0, 'evictions': 0}
+        counters[stat] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, versions, value = entry
+                if expires_at > time.monotonic() and all(
+                        self._tag_versions.get(tag, 0) == version for tag, version in versions):
+                    self._entries.move_to_end(key)
+                    self._count(key[0], 'hits')
+                    return value
+                del self._entries[key]
+            self._count(key[0], 'misses')
+            return None
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return tuple((tag, self._tag_versions.get(tag, 0)) for tag in tags)
+
+    def set(self, key, value, ttl, versions=()):
+        """Store ``value``; ``versions`` comes from ``tag_versions`` taken before it was computed."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._count(evicted[0], 'evictions')
+
+    def get_or_set(self, key, compute, ttl, tags=()):
+        value = self.get(key)
+        if value is None:
+            versions = self.tag_versions(tags)
+            value = compute()
+            self.set(key, value, ttl, versions)
+        return value
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot_stats(self):
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self.stats.items()}
+            for counters in stats.values():
+                lookups = counters['hits'] + counters['misses']
+                counters['hit_ratio'] = round(counters['hits'] / lookups, 3) if lookups else 0.0
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'routes': stats}
+
+
+def get_cache(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        cache = app.extensions['response_cache'] = TTLCache(app.config['CACHE_MAX_ENTRIES'])
+    return cache
+
+
+def _ttl_for(name, default):
+    return current_app.config['CACHE_TTLS'].get(name, default)
+
+
+def cached_result(name, compute, ttl, tags=()):
+    """Memoize ``compute()`` under ``name`` for views that post-process the result."""
+    if not current_app.config['CACHE_ENABLED']:
+        return compute()
+    return get_cache().get_or_set((name,), compute, _ttl_for(name, ttl), tags)
+
+
+def cached_response(ttl, tags=()):
+    """Cache a GET view's successful response body, keyed by endpoint and query string.
+
+    Place it below ``login_required`` so only authenticated requests reach the cache.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrap(*args, **kwargs):
+            if not current_app.config['CACHE_ENABLED'] or request.method != 'GET':
+                return f(*args, **kwargs)
+            cache = get_cache()
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            hit = cache.get(key)
+            if hit is not None:
+                body, status, mimetype = hit
+                return current_app.response_class(body, status=status, mimetype=mimetype)
+            versions = cache.tag_versions(tags)
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                cache.set(key, (response.get_data(), response.status_code, response.mimetype),
+                          _ttl_for(request.endpoint, ttl), versions)
+            return response
+        return wrap
+    return decorator
+
+
+def invalidate(*tags):
+    get_cache().invalidate(*tags)
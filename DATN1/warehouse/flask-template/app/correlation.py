@@ -0,0 +1,209 @@
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from flask import current_app
+from app import socketio
+from .events import broadcast
+from .repositories import get_repos
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple('Match', ['weight', 'reading_ms', 'method'])
+
+
+class _Window:
+    """Time-sorted weight readings of one scale, trimmed to the last ``window_ms``."""
+
+    def __init__(self):
+        self.times = []
+        self.weights = []
+        self._start = 0
+
+    def add(self, ts_ms, weight, window_ms):
+        if not self.times or ts_ms >= self.times[-1]:
+            self.times.append(ts_ms)
+            self.weights.append(weight)
+        else:
+            # Late reading: keep both lists sorted
+            i = bisect_right(self.times, ts_ms, self._start)
+            self.times.insert(i, ts_ms)
+            self.weights.insert(i, weight)
+        self._start = bisect_left(self.times, self.times[-1] - window_ms, self._start)
+        # Compact once the expired prefix is at least half the list, so trimming stays amortized O(1)
+        if self._start > len(self.times) // 2:
+            del self.times[:self._start]
+            del self.weights[:self._start]
+            self._start = 0
+
+    def between(self, lo_ms, hi_ms):
+        return (bisect_left(self.times, lo_ms, self._start),
+                bisect_right(self.times, hi_ms, self._start))
+
+
+class ScanWeightCorrelator:
+    """Matches each QR scan to a weight reading of its scale by timestamp.
+
+    Readings from ``sensor_data_api`` are kept in a per-scale window, so a
+    match costs two binary searches and no database query. A scan takes the
+    stable run of ``stable_count`` readings (spread <= ``stable_delta``)
+    closest to it within ``tolerance_ms``. Without one, it takes the nearest
+    reading in that tolerance. The scale can report after the camera, so a
+    scan stays pending for ``tolerance_ms`` and ``add_reading`` returns the
+    pending scans whose match changed.
+    """
+
+    def __init__(self, window_ms=300000, tolerance_ms=3000, stable_count=3, stable_delta=0.05,
+                 camera_scales=None):
+        self.window_ms = window_ms
+        self.tolerance_ms = tolerance_ms
+        self.stable_count = stable_count
+        self.stable_delta = stable_delta
+        self.camera_scales = camera_scales or {}
+        self._windows = {}
+        self._last_scale = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def scale_for(self, camera):
+        """The scale a camera weighs on: from CAMERA_SCALES, else the most recently active scale."""
+        return self.camera_scales.get(camera) or self._last_scale
+
+    def add_reading(self, scale, ts_ms, weight):
+        """Record a reading; returns ``[(pair_id, qr_code, scan_ms, match)]`` for re-matched pending scans."""
+        updates = []
+        with self._lock:
+            window = self._windows.get(scale)
+            if window is None:
+                window = self._windows[scale] = _Window()
+            window.add(ts_ms, weight, self.window_ms)
+            self._last_scale = scale
+            for pair_id, (pending_scale, qr_code, scan_ms, match) in list(self._pending.items()):
+                if ts_ms - scan_ms > self.tolerance_ms:
+                    del self._pending[pair_id]
+                elif pending_scale == scale:
+                    new_match = self._match(window, scan_ms)
+                    if new_match != match:
+                        if new_match.method == 'stable':
+                            del self._pending[pair_id]
+                        else:
+                            self._pending[pair_id] = (scale, qr_code, scan_ms, new_match)
+                        updates.append((pair_id, qr_code, scan_ms, new_match))
+        return updates
+
+    def match(self, scale, scan_ms):
+        with self._lock:
+            window = self._windows.get(scale)
+            return self._match(window, scan_ms) if window else None
+
+    def match_stored(self, rows, scale, scan_ms):
+        """Match against stored ``(device_id, timestamp_ms, weight)`` rows, oldest first; returns ``(scale, match)``.
+
+        Without a known ``scale``, the scale of the reading nearest the scan is used.
+        """
+        by_scale = {}
+        for device_id, ts_ms, weight in rows:
+            window = by_scale.get(device_id or 'default')
+            if window is None:
+                window = by_scale[device_id or 'default'] = _Window()
+            window.times.append(ts_ms)
+            window.weights.append(weight)
+        if scale is None:
+            if not by_scale:
+                return None, None
+            scale = min(by_scale, key=lambda s: min(abs(t - scan_ms) for t in by_scale[s].times))
+        window = by_scale.get(scale)
+        return scale, self._match(window, scan_ms) if window else None
+
+    def watch(self, pair_id, scale, qr_code, scan_ms, match):
+        """Keep re-matching a stored scan while readings inside its tolerance may still arrive."""
+        if scale is None or (match is not None and match.method == 'stable'):
+            return
+        with self._lock:
+            for old_id, pending in list(self._pending.items()):
+                if scan_ms - pending[2] > self.tolerance_ms:
+                    del self._pending[old_id]
+            self._pending[pair_id] = (scale, qr_code, scan_ms, match)
+
+    def _match(self, window, scan_ms):
+        lo, hi = window.between(scan_ms - self.tolerance_ms, scan_ms + self.tolerance_ms)
+        if lo == hi:
+            return None
+        times, weights = window.times, window.weights
+        best = None
+        for i in range(lo, hi - self.stable_count + 1):
+            run = weights[i:i + self.stable_count]
+            if max(run) - min(run) <= self.stable_delta:
+                distance = min(abs(t - scan_ms) for t in times[i:i + self.stable_count])
+                if best is None or distance < best[0]:
+                    best = (distance, i)
+        if best is not None:
+            i = best[1]
+            run = weights[i:i + self.stable_count]
+            return Match(round(sum(run) / len(run), 3), times[i + self.stable_count - 1], 'stable')
+        nearest = min(range(lo, hi), key=lambda j: abs(times[j] - scan_ms))
+        return Match(weights[nearest], times[nearest], 'nearest')
+
+
+def get_correlator(app=None):
+    app = app or current_app._get_current_object()
+    correlator = app.extensions.get('scan_correlator')
+    if correlator is None:
+        config = app.config
+        correlator = app.extensions['scan_correlator'] = ScanWeightCorrelator(
+            config['CORRELATION_WINDOW_SECONDS'] * 1000, config['CORRELATION_TOLERANCE_MS'],
+            config['CORRELATION_STABLE_READINGS'], config['CORRELATION_STABLE_DELTA'],
+            config['CAMERA_SCALES'])
+    return correlator
+
+
+def match_scan(repos, camera, scan_ms):
+    """Scale and match for a scan: from this worker's windows, else from readings any worker stored.
+
+    With several workers the scale usually reports to a different worker than
+    the camera, so a window miss falls back to an indexed range query.
+    """
+    correlator = get_correlator()
+    scale = correlator.scale_for(camera)
+    match = correlator.match(scale, scan_ms) if scale is not None else None
+    if match is None:
+        rows = repos.sensors.weight_readings(scan_ms - correlator.tolerance_ms, scan_ms + correlator.tolerance_ms)
+        scale, match = correlator.match_stored(rows, scale, scan_ms)
+    return scale, match
+
+
+def save_match(repos, pair_id, qr_code, scan_ms, scale, match):
+    """Store a better match for a recorded scan and tell the dashboards."""
+    repos.scans.update_weight(pair_id, scale, *match)
+    broadcast('scan_weight_updated', {
+        'qr_code': qr_code,
+        'scan_ms': scan_ms,
+        'weight': match.weight,
+        'weight_source': match.method,
+    }, 'qr-scans', scale)
+
+
+def recheck_later(app, pair_id, qr_code, scan_ms, scale):
+    """Re-match a scan from stored readings once its tolerance has passed.
+
+    Pending scans are only re-matched by readings that reach this worker;
+    this catches the ones stored through another worker.
+    """
+    socketio.start_background_task(_recheck, app, pair_id, qr_code, scan_ms, scale)
+
+
+def _recheck(app, pair_id, qr_code, scan_ms, scale):
+    correlator = get_correlator(app)
+    # Leave the last readings in the tolerance time to reach the database
+    socketio.sleep(correlator.tolerance_ms / 1000 + 1)
+    try:
+        with app.app_context():
+            repos = get_repos()
+            rows = repos.sensors.weight_readings(scan_ms - correlator.tolerance_ms,
+                                                 scan_ms + correlator.tolerance_ms)
+            scale, match = correlator.match_stored(rows, scale, scan_ms)
+            # A match this worker's window already gives was stored by add_reading
+            if match is not None and match != correlator.match(scale, scan_ms):
+                save_match(repos, pair_id, qr_code, scan_ms, scale, match)
+    except Exception:
+        logger.error("Failed to re-match scan %s", qr_code, exc_info=True)
@@ -0,0 +1,53 @@
+import logging
+from flask import Blueprint, jsonify, session
+from flask_socketio import emit
+from .repositories import get_repos
+from .utils import login_required
+from .cache import cached_result, SENSOR, SCAN, INVENTORY
+from .metrics import SOCKETIO_EMITS
+from .events import on_connect
+from .sensor import sensor_to_dict, sensor_history
+from .inventory import latest_data, recent_inventory
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+logger = logging.getLogger(__name__)
+
+def build_dashboard_snapshot():
+    """Everything the dashboard shows on first paint, read in one pass.
+
+    Each key matches the body of the route the page used to poll for it:
+    ``sensor`` (/api/sensor_data, or None), ``history`` (/api/sensor_data_history),
+    ``inventory`` (/api/inventory) and ``latest`` (/api/latest_data).
+    """
+    repos = get_repos()
+    sensor = repos.sensors.latest()
+    return {
+        'sensor': sensor_to_dict(sensor) if sensor else None,
+        'history': sensor_history(repos),
+        'inventory': recent_inventory(repos),
+        'latest': latest_data(repos, sensor),
+    }
+
+def cached_dashboard_snapshot():
+    return cached_result('dashboard_snapshot', build_dashboard_snapshot, ttl=5,
+                         tags=(SENSOR, SCAN, INVENTORY))
+
+@dashboard_bp.route('/api/dashboard', methods=['GET'])
+@login_required
+def get_dashboard():
+    try:
+        return jsonify(cached_dashboard_snapshot())
+    except Exception as e:
+        logger.error("Error building dashboard snapshot: %s", e, exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@on_connect
+def send_dashboard_snapshot(auth=None):
+    if not session.get('flag'):
+        return
+    try:
+        emit('dashboard_snapshot', cached_dashboard_snapshot())
+        SOCKETIO_EMITS.inc('dashboard_snapshot')
+    except Exception as e:
+        logger.error("Error sending dashboard snapshot: %s", e, exc_info=True)
@@ -0,0 +1,138 @@
+import logging
+import queue
+import sqlite3
+from flask import current_app, g, has_request_context, request
+from .profiling import trace_statement
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ConnectionPool:
+    """Small pool of long-lived SQLite connections for one database file.
+
+    Connections are never waited for: when the pool is empty a fresh connection
+    is opened and, if the pool is already full when it is released, closed again.
+    Checkout therefore never blocks the eventlet hub, with or without
+    monkey-patching, and each connection is used by one green thread at a time.
+    Writers are still serialized by SQLite itself, and in WAL mode readers do not
+    wait for them.
+    """
+
+    def __init__(self, path, size=4, readonly=False, pragmas=None, cached_statements=256, trace=None):
+        self.path = path
+        self.size = size
+        self.readonly = readonly
+        self.pragmas = pragmas or {}
+        self.cached_statements = cached_statements
+        self.trace = trace
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.readonly:
+            conn.execute('PRAGMA query_only = ON')
+        if self.trace:
+            conn.set_trace_callback(self.trace)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def sqlite_pragmas(config):
+    """PRAGMAs applied to every SQLite connection, by the raw pools and the SQLAlchemy engine."""
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': config['DB_BUSY_TIMEOUT_MS'],
+        'cache_size': -config['DB_CACHE_SIZE_KB'],
+        'mmap_size': config['DB_MMAP_SIZE'],
+        'temp_store': 'MEMORY',
+    }
+
+
+def get_pools(app=None):
+    """Return the (writer, reader) pools for the app, creating them on first use."""
+    app = app or current_app._get_current_object()
+    pools = app.extensions.get('sqlite_pools')
+    if pools is None:
+        config = app.config
+        pragmas = sqlite_pragmas(config)
+        trace = trace_statement if config['SLOW_QUERY_MS'] else None
+        writer = ConnectionPool(config['DATABASE'], size=config['DB_WRITE_POOL_SIZE'],
+                                pragmas=pragmas, cached_statements=config['DB_STATEMENT_CACHE'],
+                                trace=trace)
+        reader = ConnectionPool(config['DATABASE'], size=config['DB_READ_POOL_SIZE'],
+                                readonly=True, pragmas=pragmas,
+                                cached_statements=config['DB_STATEMENT_CACHE'], trace=trace)
+        pools = app.extensions['sqlite_pools'] = (writer, reader)
+    return pools
+
+
+def get_db_connection(readonly=None):
+    """Check out a pooled connection for the current app context.
+
+    GET/HEAD requests get a read-only connection unless ``readonly=False`` is
+    passed; everything else gets a writer. The connection is returned to its
+    pool by ``close_db`` on teardown.
+    """
+    if readonly is None:
+        readonly = has_request_context() and request.method in READ_METHODS
+    key = 'db_ro' if readonly else 'db'
+    if key not in g:
+        writer, reader = get_pools()
+        setattr(g, key, (reader if readonly else writer).acquire())
+    return getattr(g, key)
+
+
+def close_db(e=None):
+    writer, reader = current_app.extensions.get('sqlite_pools', (None, None))
+    for key, pool in (('db', writer), ('db_ro', reader)):
+        conn = g.pop(key, None)
+        if conn is not None:
+            pool.release(conn)
+
+
+def init_db():
+    conn = get_db_connection(readonly=False)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS admin
+            (admin_id TEXT PRIMARY KEY, password TEXT, tel TEXT, job_num TEXT);
+        CREATE TABLE IF NOT EXISTS inventory
+            (id INTEGER PRIMARY KEY, qr_code TEXT, name TEXT, weight REAL,
+             quantity INTEGER DEFAULT 1, timestamp TEXT,
+             UNIQUE(qr_code, name));
+        CREATE TABLE IF NOT EXISTS sensor_data
+            (id INTEGER PRIMARY KEY, temperature REAL, humidity REAL, weight REAL,
+             timestamp TEXT);
+        CREATE TABLE IF NOT EXISTS QRdate
+            (id INTEGER PRIMARY KEY, qr_code TEXT UNIQUE, name TEXT, timestamp TEXT);
+    ''')
+    conn.commit()
+    logger.info("Database initialized at %s (journal_mode=%s)", current_app.config['DATABASE'],
+                conn.execute('PRAGMA journal_mode').fetchone()[0])
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+NEW, DUPLICATE, UNKNOWN = 'new', 'duplicate', 'unknown'
+
+
+class _DeviceSeqs:
+    __slots__ = ('high', 'seen')
+
+    def __init__(self):
+        self.high = None
+        self.seen = set()
+
+
+class SeqDeduper:
+    """Drops retried sensor readings by ``(device_id, seq)`` before they reach the database.
+
+    Each device keeps a high-water mark and the set of sequence numbers seen
+    in the ``window`` below it, so a check is one dict and one set lookup.
+    A seq above the mark is new. A seq inside the window is a duplicate if
+    it is in the set, else a late arrival. A seq below the window, or from a
+    device this process has not seen since it started, is ``UNKNOWN`` and
+    left to the unique index on ``sensor_data (device_id, seq)``. Devices are
+    kept in last-use order and the least recently seen is dropped beyond
+    ``max_devices``, as in the rate limiter.
+
+    ``check`` does not record anything. Call ``record`` once the reading is
+    stored, so a failed write can be retried with the same seq.
+    """
+
+    def __init__(self, window=256, max_devices=10000):
+        self.window = window
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, device_id, seq):
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None or state.high is None:
+                return UNKNOWN
+            if seq > state.high:
+                return NEW
+            if seq <= state.high - self.window:
+                return UNKNOWN
+            return DUPLICATE if seq in state.seen else NEW
+
+    def record(self, device_id, seq):
+        with self._lock:
+            state = self._devices.pop(device_id, None) or _DeviceSeqs()
+            self._devices[device_id] = state
+            if state.high is None or seq > state.high:
+                state.high = seq
+                floor = seq - self.window
+                if len(state.seen) > 2 * self.window:
+                    state.seen = {s for s in state.seen if s > floor}
+            if seq > state.high - self.window:
+                state.seen.add(seq)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+    def device_count(self):
+        return len(self._devices)
+
+
+def get_deduper(app=None):
+    app = app or current_app._get_current_object()
+    deduper = app.extensions.get('sensor_dedupe')
+    if deduper is None:
+        config = app.config
+        deduper = app.extensions['sensor_dedupe'] = SeqDeduper(
+            config['SENSOR_DEDUPE_WINDOW'], config['SENSOR_DEDUPE_MAX_DEVICES'])
+    return deduper
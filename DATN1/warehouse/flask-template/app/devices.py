@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import secrets
+from functools import wraps
+from flask import Blueprint, current_app, g, jsonify, request
+from app import socketio
+from .repositories import get_repos
+from .utils import login_required, now_timestamp
+
+devices_bp = Blueprint('devices', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(key):
+    # Keys are 256-bit random tokens, so a fast unsalted digest is sufficient
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class DeviceKeyRegistry:
+    """In-memory map of key hash -> device_id, so verifying a key never hits the database.
+
+    A background task reloads the table every ``refresh_seconds`` (0 = never)
+    so keys issued or revoked through another worker take effect here too;
+    requests never wait on a reload.
+    """
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._by_hash = {}
+
+    def reload(self):
+        # Build a new dict and swap it in so concurrent verify() calls never see a partial table
+        by_hash = {row['key_hash']: row['device_id'] for row in get_repos().devices.all()}
+        self._by_hash = by_hash
+        logger.debug("Loaded %d device keys", len(by_hash))
+        return len(by_hash)
+
+    def verify(self, key):
+        if not key:
+            return None
+        return self._by_hash.get(hash_key(key))
+
+    def device_ids(self):
+        return sorted(self._by_hash.values())
+
+
+def _refresh_loop(app, registry):
+    # Ends once the app drops this registry
+    while app.extensions.get('device_keys') is registry:
+        socketio.sleep(registry.refresh_seconds)
+        try:
+            with app.app_context():
+                registry.reload()
+        except Exception:
+            logger.error("Reloading device keys failed", exc_info=True)
+
+
+def get_registry(app=None):
+    app = app or current_app._get_current_object()
+    registry = app.extensions.get('device_keys')
+    if registry is None:
+        registry = app.extensions['device_keys'] = DeviceKeyRegistry(app.config['DEVICE_KEY_REFRESH_SECONDS'])
+        with app.app_context():
+            logger.info("Loaded %d device keys", registry.reload())
+        if registry.refresh_seconds > 0:
+            socketio.start_background_task(_refresh_loop, app, registry)
+    return registry
+
+
+def device_key_required(f):
+    """Decorator for ingest routes: check the device key header before the body is touched."""
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        if current_app.config['DEVICE_AUTH_REQUIRED']:
+            device_id = get_registry().verify(request.headers.get(current_app.config['DEVICE_KEY_HEADER']))
+            if device_id is None:
+                logger.warning("Rejected %s from %s: missing or invalid device key",
+                               request.path, request.remote_addr)
+                return jsonify({'status': 'error', 'message': 'Missing or invalid device key'}), 401
+            g.device_id = device_id
+        return f(*args, **kwargs)
+    return wrap
+
+
+@devices_bp.route('/api/devices', methods=['GET'])
+@login_required
+def list_devices():
+    return jsonify(get_registry().device_ids())
+
+
+@devices_bp.route('/api/devices', methods=['POST'])
+@login_required
+def create_device_key():
+    """Create a device or rotate its key; the plaintext key is only returned here."""
+    data = request.get_json(silent=True) or {}
+    device_id = data.get('device_id')
+    if not device_id or not isinstance(device_id, str):
+        return jsonify({'status': 'error', 'message': 'device_id is required'}), 400
+
+    key = secrets.token_urlsafe(32)
+    created_ms, _ = now_timestamp()
+    get_repos().devices.set_key(device_id, hash_key(key), created_ms)
+    get_registry().reload()
+    logger.info("Issued key for device %s", device_id)
+    return jsonify({'status': 'success', 'device_id': device_id, 'key': key,
+                    'header': current_app.config['DEVICE_KEY_HEADER']})
+
+
+@devices_bp.route('/api/devices/<device_id>', methods=['DELETE'])
+@login_required
+def revoke_device_key(device_id):
+    if not get_repos().devices.delete(device_id):
+        return jsonify({'status': 'error', 'message': 'No such device'}), 404
+    get_registry().reload()
+    logger.info("Revoked key for device %s", device_id)
+    return jsonify({'status': 'success', 'message': f'Revoked key for {device_id}'})
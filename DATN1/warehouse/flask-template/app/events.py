@@ -0,0 +1,71 @@
+"""Topic-scoped Socket.IO delivery.
+
+Every event belongs to a topic (``sensors``, ``qr-scans`` or ``inventory``)
+and each topic is a room. ``<topic>/<source>`` rooms carry only the events
+of one device or camera, and ``<topic>/<zone>`` those of every source that
+``Config.DEVICE_ZONES`` maps to the zone, e.g. ``sensors/zone-A``.
+
+Clients pick their rooms when they connect, through the Socket.IO auth
+payload (``io(url, {auth: {topics: ['sensors/zone-A', 'qr-scans']}})``) or a
+comma-separated ``topics`` query parameter; ``init_events`` installs the
+``connect`` handler that joins them whatever blueprints are served, and
+modules add their own connect work with ``on_connect``. A client that names no topics
+joins every topic, as every client received every event before. An event
+is encoded once and sent only to members of its rooms, each of them once,
+so its cost grows with interested subscribers rather than connections.
+"""
+from flask import current_app, request
+from flask_socketio import join_room
+from app import socketio
+from .metrics import SOCKETIO_EMITS
+
+TOPICS = ('sensors', 'qr-scans', 'inventory')
+
+_connect_hooks = []
+
+
+def topic_rooms(topic, source=None):
+    rooms = [topic]
+    if source:
+        rooms.append(f'{topic}/{source}')
+        zone = current_app.config['DEVICE_ZONES'].get(source)
+        if zone:
+            rooms.append(f'{topic}/{zone}')
+    return rooms
+
+
+def broadcast(event, data, topic, source=None):
+    """Emit an event to clients subscribed to ``topic`` or to ``source`` (device, camera) or its zone."""
+    socketio.emit(event, data, namespace='/', to=topic_rooms(topic, source))
+    SOCKETIO_EMITS.inc(event)
+
+
+def on_connect(f):
+    """Run ``f(auth)`` for each connecting client, after it joined its rooms."""
+    _connect_hooks.append(f)
+    return f
+
+
+def _handle_connect(auth=None):
+    subscribe(auth)
+    for hook in _connect_hooks:
+        hook(auth)
+
+
+def init_events(app):
+    socketio.on_event('connect', _handle_connect, namespace='/')
+
+
+def subscribe(auth=None):
+    """Join the connecting client to the rooms it asked for; returns them. Unknown topics are ignored."""
+    requested = auth.get('topics') if isinstance(auth, dict) else None
+    if requested is None and request.args.get('topics'):
+        requested = request.args['topics'].split(',')
+    if not isinstance(requested, list):
+        requested = list(TOPICS)
+    rooms = []
+    for room in requested[:current_app.config['SOCKETIO_MAX_TOPICS']]:
+        if isinstance(room, str) and room.split('/', 1)[0] in TOPICS and room not in rooms:
+            join_room(room)
+            rooms.append(room)
+    return rooms
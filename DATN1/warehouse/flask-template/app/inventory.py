@@ -1,25 +1,23 @@
 import logging
 from flask import Blueprint, jsonify, request
-from instance.database import get_db_connection
-from .utils import login_required
-from datetime import datetime
+from .repositories import get_repos
+from .utils import login_required, now_timestamp
+from .cache import cached_response, invalidate, SENSOR, SCAN, INVENTORY
+from .events import broadcast
 
 inventory_bp = Blueprint('inventory', __name__)
 
 logger = logging.getLogger(__name__)
 
-@inventory_bp.route('/api/latest_data', methods=['GET'])
-@login_required
-def get_latest_data():
-    logger.debug("Fetching latest QR code and sensor data for display/refresh")
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    c.execute('SELECT qr_code, name, timestamp FROM QRdate ORDER BY timestamp DESC LIMIT 1')
-    qr_data_latest = c.fetchone()
+def latest_data(repos, sensor_data_latest=None):
+    """Latest scanned QR code and sensor reading, with 'N/A' placeholders.
 
-    c.execute('SELECT temperature, humidity, weight, timestamp FROM sensor_data ORDER BY timestamp DESC LIMIT 1')
-    sensor_data_latest = c.fetchone()
+    Callers that already hold the latest sensor row can pass it in to skip
+    the second lookup.
+    """
+    qr_data_latest = repos.scans.latest()
+    if sensor_data_latest is None:
+        sensor_data_latest = repos.sensors.latest()
 
     response = {
         'qr_code': 'N/A',
@@ -35,7 +33,7 @@ def get_latest_data():
         response['qr_code'] = qr_data_latest['qr_code']
         response['name'] = qr_data_latest['name']
         response['qr_timestamp'] = qr_data_latest['timestamp']
-        logger.debug(f"Latest QR code found: {qr_data_latest['qr_code']}")
+        logger.debug("Latest QR code found: %s", qr_data_latest['qr_code'])
     else:
         logger.debug("No QR data found in QRdate table.")
 
@@ -44,11 +42,26 @@ def get_latest_data():
         response['humidity'] = sensor_data_latest['humidity']
         response['sensor_weight'] = sensor_data_latest['weight'] if sensor_data_latest['weight'] is not None else 0.0
         response['sensor_timestamp'] = sensor_data_latest['timestamp']
-        logger.debug(f"Latest sensor data found: Temperature={sensor_data_latest['temperature']}, Humidity={sensor_data_latest['humidity']}, Weight={response['sensor_weight']}")
+        logger.debug("Latest sensor data found: Temperature=%s, Humidity=%s, Weight=%s",
+                     sensor_data_latest['temperature'], sensor_data_latest['humidity'], response['sensor_weight'])
     else:
         logger.debug("No sensor data found in sensor_data table.")
-    
-    return jsonify(response)
+
+    return response
+
+def recent_inventory(repos, limit=10):
+    return [
+        {'id': row['id'], 'qr_code': row['qr_code'], 'name': row['name'],
+         'weight': row['weight'], 'quantity': row['quantity'], 'timestamp': row['timestamp']}
+        for row in repos.inventory.recent(limit=limit)
+    ]
+
+@inventory_bp.route('/api/latest_data', methods=['GET'])
+@login_required
+@cached_response(ttl=5, tags=(SENSOR, SCAN))
+def get_latest_data():
+    logger.debug("Fetching latest QR code and sensor data for display/refresh")
+    return jsonify(latest_data(get_repos()))
 
 @inventory_bp.route('/api/import_item', methods=['POST'])
 @login_required
@@ -68,51 +81,38 @@ def import_item():
         if weight is not None and (not isinstance(weight, (int, float)) or weight < 0):
             return jsonify({'status': 'error', 'message': 'Weight must be a non-negative number or null'}), 400
 
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        current_ms, current_time = now_timestamp()
 
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT id, name, weight, quantity FROM inventory WHERE qr_code = ? LIMIT 1', (qr_code,))
-        existing_item = c.fetchone()
+        item_weight_to_insert = weight if weight is not None else 0.0
+        created, name, item_weight, quantity = get_repos().inventory.add(
+            qr_code, name, item_weight_to_insert, current_ms, current_time)
+        invalidate(INVENTORY)
+        broadcast('inventory_updated', {'action': 'import', 'qr_code': qr_code, 'name': name,
+                                        'quantity': quantity}, 'inventory')
 
-        if existing_item:
-            item_id = existing_item['id']
-            new_quantity = existing_item['quantity'] + 1
-            updated_name = name
-            existing_weight = existing_item['weight']
-
-            c.execute('''UPDATE inventory SET quantity = ?, name = ?, timestamp = ?
-                         WHERE id = ?''',
-                      (new_quantity, updated_name, current_time, item_id))
-            conn.commit()
-            logger.info(f"Item quantity updated: qr_code={qr_code}, new_name={updated_name}, new_quantity={new_quantity}")
+        if not created:
+            logger.info("Item quantity updated: qr_code=%s, new_name=%s, new_quantity=%s", qr_code, name, quantity)
             return jsonify({
                 'status': 'success',
-                'message': f'Updated quantity for item with QR Code: {qr_code}. New quantity: {new_quantity}. Name updated to: {updated_name}',
+                'message': f'Updated quantity for item with QR Code: {qr_code}. New quantity: {quantity}. Name updated to: {name}',
                 'qr_code': qr_code,
-                'name': updated_name,
-                'weight': existing_weight,
-                'quantity': new_quantity
+                'name': name,
+                'weight': item_weight,
+                'quantity': quantity
             })
         else:
-            item_weight_to_insert = weight if weight is not None else 0.0
-
-            c.execute('''INSERT INTO inventory (qr_code, name, weight, quantity, timestamp)
-                         VALUES (?, ?, ?, 1, ?)''',
-                      (qr_code, name, item_weight_to_insert, current_time))
-            conn.commit()
-            logger.info(f"Item imported (new): qr_code={qr_code}, name={name}, weight={item_weight_to_insert}")
+            logger.info("Item imported (new): qr_code=%s, name=%s, weight=%s", qr_code, name, item_weight)
             return jsonify({
                 'status': 'success',
                 'message': f'Imported new item: {name} ({qr_code})',
                 'qr_code': qr_code,
                 'name': name,
-                'weight': item_weight_to_insert,
+                'weight': item_weight,
                 'quantity': 1
             })
     
     except Exception as e:
-        logger.error(f"Error importing item: {str(e)}", exc_info=True)
+        logger.error("Error importing item: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @inventory_bp.route('/api/export_item', methods=['POST'])
@@ -129,40 +129,24 @@ def export_item():
         if not qr_code or not name:
             return jsonify({'status': 'error', 'message': 'QR code and name are required'}), 400
 
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT quantity FROM inventory WHERE qr_code = ? AND name = ?', (qr_code, name))
-        row = c.fetchone()
-        if not row:
+        if not get_repos().inventory.remove_one(qr_code, name):
             return jsonify({'status': 'error', 'message': 'No such product in inventory'}), 404
+        invalidate(INVENTORY)
+        broadcast('inventory_updated', {'action': 'export', 'qr_code': qr_code, 'name': name}, 'inventory')
 
-        quantity = row['quantity']
-        if quantity > 1:
-            c.execute('UPDATE inventory SET quantity = quantity - 1 WHERE qr_code = ? AND name = ?', (qr_code, name))
-        else:
-            c.execute('DELETE FROM inventory WHERE qr_code = ? AND name = ?', (qr_code, name))
-        conn.commit()
         return jsonify({'status': 'success', 'message': 'Item exported successfully'})
     except Exception as e:
-        logger.error(f"Error exporting item: {str(e)}", exc_info=True)
+        logger.error("Error exporting item: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @inventory_bp.route('/api/inventory', methods=['GET'])
 @login_required
+@cached_response(ttl=30, tags=(INVENTORY,))
 def get_inventory():
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT * FROM inventory ORDER BY timestamp DESC LIMIT 10')
-        rows = c.fetchall()
-
-        inventory = [
-            {'id': row['id'], 'qr_code': row['qr_code'], 'name': row['name'],
-             'weight': row['weight'], 'quantity': row['quantity'], 'timestamp': row['timestamp']}
-            for row in rows
-        ]
-        logger.debug(f"Retrieved {len(inventory)} inventory items.")
+        inventory = recent_inventory(get_repos())
+        logger.debug("Retrieved %s inventory items.", len(inventory))
         return jsonify(inventory)
     except Exception as e:
-        logger.error(f"Error retrieving inventory: {str(e)}", exc_info=True)
+        logger.error("Error retrieving inventory: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
\ No newline at end of file
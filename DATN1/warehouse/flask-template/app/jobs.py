@@ -0,0 +1,63 @@
+"""Background jobs that must run on only one worker at a time.
+
+A job runs only on the worker that holds its row in ``job_leases``. The
+row is kept by the ``leases`` repository in the configured storage backend,
+so workers on different hosts sharing a server database see the same
+lease. The lease is taken in one transaction and renewed while the job
+makes progress. If the worker dies, the lease expires on its own. Workers
+that find the lease taken skip the job. A job must be resumable, because the
+next worker start finishes whatever a dead holder left. A holder that
+finds its lease taken over (it stalled past the TTL) stops at its next
+renewal instead of racing the new holder.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from .repositories import get_repos
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class LeaseLost(Exception):
+    """Raised by ``renew()`` once another worker has taken over the lease."""
+
+
+def acquire_lease(name, ttl_seconds, owner=WORKER_ID):
+    """Take or renew the lease ``name``; returns True if ``owner`` now holds it."""
+    now_ms = time.time_ns() // 1_000_000
+    return get_repos().leases.acquire(name, owner, now_ms + int(ttl_seconds * 1000), now_ms)
+
+
+def release_lease(name, owner=WORKER_ID):
+    get_repos().leases.release(name, owner)
+
+
+def run_exclusive(app, name, job):
+    """Run ``job(renew)`` in an app context if this worker can take the lease ``name``.
+
+    ``renew()`` extends the lease by ``Config.JOB_LEASE_SECONDS`` and should be
+    called at least that often, and before each unit of work; it raises
+    ``LeaseLost`` if the lease was lost, which ends the job here.
+    """
+    ttl = app.config['JOB_LEASE_SECONDS']
+
+    def renew():
+        if not acquire_lease(name, ttl):
+            raise LeaseLost(name)
+
+    with app.app_context():
+        if not acquire_lease(name, ttl):
+            logger.info("Skipping job %s: another worker holds the lease", name)
+            return None
+        logger.info("Running job %s on worker %s", name, WORKER_ID)
+        try:
+            return job(renew)
+        except LeaseLost:
+            logger.warning("Stopping job %s: its lease was taken over by another worker", name)
+            return None
+        finally:
+            release_lease(name)
@@ -0,0 +1,219 @@
+"""Line-protocol sensor listener for nodes that cannot afford an HTTP request per reading.
+
+Enabled by ``Config.SENSOR_LISTENER`` = ``udp://host:port`` or
+``tcp://host:port``. Each line is one reading, fields separated by
+whitespace, ``-`` for an absent optional field::
+
+    <device> <timestamp_ms> <temperature> <humidity> [<weight> [<seq>]]
+
+``<device>`` is the device key when ``DEVICE_AUTH_REQUIRED`` is on (it is
+resolved to the device_id through the key registry), else the device_id.
+``<timestamp_ms>`` is the reading time in epoch ms, or ``-`` for the receive
+time. A UDP datagram or TCP stream may carry any number of lines.
+
+Lines go through ``parse_reading`` and ``store_readings`` like
+``/api/sensor``: the same validation, per-device rate limits, seq dedupe,
+storage and Socket.IO broadcast. Readings are buffered and stored
+``SENSOR_LISTENER_BATCH_SIZE`` at a time, or every
+``SENSOR_LISTENER_FLUSH_MS``, whichever comes first. Nothing is sent back,
+so a node that needs an acknowledgement should use HTTP.
+"""
+import logging
+import threading
+from urllib.parse import urlsplit
+from app import socketio
+from .devices import get_registry
+from .metrics import LISTENER_LINE_ERRORS, LISTENER_PACKETS
+from .ratelimit import get_limiter
+from .sensor import parse_reading, store_readings
+
+logger = logging.getLogger(__name__)
+
+# Readings share the token buckets of the HTTP route, so a node cannot exceed its limit by switching transport
+RATE_LIMIT_ENDPOINT = 'sensor.sensor_data_api'
+
+
+def _socket_module():
+    # A plain blocking socket would stall the whole eventlet/gevent hub when it is not monkey-patched
+    if socketio.async_mode == 'eventlet':
+        from eventlet.green import socket
+    elif socketio.async_mode == 'gevent':
+        from gevent import socket
+    else:
+        import socket
+    return socket
+
+
+def _optional(field, convert):
+    return None if field == '-' else convert(field)
+
+
+def parse_line(line):
+    """Split one line into ``(device, reading payload)``; raises ValueError if it is malformed."""
+    fields = line.split()
+    if not 4 <= len(fields) <= 6:
+        raise ValueError(f'expected 4 to 6 fields, got {len(fields)}')
+    fields += ['-'] * (6 - len(fields))
+    device, timestamp_ms, temperature, humidity, weight, seq = fields
+    return device, {
+        'timestamp_ms': _optional(timestamp_ms, int),
+        'temperature': float(temperature),
+        'humidity': float(humidity),
+        'weight': _optional(weight, float),
+        'seq': _optional(seq, int),
+    }
+
+
+class SensorLineListener:
+    def __init__(self, app, transport, host, port):
+        self.app = app
+        self.transport = transport
+        self.host = host
+        self.port = port
+        config = app.config
+        self.batch_size = config['SENSOR_LISTENER_BATCH_SIZE']
+        self.flush_seconds = config['SENSOR_LISTENER_FLUSH_MS'] / 1000
+        self.max_line = config['SENSOR_LISTENER_MAX_LINE']
+        self._pending = []
+        self._lock = threading.Lock()
+        self.sock = None
+
+    def bind(self):
+        socket = _socket_module()
+        kind = socket.SOCK_DGRAM if self.transport == 'udp' else socket.SOCK_STREAM
+        self.sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, kind)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            # Lets every worker bind the same port; the kernel spreads packets across them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind((self.host, self.port))
+        if self.transport == 'tcp':
+            self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+
+    def handle_packet(self, payload):
+        """Parse the lines of one datagram or TCP read and queue the valid readings."""
+        readings = []
+        errors = 0
+        allowed = {}
+        with self.app.app_context():
+            config = self.app.config
+            limit = config['RATE_LIMITS'].get(RATE_LIMIT_ENDPOINT)
+            for raw in payload.split(b'\n'):
+                line = raw.strip()
+                if not line or line.startswith(b'#'):
+                    continue
+                reason = None
+                try:
+                    device, data = parse_line(line.decode('ascii'))
+                except (UnicodeDecodeError, ValueError):
+                    reason = 'malformed'
+                else:
+                    if config['DEVICE_AUTH_REQUIRED']:
+                        device = get_registry().verify(device)
+                    if device is None:
+                        reason = 'unauthorized'
+                    elif not self._allowed(allowed, device, limit):
+                        reason = 'rate_limited'
+                    else:
+                        data['device_id'] = device
+                        reading, error = parse_reading(data)
+                        if error:
+                            reason = 'invalid'
+                            logger.debug("Rejected line from %s: %s", device, error)
+                        else:
+                            readings.append(reading)
+                if reason:
+                    LISTENER_LINE_ERRORS.inc(reason)
+                    errors += 1
+        LISTENER_PACKETS.inc(self.transport, 'error' if errors else 'ok')
+        if readings:
+            with self._lock:
+                self._pending.extend(readings)
+                full = len(self._pending) >= self.batch_size
+            if full:
+                self.flush()
+
+    @staticmethod
+    def _allowed(allowed, device, limit):
+        # One token per device per packet, as an HTTP batch costs one request
+        if device not in allowed:
+            allowed[device] = not limit or not get_limiter().check(RATE_LIMIT_ENDPOINT, device, *limit)
+        return allowed[device]
+
+    def flush(self):
+        # Take the batch under the lock but store it outside: broadcasting may yield to other green threads
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with self.app.app_context():
+                store_readings(batch)
+        except Exception:
+            LISTENER_LINE_ERRORS.inc('storage', amount=len(batch))
+            logger.error("Failed to store %d line-protocol readings", len(batch), exc_info=True)
+
+    def _flush_loop(self):
+        while True:
+            socketio.sleep(self.flush_seconds)
+            self.flush()
+
+    def _serve_udp(self):
+        while True:
+            try:
+                payload, _ = self.sock.recvfrom(65535)
+                self.handle_packet(payload)
+            except Exception:
+                logger.error("Sensor listener failed to handle a datagram", exc_info=True)
+
+    def _serve_tcp(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except OSError:
+                logger.error("Sensor listener accept failed", exc_info=True)
+                socketio.sleep(1)
+                continue
+            socketio.start_background_task(self._serve_connection, conn, address)
+
+    def _serve_connection(self, conn, address):
+        buffer = b''
+        try:
+            conn.settimeout(self.app.config['SENSOR_LISTENER_IDLE_SECONDS'])
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                complete, _, buffer = buffer.rpartition(b'\n')
+                if complete:
+                    self.handle_packet(complete)
+                if len(buffer) > self.max_line:
+                    LISTENER_LINE_ERRORS.inc('too_long')
+                    logger.warning("Closing sensor connection from %s: line longer than %d bytes",
+                                   address[0], self.max_line)
+                    break
+        except OSError:
+            pass
+        except Exception:
+            logger.error("Sensor listener failed on connection from %s", address[0], exc_info=True)
+        finally:
+            conn.close()
+
+    def start(self):
+        self.bind()
+        socketio.start_background_task(self._serve_udp if self.transport == 'udp' else self._serve_tcp)
+        socketio.start_background_task(self._flush_loop)
+        logger.info("Sensor line listener on %s://%s:%d", self.transport, self.host, self.port)
+
+
+def start_listener(app):
+    url = urlsplit(app.config['SENSOR_LISTENER'])
+    if url.scheme not in ('udp', 'tcp') or url.port is None:
+        raise ValueError(f"SENSOR_LISTENER must be udp://host:port or tcp://host:port, "
+                         f"not {app.config['SENSOR_LISTENER']!r}")
+    listener = app.extensions['sensor_listener'] = SensorLineListener(
+        app, url.scheme, url.hostname or '0.0.0.0', url.port)
+    listener.start()
+    return listener
@@ -0,0 +1,173 @@
+import logging
+import sqlite3
+from .database import get_db_connection
+from .repositories import server_engine
+
+logger = logging.getLogger(__name__)
+
+# (version, description, function) in ascending version order
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a forward migration; ``fn(conn)`` runs inside its transaction."""
+    def register(fn):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _has_index_on(conn, table, columns):
+    """True if an existing index on ``table`` starts with ``columns``."""
+    for index in conn.execute(f'PRAGMA index_list({table})').fetchall():
+        indexed = [row['name'] for row in conn.execute(f'PRAGMA index_info("{index["name"]}")')]
+        if indexed[:len(columns)] == list(columns):
+            return True
+    return False
+
+
+@migration(1, 'index sensor_data by timestamp')
+def _sensor_data_timestamp_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp ON sensor_data (timestamp)')
+
+
+@migration(2, 'index QRdate by timestamp')
+def _qrdate_timestamp_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_qrdate_timestamp ON QRdate (timestamp)')
+
+
+@migration(3, 'index inventory by qr_code, name and by timestamp')
+def _inventory_indexes(conn):
+    # Databases created with UNIQUE(qr_code, name) already have a covering autoindex
+    if not _has_index_on(conn, 'inventory', ('qr_code', 'name')):
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_inventory_qr_code_name ON inventory (qr_code, name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_inventory_timestamp ON inventory (timestamp)')
+
+
+EPOCH_TABLES = ('sensor_data', 'QRdate', 'inventory')
+
+
+@migration(4, 'add integer epoch-ms timestamp_ms columns')
+def _epoch_timestamp_columns(conn):
+    for table in EPOCH_TABLES:
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if 'timestamp_ms' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN timestamp_ms INTEGER')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table.lower()}_timestamp_ms ON {table} (timestamp_ms)')
+        # Hot queries order and filter on timestamp_ms now
+        conn.execute(f'DROP INDEX IF EXISTS idx_{table.lower()}_timestamp')
+
+
+@migration(5, 'add device_keys table')
+def _device_keys(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS device_keys
+                    (device_id TEXT PRIMARY KEY, key_hash TEXT NOT NULL UNIQUE, created_ms INTEGER)''')
+
+
+@migration(6, 'add job_leases table')
+def _job_leases(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS job_leases
+                    (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_ms INTEGER NOT NULL)''')
+
+
+@migration(7, 'add scan_weights table')
+def _scan_weights(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS scan_weights
+                    (id INTEGER PRIMARY KEY, qr_code TEXT NOT NULL, scan_ms INTEGER NOT NULL, scale TEXT,
+                     weight REAL, reading_ms INTEGER, method TEXT)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_weights_scan_ms ON scan_weights (scan_ms)')
+
+
+@migration(8, 'add device_id and seq to sensor_data with a unique index')
+def _sensor_data_seq(conn):
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(sensor_data)')]
+    if 'device_id' not in columns:
+        conn.execute('ALTER TABLE sensor_data ADD COLUMN device_id TEXT')
+    if 'seq' not in columns:
+        conn.execute('ALTER TABLE sensor_data ADD COLUMN seq INTEGER')
+    # Readings sent without a sequence number stay unconstrained
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_data_device_seq
+                    ON sensor_data (device_id, seq) WHERE seq IS NOT NULL''')
+
+
+def run_migrations():
+    """Apply every pending migration, each in its own write transaction.
+
+    The versioned migrations upgrade SQLite files, which may hold data from
+    any earlier schema. A server database (``STORAGE_BACKEND=sqlalchemy``
+    with a non-SQLite URL) never held an older schema: it gets the current
+    tables, as declared in ``repositories.sqlalchemy_core``, and 0 is returned.
+
+    The version is re-read after ``BEGIN IMMEDIATE`` so concurrent workers
+    starting against the same file apply each migration exactly once.
+    """
+    engine = server_engine()
+    if engine is not None:
+        from .repositories.sqlalchemy_core import metadata
+        metadata.create_all(engine)
+        return 0
+    conn = get_db_connection(readonly=False)
+    applied = 0
+    for version, description, fn in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            logger.error("Migration %d (%s) failed", version, description, exc_info=True)
+            raise
+        applied += 1
+        logger.info("Applied migration %d: %s", version, description)
+    if applied:
+        logger.info("Database schema at version %d", get_schema_version(conn))
+    return applied
+
+
+def needs_epoch_backfill():
+    # Only SQLite files can hold rows from before timestamp_ms existed
+    if server_engine() is not None:
+        return False
+    conn = get_db_connection(readonly=False)
+    return any(conn.execute(f'SELECT 1 FROM {table} WHERE timestamp_ms IS NULL LIMIT 1').fetchone()
+               for table in EPOCH_TABLES)
+
+
+def backfill_epoch_timestamps(batch_size=5000, pause=None):
+    """Fill ``timestamp_ms`` from the legacy text column in small batches.
+
+    Text timestamps were written in server local time, hence the ``'utc'``
+    modifier. Each batch commits on its own so writers are never held off for
+    long; ``pause`` (e.g. ``socketio.sleep``) is called between batches.
+    Unparseable timestamps are stored as 0 so they are not revisited.
+    """
+    conn = get_db_connection(readonly=False)
+    total = 0
+    for table in EPOCH_TABLES:
+        while True:
+            cur = conn.execute(f'''UPDATE {table}
+                                   SET timestamp_ms = COALESCE(
+                                       CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000, 0)
+                                   WHERE id IN (SELECT id FROM {table}
+                                                WHERE timestamp_ms IS NULL LIMIT ?)''',
+                               (batch_size,))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+            if pause:
+                pause(0)
+    logger.info("Backfilled timestamp_ms on %d rows", total)
+    return total
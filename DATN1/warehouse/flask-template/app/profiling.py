@@ -0,0 +1,127 @@
+"""On-demand request profiling and the slow-query log.
+
+A request is profiled with cProfile when a logged-in admin sends
+``Config.PROFILE_HEADER`` or when it is picked by 1-in-``PROFILE_SAMPLE_RATE``
+sampling. The top ``PROFILE_TOP_N`` functions by cumulative time are kept in
+a ring of the last ``PROFILE_RING_SIZE`` profiles, served at ``/api/profiles``.
+
+Only one request is profiled at a time: cProfile hooks the whole OS thread,
+so under eventlet a profile also includes other green threads that ran
+while the request was waiting.
+"""
+import cProfile
+import itertools
+import logging
+import pstats
+import threading
+import time
+from collections import deque
+from flask import Blueprint, current_app, g, has_request_context, jsonify, request, session
+from .utils import login_required, now_timestamp
+
+profiling_bp = Blueprint('profiling', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    def __init__(self, sample_rate=0, top_n=25, ring_size=20):
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.profiles = deque(maxlen=ring_size)
+        self._counter = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def sampled(self):
+        return self.sample_rate > 0 and next(self._counter) % self.sample_rate == 0
+
+    def start(self):
+        """Return an enabled profiler, or None if another request is being profiled."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def discard(self, profile):
+        profile.disable()
+        self._busy.release()
+
+    def finish(self, profile, started, **info):
+        profile.disable()
+        self._busy.release()
+        stats = pstats.Stats(profile).sort_stats('cumulative')
+        top = []
+        for func in stats.fcn_list[:self.top_n]:
+            _, ncalls, tottime, cumtime, _ = stats.stats[func]
+            top.append({'function': pstats.func_std_string(func), 'ncalls': ncalls,
+                        'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)})
+        record = dict(info, id=next(self._ids), timestamp=now_timestamp()[1],
+                      duration_ms=round((time.perf_counter() - started) * 1000, 3),
+                      total_calls=stats.total_calls, top=top)
+        self.profiles.append(record)
+        return record
+
+
+def get_profiler(app=None):
+    app = app or current_app._get_current_object()
+    profiler = app.extensions.get('profiler')
+    if profiler is None:
+        config = app.config
+        profiler = app.extensions['profiler'] = RequestProfiler(
+            config['PROFILE_SAMPLE_RATE'], config['PROFILE_TOP_N'], config['PROFILE_RING_SIZE'])
+    return profiler
+
+
+def _start_profile():
+    profiler = get_profiler()
+    forced = request.headers.get(current_app.config['PROFILE_HEADER']) and session.get('flag')
+    if forced or profiler.sampled():
+        profile = profiler.start()
+        if profile is not None:
+            g._profile = (profile, time.perf_counter())
+
+
+def _finish_profile(response):
+    started = g.pop('_profile', None)
+    if started is not None:
+        record = get_profiler().finish(*started, endpoint=request.endpoint, method=request.method,
+                                       path=request.path, status=response.status_code)
+        response.headers['X-Profile-Id'] = str(record['id'])
+        logger.info("Profiled %s %s in %.1f ms (profile %d)", request.method, request.path,
+                    record['duration_ms'], record['id'])
+    return response
+
+
+def _discard_profile(e=None):
+    # after_request is skipped when the view raises; never leave the profiler enabled
+    started = g.pop('_profile', None)
+    if started is not None:
+        get_profiler().discard(started[0])
+
+
+def trace_statement(statement):
+    """sqlite3 trace callback: remember statements while a repository call is being timed."""
+    try:
+        g.sql_trace.append(statement)
+    except (AttributeError, RuntimeError):
+        pass
+
+
+def log_slow_query(family, elapsed, statements):
+    route = request.endpoint if has_request_context() else 'background'
+    logger.warning("Slow query %s took %.1f ms in %s: %s", family, elapsed * 1000, route,
+                   ' | '.join(' '.join(sql.split()) for sql in statements) or '(statement not traced)')
+
+
+def init_profiling(app):
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+
+
+@profiling_bp.route('/api/profiles', methods=['GET'])
+@login_required
+def list_profiles():
+    return jsonify(list(reversed(get_profiler().profiles)))
@@ -1,25 +1,106 @@
 import logging
-import cv2
-import numpy as np
-from flask import Blueprint, request, jsonify
-from instance.database import get_db_connection
-from datetime import datetime
-from PIL import Image
-from app import socketio 
+import time
+from flask import Blueprint, current_app, g, request, jsonify
+from .repositories import get_repos
+from .utils import now_timestamp
+from .cache import invalidate, SCAN
+from .devices import device_key_required
+from .ratelimit import rate_limited, concurrency_slot, server_busy, ServerBusy
+from .metrics import QR_DECODE_SECONDS, QR_DECODE_ATTEMPTS, QR_ROI_LOOKUPS, INGEST_ROWS
+from .roi import get_roi_tracker
+from .correlation import get_correlator, match_scan, recheck_later
+from .events import broadcast
 from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
-import sqlite3 
-import os
-from werkzeug.utils import secure_filename
 
 
 qr_bp = Blueprint('qr', __name__)
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 
 logger = logging.getLogger(__name__)
 
+# The OpenCV stack is imported by load_vision() on the first upload, so nodes
+# that only take sensor traffic never pay for it
+cv2 = np = Image = None
+
+def load_vision():
+    global cv2, np, Image
+    if cv2 is None:
+        start = time.perf_counter()
+        import numpy
+        from PIL import Image as PILImage
+        import cv2 as opencv
+        np, Image, cv2 = numpy, PILImage, opencv
+        logger.info("Loaded OpenCV stack in %.0f ms", (time.perf_counter() - start) * 1000)
+
+# Decode cascade, cheapest first; each stage is only prepared if the previous one missed
+QR_STAGES = ('original', 'grayscale', 'OTSU threshold', 'Binary threshold')
+
+def _prepare_stage(stage, image_np, gray_image):
+    if stage == 'original':
+        return image_np
+    if stage == 'grayscale':
+        return gray_image
+    if stage == 'OTSU threshold':
+        blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 0)
+        return cv2.threshold(blurred_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return cv2.threshold(gray_image, 127, 255, cv2.THRESH_BINARY)[1]
+
+def decode_qr(image_np, label='', stages=QR_STAGES):
+    """Run the OpenCV cascade on an RGB image; returns ``(text, corner points)`` or ``(None, None)``."""
+    qr_detector = cv2.QRCodeDetector()
+    gray_image = None
+    for stage in stages:
+        start = time.perf_counter()
+        if stage != 'original' and gray_image is None:
+            gray_image = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
+        qr_data, points, _ = qr_detector.detectAndDecode(_prepare_stage(stage, image_np, gray_image))
+        QR_DECODE_SECONDS.observe(time.perf_counter() - start, label + stage)
+        QR_DECODE_ATTEMPTS.inc(label + stage, 'success' if qr_data else 'miss')
+        if qr_data:
+            logger.info("QR code detected by OpenCV (%s): %s", label + stage, qr_data)
+            return qr_data, (points.reshape(-1, 2) if points is not None else None)
+        if stage == 'original' and len(stages) > 1:
+            logger.debug("OpenCV failed on %soriginal image, attempting with grayscale and preprocessing", label)
+    return None, None
+
+def decode_qr_tracked(image_np, camera):
+    """Try crops around the camera's recent hits first, then the full frame.
+
+    A crop only gets the 'original' stage: a code in a tracked region is in
+    focus and framed as before, and a frame the region misses goes to the
+    full cascade anyway, so preprocessing the crops would only add cost.
+    """
+    if not current_app.config['QR_ROI_ENABLED']:
+        return decode_qr(image_np)[0]
+    tracker = get_roi_tracker()
+    height, width = image_np.shape[:2]
+    candidates = tracker.candidates(camera, width, height)
+    for x0, y0, x1, y1 in candidates:
+        qr_data, points = decode_qr(image_np[y0:y1, x0:x1], 'roi ', stages=QR_STAGES[:1])
+        if qr_data:
+            QR_ROI_LOOKUPS.inc('hit')
+            if points is not None:
+                tracker.record_hit(camera, points, (x0, y0))
+            return qr_data
+    if candidates:
+        QR_ROI_LOOKUPS.inc('miss')
+    qr_data, points = decode_qr(image_np)
+    if qr_data and points is not None:
+        tracker.record_hit(camera, points)
+    return qr_data
+
+def _decode_upload(image_file, camera):
+    load_vision()
+    image_np = np.array(Image.open(image_file))
+    if len(image_np.shape) == 3 and image_np.shape[2] == 4:
+        image_np = cv2.cvtColor(image_np, cv2.COLOR_RGBA2RGB)
+    elif len(image_np.shape) == 2:
+        image_np = cv2.cvtColor(image_np, cv2.COLOR_GRAY2RGB)
+    return decode_qr_tracked(image_np, camera)
+
+
 @qr_bp.route('/upload_image', methods=['POST'])
+@device_key_required
+@rate_limited
 def upload_image():
     try:
         if not request.content_type.startswith('multipart/form-data'):
@@ -43,94 +124,61 @@ def upload_image():
 
         try:
             logger.debug("Processing uploaded image for QR code detection using OpenCV")
-            image_pil = Image.open(image_file)
-            image_np = np.array(image_pil)
-            
-            if len(image_np.shape) == 3 and image_np.shape[2] == 4:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_RGBA2RGB)
-            elif len(image_np.shape) == 2:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_GRAY2RGB)
-
-            qr_data = None
-            qr_detector = cv2.QRCodeDetector()
-            
-            data_opencv_orig, _, _ = qr_detector.detectAndDecode(image_np)
-            if data_opencv_orig:
-                qr_data = data_opencv_orig
-                logger.info(f"QR code detected by OpenCV (original): {qr_data}")
-            else:
-                logger.debug("OpenCV failed on original image, attempting with grayscale and preprocessing")
-                
-                gray_image = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
-                blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 0)
-
-                _, thresh_image_otsu = cv2.threshold(blurred_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                _, thresh_image_binary = cv2.threshold(gray_image, 127, 255, cv2.THRESH_BINARY)
-                
-                data_opencv_gray, _, _ = qr_detector.detectAndDecode(gray_image)
-                if data_opencv_gray:
-                    qr_data = data_opencv_gray
-                    logger.info(f"QR code detected by OpenCV (grayscale): {qr_data}")
-                else:
-                    data_opencv_otsu, _, _ = qr_detector.detectAndDecode(thresh_image_otsu)
-                    if data_opencv_otsu:
-                        qr_data = data_opencv_otsu
-                        logger.info(f"QR code detected by OpenCV (OTSU threshold): {qr_data}")
-                    else:
-                        data_opencv_binary, _, _ = qr_detector.detectAndDecode(thresh_image_binary)
-                        if data_opencv_binary:
-                            qr_data = data_opencv_binary
-                            logger.info(f"QR code detected by OpenCV (Binary threshold): {qr_data}")
+            camera = g.get('device_id') or request.remote_addr
+            # Only decoding is CPU-bound; storage and broadcast below run outside the slot
+            try:
+                with concurrency_slot('image_decode'):
+                    qr_data = _decode_upload(image_file, camera)
+            except ServerBusy:
+                return server_busy()
 
             if not qr_data:
                 logger.warning("No QR code detected in image after all OpenCV attempts")
                 return jsonify({'status': 'error', 'message': 'No QR code detected'}), 404
                 
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            conn = get_db_connection()
-            c = conn.cursor()
-            
-            try:
-                c.execute('''INSERT INTO QRdate (qr_code, name, timestamp)
-                             VALUES (?, ?, ?)''',
-                          (qr_data, 'QR Item', current_time))
-                conn.commit()
-                logger.info(f"QR code saved to QRdate: {qr_data}")
-            except sqlite3.IntegrityError:
-                c.execute('''UPDATE QRdate SET timestamp = ? WHERE qr_code = ?''',
-                          (current_time, qr_data))
-                conn.commit()
-                logger.warning(f"QR code already exists in QRdate, timestamp updated: {qr_data}")
-
-            product_name = "Unknown Product"
-            c.execute('SELECT name FROM inventory WHERE qr_code = ? LIMIT 1', (qr_data,))
-            inventory_item = c.fetchone()
-            if inventory_item:
-                product_name = inventory_item['name']
-                logger.info(f"Found product name '{product_name}' for QR: {qr_data} in inventory.")
+            current_ms, current_time = now_timestamp()
+            repos = get_repos()
+
+            if repos.scans.record(qr_data, 'QR Item', current_ms, current_time):
+                logger.info("QR code saved to QRdate: %s", qr_data)
             else:
-                logger.warning(f"No product found for QR: {qr_data} in inventory. Using default name.")
+                logger.warning("QR code already exists in QRdate, timestamp updated: %s", qr_data)
+            invalidate(SCAN)
+            INGEST_ROWS.inc('QRdate')
 
-            latest_weight = 0.0
-            c.execute('SELECT weight FROM sensor_data ORDER BY timestamp DESC LIMIT 1')
-            sensor_row = c.fetchone()
-            if sensor_row and sensor_row['weight'] is not None:
-                latest_weight = sensor_row['weight']
-                logger.info(f"Latest sensor weight: {latest_weight}")
+            product_name = repos.inventory.name_for_qr(qr_data)
+            if product_name is not None:
+                logger.info("Found product name '%s' for QR: %s in inventory.", product_name, qr_data)
+            else:
+                product_name = "Unknown Product"
+                logger.warning("No product found for QR: %s in inventory. Using default name.", qr_data)
+
+            scale, match = match_scan(repos, camera, current_ms)
+            latest_weight = match.weight if match else 0.0
+            pair_id = repos.scans.record_weight(qr_data, current_ms, scale, *(match or (None, None, None)))
+            get_correlator().watch(pair_id, scale, qr_data, current_ms, match)
+            if match is None or match.method != 'stable':
+                recheck_later(current_app._get_current_object(), pair_id, qr_data, current_ms, scale)
+            if match:
+                logger.info("Matched weight %s from %s (%s, %+d ms)", match.weight, scale, match.method,
+                            match.reading_ms - current_ms)
+            else:
+                logger.info("No weight reading within tolerance of scan %s yet", qr_data)
 
             logger.debug("Emitting WebSocket event for detected QR and associated data")
-            socketio.emit('qr_scanned_data', {
+            broadcast('qr_scanned_data', {
                 'qr_code': qr_data,
                 'name': product_name,
                 'weight': latest_weight,
                 'timestamp': current_time
-            }, namespace='/')
+            }, 'qr-scans', camera)
 
             return jsonify({
                 'status': 'success',
                 'qr_code': qr_data,
                 'name': product_name,
                 'weight': latest_weight,
+                'weight_source': match.method if match else None,
                 'timestamp': current_time,
                 'message': 'QR code detected and data sent to frontend.'
             }), 200
@@ -0,0 +1,162 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from .metrics import RATE_LIMIT_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by (route, client), with O(1) checks and bounded memory.
+
+    Buckets live in an OrderedDict kept in last-use order, so idle buckets
+    are always at the front and are evicted in amortized O(1) once they
+    have been idle for ``idle_seconds`` or the table exceeds ``max_buckets``.
+    An evicted bucket comes back full, which is what an idle client would
+    have refilled to anyway.
+    """
+
+    def __init__(self, max_buckets=10000, idle_seconds=300):
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = {}
+
+    def _evict(self, now):
+        while self._buckets:
+            _, (_, last) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_buckets and now - last < self.idle_seconds:
+                break
+            self._buckets.popitem(last=False)
+
+    def check(self, route, client, rate, burst):
+        """Take one token; return 0 if allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        key = (route, client)
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+                self.rejected[route] = self.rejected.get(route, 0) + 1
+                RATE_LIMIT_REJECTIONS.inc('rate', route)
+            self._evict(now)
+        return retry_after
+
+    def bucket_count(self):
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """Non-blocking cap on how many requests may run a section at once."""
+
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                self.rejected += 1
+                RATE_LIMIT_REJECTIONS.inc('concurrency', self.name)
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+def get_limiter(app=None):
+    app = app or current_app._get_current_object()
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is None:
+        limiter = app.extensions['rate_limiter'] = TokenBucketLimiter(
+            app.config['RATE_LIMIT_MAX_BUCKETS'], app.config['RATE_LIMIT_IDLE_SECONDS'])
+    return limiter
+
+
+def get_concurrency_limiter(name, app=None):
+    app = app or current_app._get_current_object()
+    limiters = app.extensions.setdefault('concurrency_limiters', {})
+    limiter = limiters.get(name)
+    if limiter is None:
+        limiter = limiters[name] = ConcurrencyLimiter(app.config['CONCURRENCY_LIMITS'][name], name)
+    return limiter
+
+
+def _too_many_requests(message, retry_after):
+    response = jsonify({'status': 'error', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(f):
+    """Token-bucket limit per route and per device (or client IP when unauthenticated).
+
+    Rates come from ``Config.RATE_LIMITS[endpoint] = (tokens_per_second, burst)``;
+    endpoints without an entry are not limited. Place it below
+    ``device_key_required`` so buckets are keyed by device.
+    """
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        limit = current_app.config['RATE_LIMITS'].get(request.endpoint)
+        if limit:
+            client = g.get('device_id') or request.remote_addr
+            retry_after = get_limiter().check(request.endpoint, client, *limit)
+            if retry_after:
+                logger.warning("Rate limited %s for %s", request.endpoint, client)
+                return _too_many_requests('Rate limit exceeded', retry_after)
+        return f(*args, **kwargs)
+    return wrap
+
+
+class ServerBusy(Exception):
+    """Raised by ``concurrency_slot`` when its section is already at its limit."""
+
+
+@contextmanager
+def concurrency_slot(name):
+    """Run a section only while fewer than ``CONCURRENCY_LIMITS[name]`` requests are in it.
+
+    Raises ``ServerBusy`` instead of queueing; views answer it with ``server_busy()``.
+    Wrap only the expensive part, so requests waiting on I/O do not hold a slot.
+    """
+    limiter = get_concurrency_limiter(name)
+    if not limiter.try_acquire():
+        logger.warning("Concurrency limit reached for %s", name)
+        raise ServerBusy(name)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def server_busy():
+    return _too_many_requests('Server busy, retry later', 1)
+
+
+def rate_limit_stats(app=None):
+    app = app or current_app._get_current_object()
+    limiter = get_limiter(app)
+    return {
+        'buckets': limiter.bucket_count(),
+        'rejected': dict(limiter.rejected),
+        'concurrency': {name: {'limit': c.limit, 'active': c.active, 'rejected': c.rejected}
+                        for name, c in app.extensions.get('concurrency_limiters', {}).items()},
+    }
@@ -0,0 +1,107 @@
+"""Storage repositories used by the blueprints.
+
+Routes never build SQL themselves; they call ``get_repos()`` and use the
+``sensors``, ``inventory``, ``scans``, ``admins``, ``devices`` and
+``leases`` repositories. The backend is picked by ``Config.STORAGE_BACKEND``:
+
+* ``sqlite`` - raw sqlite3 on the pooled connections from ``app.database``
+* ``sqlalchemy`` - SQLAlchemy Core on a pooled engine built from
+  ``SQLALCHEMY_DATABASE_URI``; a ``sqlite:`` URL must name ``DATABASE``,
+  as the default does, since the migrations run on that file
+
+Rows are returned as mappings (``row['column']``) by both backends. Every
+repository call is timed into ``db_query_duration_seconds`` under its
+``<repo>.<method>`` family, and calls slower than ``Config.SLOW_QUERY_MS``
+are logged with the statements they ran and the route that issued them.
+"""
+import time
+from collections import namedtuple
+from flask import current_app, g
+from ..metrics import DB_QUERY_SECONDS
+from ..profiling import log_slow_query
+
+
+class StorageError(Exception):
+    """A backend-neutral storage failure."""
+
+
+class DuplicateError(StorageError):
+    """A write violated a uniqueness constraint."""
+
+
+Repos = namedtuple('Repos', ['sensors', 'inventory', 'scans', 'admins', 'devices', 'leases'])
+
+
+class _Timed:
+    """Wrap a repository so each method call is observed by DB_QUERY_SECONDS.
+
+    With a slow threshold set, the statements a call runs are collected in
+    ``g.sql_trace`` by the connection trace callback and logged if it is slow.
+    """
+
+    def __init__(self, family, repo, slow_seconds=0):
+        self._family = family
+        self._repo = repo
+        self._slow_seconds = slow_seconds
+
+    def __getattr__(self, name):
+        method = getattr(self._repo, name)
+        if not callable(method):
+            return method
+        family = f'{self._family}.{name}'
+        slow_seconds = self._slow_seconds
+
+        def timed(*args, **kwargs):
+            if slow_seconds:
+                g.sql_trace = []
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                DB_QUERY_SECONDS.observe(elapsed, family)
+                if slow_seconds:
+                    statements = g.pop('sql_trace', [])
+                    if elapsed >= slow_seconds:
+                        log_slow_query(family, elapsed, statements)
+        # Cache on the instance so later calls skip __getattr__
+        setattr(self, name, timed)
+        return timed
+
+
+def create_repos(app):
+    slow_seconds = app.config['SLOW_QUERY_MS'] / 1000
+    return Repos(*(_Timed(family, repo, slow_seconds)
+                   for family, repo in zip(Repos._fields, _create_backend(app))))
+
+
+def _create_backend(app):
+    backend = app.config['STORAGE_BACKEND']
+    if backend == 'sqlite':
+        from . import sqlite
+        return Repos(sqlite.SensorRepo(), sqlite.InventoryRepo(), sqlite.ScanRepo(), sqlite.AdminRepo(),
+                     sqlite.DeviceRepo(), sqlite.LeaseRepo())
+    if backend == 'sqlalchemy':
+        from . import sqlalchemy_core
+        engine = sqlalchemy_core.create_engine_from_config(app.config)
+        app.extensions['sqlalchemy_engine'] = engine
+        return Repos(sqlalchemy_core.SensorRepo(engine), sqlalchemy_core.InventoryRepo(engine),
+                     sqlalchemy_core.ScanRepo(engine), sqlalchemy_core.AdminRepo(engine),
+                     sqlalchemy_core.DeviceRepo(engine), sqlalchemy_core.LeaseRepo(engine))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r}")
+
+
+def get_repos():
+    repos = current_app.extensions.get('repos')
+    if repos is None:
+        repos = current_app.extensions['repos'] = create_repos(current_app)
+    return repos
+
+
+def server_engine():
+    """The SQLAlchemy engine when data lives in a server database; None when it is the SQLite file."""
+    config = current_app.config
+    if config['STORAGE_BACKEND'] != 'sqlalchemy' or config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return None
+    get_repos()
+    return current_app.extensions['sqlalchemy_engine']
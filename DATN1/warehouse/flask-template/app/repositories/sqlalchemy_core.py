@@ -0,0 +1,388 @@
+from sqlalchemy import (BigInteger, Column, Float, Index, Integer, MetaData, String, Table, UniqueConstraint,
+                        and_, create_engine, delete, event, func, insert, or_, select, text, update)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from ..database import sqlite_pragmas
+from ..profiling import trace_statement
+from ..utils import HOUR_MS
+from . import DuplicateError, StorageError
+
+metadata = MetaData()
+
+admin = Table(
+    'admin', metadata,
+    Column('admin_id', String, primary_key=True),
+    Column('password', String),
+    Column('tel', String),
+    Column('job_num', String),
+)
+
+inventory = Table(
+    'inventory', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('qr_code', String),
+    Column('name', String),
+    Column('weight', Float),
+    Column('quantity', Integer, default=1),
+    Column('timestamp', String),
+    Column('timestamp_ms', BigInteger),
+    UniqueConstraint('qr_code', 'name'),
+    Index('idx_inventory_timestamp_ms', 'timestamp_ms'),
+)
+
+sensor_data = Table(
+    'sensor_data', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('temperature', Float),
+    Column('humidity', Float),
+    Column('weight', Float),
+    Column('timestamp', String),
+    Column('timestamp_ms', BigInteger),
+    Column('device_id', String),
+    Column('seq', BigInteger),
+    Index('idx_sensor_data_timestamp_ms', 'timestamp_ms'),
+    Index('idx_sensor_data_device_seq', 'device_id', 'seq', unique=True,
+          sqlite_where=text('seq IS NOT NULL'), postgresql_where=text('seq IS NOT NULL')),
+)
+
+qrdate = Table(
+    'QRdate', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('qr_code', String, unique=True),
+    Column('name', String),
+    Column('timestamp', String),
+    Column('timestamp_ms', BigInteger),
+    Index('idx_qrdate_timestamp_ms', 'timestamp_ms'),
+)
+
+scan_weights = Table(
+    'scan_weights', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('qr_code', String, nullable=False),
+    Column('scan_ms', BigInteger, nullable=False),
+    Column('scale', String),
+    Column('weight', Float),
+    Column('reading_ms', BigInteger),
+    Column('method', String),
+    Index('idx_scan_weights_scan_ms', 'scan_ms'),
+)
+
+device_keys = Table(
+    'device_keys', metadata,
+    Column('device_id', String, primary_key=True),
+    Column('key_hash', String, nullable=False, unique=True),
+    Column('created_ms', BigInteger),
+)
+
+job_leases = Table(
+    'job_leases', metadata,
+    Column('name', String, primary_key=True),
+    Column('owner', String, nullable=False),
+    Column('expires_ms', BigInteger, nullable=False),
+)
+
+
+def create_engine_from_config(config):
+    """Build a pooled engine; SQLite URLs get the same pragmas as the raw pool.
+
+    The schema is left to ``app.migrations.run_migrations``.
+    """
+    url = config['SQLALCHEMY_DATABASE_URI']
+    kwargs = {
+        'pool_pre_ping': True,
+        'pool_recycle': config['SQLALCHEMY_POOL_RECYCLE'],
+    }
+    if not url.startswith('sqlite:///:memory:') and url != 'sqlite://':
+        kwargs['pool_size'] = config['SQLALCHEMY_POOL_SIZE']
+        kwargs['max_overflow'] = config['SQLALCHEMY_MAX_OVERFLOW']
+    if url.startswith('sqlite'):
+        kwargs['connect_args'] = {'check_same_thread': False}
+    engine = create_engine(url, **kwargs)
+
+    if url.startswith('sqlite'):
+        pragmas = sqlite_pragmas(config)
+
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            for name, value in pragmas.items():
+                cur.execute(f'PRAGMA {name} = {value}')
+            cur.close()
+            if config['SLOW_QUERY_MS']:
+                dbapi_conn.set_trace_callback(trace_statement)
+
+    return engine
+
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING, used to skip replayed (device_id, seq) readings
+# and to insert a new scan without racing another worker
+_CONFLICT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def _first(conn, stmt):
+    row = conn.execute(stmt).first()
+    return row._mapping if row else None
+
+
+class SensorRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def insert(self, temperature, humidity, weight, timestamp_ms, timestamp, device_id=None, seq=None):
+        return self.insert_many([(temperature, humidity, weight, timestamp_ms, timestamp, device_id, seq)])[0]
+
+    def insert_many(self, readings):
+        stored = []
+        conflict_insert = _CONFLICT_INSERTS.get(self.engine.dialect.name)
+        with self.engine.begin() as conn:
+            for temperature, humidity, weight, timestamp_ms, timestamp, device_id, seq in readings:
+                values = dict(temperature=temperature, humidity=humidity, weight=weight,
+                              timestamp=timestamp, timestamp_ms=timestamp_ms, device_id=device_id, seq=seq)
+                if seq is None:
+                    conn.execute(insert(sensor_data).values(**values))
+                    stored.append(True)
+                elif conflict_insert is not None:
+                    stmt = conflict_insert(sensor_data).values(**values).on_conflict_do_nothing(
+                        index_elements=['device_id', 'seq'], index_where=sensor_data.c.seq.isnot(None))
+                    stored.append(conn.execute(stmt).rowcount == 1)
+                else:
+                    # A savepoint keeps the batch going past a replay; not used on pysqlite, where each one commits
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(insert(sensor_data).values(**values))
+                        stored.append(True)
+                    except IntegrityError:
+                        stored.append(False)
+        return stored
+
+    def latest(self):
+        with self.engine.connect() as conn:
+            return _first(conn, select(sensor_data).order_by(sensor_data.c.timestamp_ms.desc()).limit(1))
+
+    def latest_weight(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(sensor_data.c.weight)
+                                .order_by(sensor_data.c.timestamp_ms.desc()).limit(1)).scalar()
+
+    def hourly(self, since_ms=None, until_ms=None, limit=10):
+        """Latest reading of each hour in [since_ms, until_ms], newest first."""
+        ts = sensor_data.c.timestamp_ms
+        conditions = [ts.isnot(None)]
+        if since_ms is not None:
+            conditions.append(ts >= since_ms)
+        if until_ms is not None:
+            conditions.append(ts <= until_ms)
+        buckets = (select(func.max(ts).label('timestamp_ms'))
+                   .where(and_(*conditions))
+                   .group_by(ts // HOUR_MS)
+                   .subquery())
+        # Readings stored together can share the latest ms of an hour; keep the last stored one
+        latest = (select(func.max(sensor_data.c.id).label('id'))
+                  .select_from(sensor_data.join(buckets, ts == buckets.c.timestamp_ms))
+                  .group_by(ts)
+                  .subquery())
+        stmt = (select(sensor_data)
+                .join(latest, sensor_data.c.id == latest.c.id)
+                .order_by(ts.desc())
+                .limit(limit))
+        with self.engine.connect() as conn:
+            return [row._mapping for row in conn.execute(stmt)]
+
+    def first_timestamp_ms(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.min(sensor_data.c.timestamp_ms))
+                                .where(sensor_data.c.timestamp_ms > 0)).scalar()
+
+    def weight_readings(self, since_ms, until_ms):
+        ts = sensor_data.c.timestamp_ms
+        stmt = (select(sensor_data.c.device_id, ts, sensor_data.c.weight)
+                .where(and_(ts >= since_ms, ts <= until_ms, sensor_data.c.weight.isnot(None)))
+                .order_by(ts))
+        with self.engine.connect() as conn:
+            return conn.execute(stmt).all()
+
+    def iter_readings(self, since_ms, until_ms, chunk_size=10000):
+        """Yield chunks of (timestamp_ms, temperature, humidity, weight) rows in [since_ms, until_ms), oldest first."""
+        ts = sensor_data.c.timestamp_ms
+        stmt = (select(ts, sensor_data.c.temperature, sensor_data.c.humidity, sensor_data.c.weight)
+                .where(and_(ts >= since_ms, ts < until_ms))
+                .order_by(ts))
+        with self.engine.connect() as conn:
+            yield from conn.execution_options(yield_per=chunk_size).execute(stmt).partitions()
+
+
+class InventoryRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def recent(self, limit=None):
+        stmt = select(inventory).order_by(inventory.c.timestamp_ms.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        with self.engine.connect() as conn:
+            return [row._mapping for row in conn.execute(stmt)]
+
+    def name_for_qr(self, qr_code):
+        with self.engine.connect() as conn:
+            return conn.execute(select(inventory.c.name)
+                                .where(inventory.c.qr_code == qr_code).limit(1)).scalar()
+
+    def add(self, qr_code, name, weight, timestamp_ms, timestamp):
+        """Import one unit; returns ``(created, name, weight, quantity)``."""
+        with self.engine.begin() as conn:
+            existing = _first(conn, select(inventory.c.id, inventory.c.weight, inventory.c.quantity)
+                              .where(inventory.c.qr_code == qr_code).limit(1))
+            if existing:
+                quantity = existing['quantity'] + 1
+                conn.execute(update(inventory).where(inventory.c.id == existing['id']).values(
+                    quantity=quantity, name=name, timestamp=timestamp, timestamp_ms=timestamp_ms))
+                return False, name, existing['weight'], quantity
+            conn.execute(insert(inventory).values(
+                qr_code=qr_code, name=name, weight=weight, quantity=1,
+                timestamp=timestamp, timestamp_ms=timestamp_ms))
+            return True, name, weight, 1
+
+    def remove_one(self, qr_code, name):
+        """Export one unit; returns False if no such item exists."""
+        match = and_(inventory.c.qr_code == qr_code, inventory.c.name == name)
+        with self.engine.begin() as conn:
+            quantity = conn.execute(select(inventory.c.quantity).where(match)).scalar()
+            if quantity is None:
+                return False
+            if quantity > 1:
+                conn.execute(update(inventory).where(match).values(quantity=inventory.c.quantity - 1))
+            else:
+                conn.execute(delete(inventory).where(match))
+            return True
+
+
+class ScanRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def record(self, qr_code, name, timestamp_ms, timestamp):
+        """Insert or refresh a scan; returns True if the code was new."""
+        values = dict(qr_code=qr_code, name=name, timestamp=timestamp, timestamp_ms=timestamp_ms)
+        refresh = (update(qrdate).where(qrdate.c.qr_code == qr_code)
+                   .values(timestamp=timestamp, timestamp_ms=timestamp_ms))
+        conflict_insert = _CONFLICT_INSERTS.get(self.engine.dialect.name)
+        if conflict_insert is not None:
+            with self.engine.begin() as conn:
+                stmt = conflict_insert(qrdate).values(**values).on_conflict_do_nothing(index_elements=['qr_code'])
+                if conn.execute(stmt).rowcount == 1:
+                    return True
+                conn.execute(refresh)
+                return False
+        with self.engine.begin() as conn:
+            if conn.execute(refresh).rowcount:
+                return False
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(qrdate).values(**values))
+            return True
+        except IntegrityError:
+            # Another worker inserted the code between our UPDATE and INSERT
+            with self.engine.begin() as conn:
+                conn.execute(refresh)
+            return False
+
+    def latest(self):
+        with self.engine.connect() as conn:
+            return _first(conn, select(qrdate.c.qr_code, qrdate.c.name, qrdate.c.timestamp)
+                          .order_by(qrdate.c.timestamp_ms.desc()).limit(1))
+
+    def record_weight(self, qr_code, scan_ms, scale, weight, reading_ms, method):
+        """Store the weight matched to a scan; returns the pair id."""
+        with self.engine.begin() as conn:
+            return conn.execute(insert(scan_weights).values(
+                qr_code=qr_code, scan_ms=scan_ms, scale=scale, weight=weight,
+                reading_ms=reading_ms, method=method)).inserted_primary_key[0]
+
+    def update_weight(self, pair_id, scale, weight, reading_ms, method):
+        with self.engine.begin() as conn:
+            conn.execute(update(scan_weights).where(scan_weights.c.id == pair_id)
+                         .values(scale=scale, weight=weight, reading_ms=reading_ms, method=method))
+
+
+class AdminRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def authenticate(self, admin_id, password):
+        with self.engine.connect() as conn:
+            return conn.execute(select(admin.c.admin_id).where(
+                and_(admin.c.admin_id == admin_id, admin.c.password == password))).first() is not None
+
+    def create(self, admin_id, password, tel, job_num):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(admin).values(admin_id=admin_id, password=password,
+                                                  tel=tel, job_num=job_num))
+        except IntegrityError as e:
+            raise DuplicateError(str(e)) from e
+
+    def get(self, admin_id):
+        with self.engine.connect() as conn:
+            return _first(conn, select(admin.c.admin_id, admin.c.tel, admin.c.job_num)
+                          .where(admin.c.admin_id == admin_id))
+
+    def update_profile(self, admin_id, tel, job_num, password=None):
+        values = {'tel': tel, 'job_num': job_num}
+        if password:
+            values['password'] = password
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(update(admin).where(admin.c.admin_id == admin_id).values(**values))
+        except SQLAlchemyError as e:
+            raise StorageError(str(e)) from e
+
+
+class DeviceRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def all(self):
+        with self.engine.connect() as conn:
+            return [row._mapping for row in conn.execute(
+                select(device_keys.c.device_id, device_keys.c.key_hash))]
+
+    def set_key(self, device_id, key_hash, created_ms):
+        """Create the device or rotate its key."""
+        with self.engine.begin() as conn:
+            result = conn.execute(update(device_keys).where(device_keys.c.device_id == device_id)
+                                  .values(key_hash=key_hash, created_ms=created_ms))
+            if result.rowcount == 0:
+                conn.execute(insert(device_keys).values(device_id=device_id, key_hash=key_hash,
+                                                        created_ms=created_ms))
+
+    def delete(self, device_id):
+        with self.engine.begin() as conn:
+            return conn.execute(delete(device_keys).where(device_keys.c.device_id == device_id)).rowcount > 0
+
+
+class LeaseRepo:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def acquire(self, name, owner, expires_ms, now_ms):
+        """Take or extend the lease ``name`` until ``expires_ms``; returns True if ``owner`` now holds it.
+
+        Portable across dialects: the conditional UPDATE takes a free or own
+        lease, and when no row matched, the INSERT either creates the lease or
+        hits the primary key because another worker holds it.
+        """
+        try:
+            with self.engine.begin() as conn:
+                taken = conn.execute(update(job_leases).where(and_(
+                    job_leases.c.name == name,
+                    or_(job_leases.c.owner == owner, job_leases.c.expires_ms < now_ms)))
+                    .values(owner=owner, expires_ms=expires_ms)).rowcount
+                if not taken:
+                    conn.execute(insert(job_leases).values(name=name, owner=owner, expires_ms=expires_ms))
+            return True
+        except IntegrityError:
+            return False
+
+    def release(self, name, owner):
+        with self.engine.begin() as conn:
+            conn.execute(delete(job_leases).where(and_(job_leases.c.name == name, job_leases.c.owner == owner)))
@@ -0,0 +1,229 @@
+import sqlite3
+from ..database import get_db_connection
+from ..utils import HOUR_MS
+from . import DuplicateError, StorageError
+
+
+class SensorRepo:
+    def insert(self, temperature, humidity, weight, timestamp_ms, timestamp, device_id=None, seq=None):
+        """Store one reading; returns False if ``(device_id, seq)`` was already stored."""
+        return self.insert_many([(temperature, humidity, weight, timestamp_ms, timestamp, device_id, seq)])[0]
+
+    def insert_many(self, readings):
+        """Store (temperature, humidity, weight, timestamp_ms, timestamp, device_id, seq) rows in one
+        transaction; returns a stored flag per row, False where ``(device_id, seq)`` already exists."""
+        conn = get_db_connection()
+        stored = []
+        for temperature, humidity, weight, timestamp_ms, timestamp, device_id, seq in readings:
+            cur = conn.execute('''INSERT OR IGNORE INTO sensor_data
+                                  (temperature, humidity, weight, timestamp, timestamp_ms, device_id, seq)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                               (temperature, humidity, weight, timestamp, timestamp_ms, device_id, seq))
+            stored.append(cur.rowcount == 1)
+        conn.commit()
+        return stored
+
+    def latest(self):
+        return get_db_connection().execute(
+            'SELECT * FROM sensor_data ORDER BY timestamp_ms DESC LIMIT 1').fetchone()
+
+    def latest_weight(self):
+        row = get_db_connection().execute(
+            'SELECT weight FROM sensor_data ORDER BY timestamp_ms DESC LIMIT 1').fetchone()
+        return row['weight'] if row else None
+
+    def hourly(self, since_ms=None, until_ms=None, limit=10):
+        """Latest reading of each hour in [since_ms, until_ms], newest first."""
+        return get_db_connection().execute(
+            # Readings stored together can share the latest ms of an hour; keep the last stored one
+            '''SELECT id, temperature, humidity, weight, timestamp, timestamp_ms
+               FROM sensor_data
+               WHERE id IN (SELECT MAX(id) FROM sensor_data
+                            WHERE timestamp_ms IN (SELECT MAX(timestamp_ms) FROM sensor_data
+                                                   WHERE timestamp_ms >= ? AND timestamp_ms <= ?
+                                                   GROUP BY timestamp_ms / ?)
+                            GROUP BY timestamp_ms)
+               ORDER BY timestamp_ms DESC
+               LIMIT ?''',
+            (since_ms if since_ms is not None else 0,
+             until_ms if until_ms is not None else 2 ** 63 - 1,
+             HOUR_MS, limit)).fetchall()
+
+    def first_timestamp_ms(self):
+        """Time of the oldest reading; legacy rows whose text timestamp could not be parsed (0) are skipped."""
+        return get_db_connection().execute(
+            'SELECT MIN(timestamp_ms) FROM sensor_data WHERE timestamp_ms > 0').fetchone()[0]
+
+    def weight_readings(self, since_ms, until_ms):
+        """(device_id, timestamp_ms, weight) of readings with a weight in [since_ms, until_ms], oldest first."""
+        return get_db_connection().execute(
+            '''SELECT device_id, timestamp_ms, weight FROM sensor_data
+               WHERE timestamp_ms >= ? AND timestamp_ms <= ? AND weight IS NOT NULL
+               ORDER BY timestamp_ms''', (since_ms, until_ms)).fetchall()
+
+    def iter_readings(self, since_ms, until_ms, chunk_size=10000):
+        """Yield chunks of (timestamp_ms, temperature, humidity, weight) rows in [since_ms, until_ms), oldest first."""
+        cur = get_db_connection().execute(
+            '''SELECT timestamp_ms, temperature, humidity, weight FROM sensor_data
+               WHERE timestamp_ms >= ? AND timestamp_ms < ?
+               ORDER BY timestamp_ms''', (since_ms, until_ms))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+class InventoryRepo:
+    def recent(self, limit=None):
+        conn = get_db_connection()
+        if limit is None:
+            return conn.execute('SELECT * FROM inventory ORDER BY timestamp_ms DESC').fetchall()
+        return conn.execute('SELECT * FROM inventory ORDER BY timestamp_ms DESC LIMIT ?', (limit,)).fetchall()
+
+    def name_for_qr(self, qr_code):
+        row = get_db_connection().execute(
+            'SELECT name FROM inventory WHERE qr_code = ? LIMIT 1', (qr_code,)).fetchone()
+        return row['name'] if row else None
+
+    def add(self, qr_code, name, weight, timestamp_ms, timestamp):
+        """Import one unit; returns ``(created, name, weight, quantity)``."""
+        conn = get_db_connection()
+        existing = conn.execute('SELECT id, weight, quantity FROM inventory WHERE qr_code = ? LIMIT 1',
+                                (qr_code,)).fetchone()
+        if existing:
+            quantity = existing['quantity'] + 1
+            conn.execute('''UPDATE inventory SET quantity = ?, name = ?, timestamp = ?, timestamp_ms = ?
+                            WHERE id = ?''',
+                         (quantity, name, timestamp, timestamp_ms, existing['id']))
+            conn.commit()
+            return False, name, existing['weight'], quantity
+        conn.execute('''INSERT INTO inventory (qr_code, name, weight, quantity, timestamp, timestamp_ms)
+                        VALUES (?, ?, ?, 1, ?, ?)''',
+                     (qr_code, name, weight, timestamp, timestamp_ms))
+        conn.commit()
+        return True, name, weight, 1
+
+    def remove_one(self, qr_code, name):
+        """Export one unit; returns False if no such item exists."""
+        conn = get_db_connection()
+        row = conn.execute('SELECT quantity FROM inventory WHERE qr_code = ? AND name = ?',
+                           (qr_code, name)).fetchone()
+        if not row:
+            return False
+        if row['quantity'] > 1:
+            conn.execute('UPDATE inventory SET quantity = quantity - 1 WHERE qr_code = ? AND name = ?',
+                         (qr_code, name))
+        else:
+            conn.execute('DELETE FROM inventory WHERE qr_code = ? AND name = ?', (qr_code, name))
+        conn.commit()
+        return True
+
+
+class ScanRepo:
+    def record(self, qr_code, name, timestamp_ms, timestamp):
+        """Insert or refresh a scan; returns True if the code was new."""
+        conn = get_db_connection()
+        cur = conn.execute('UPDATE QRdate SET timestamp = ?, timestamp_ms = ? WHERE qr_code = ?',
+                           (timestamp, timestamp_ms, qr_code))
+        created = cur.rowcount == 0
+        if created:
+            conn.execute('INSERT INTO QRdate (qr_code, name, timestamp, timestamp_ms) VALUES (?, ?, ?, ?)',
+                         (qr_code, name, timestamp, timestamp_ms))
+        conn.commit()
+        return created
+
+    def latest(self):
+        return get_db_connection().execute(
+            'SELECT qr_code, name, timestamp FROM QRdate ORDER BY timestamp_ms DESC LIMIT 1').fetchone()
+
+    def record_weight(self, qr_code, scan_ms, scale, weight, reading_ms, method):
+        """Store the weight matched to a scan; returns the pair id."""
+        conn = get_db_connection()
+        cur = conn.execute('''INSERT INTO scan_weights (qr_code, scan_ms, scale, weight, reading_ms, method)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           (qr_code, scan_ms, scale, weight, reading_ms, method))
+        conn.commit()
+        return cur.lastrowid
+
+    def update_weight(self, pair_id, scale, weight, reading_ms, method):
+        conn = get_db_connection()
+        conn.execute('UPDATE scan_weights SET scale = ?, weight = ?, reading_ms = ?, method = ? WHERE id = ?',
+                     (scale, weight, reading_ms, method, pair_id))
+        conn.commit()
+
+
+class AdminRepo:
+    def authenticate(self, admin_id, password):
+        return get_db_connection().execute(
+            'SELECT admin_id, password FROM admin WHERE admin_id = ? AND password = ?',
+            (admin_id, password)).fetchone() is not None
+
+    def create(self, admin_id, password, tel, job_num):
+        conn = get_db_connection()
+        try:
+            conn.execute('INSERT INTO admin (admin_id, password, tel, job_num) VALUES (?, ?, ?, ?)',
+                         (admin_id, password, tel, job_num))
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            raise DuplicateError(str(e)) from e
+
+    def get(self, admin_id):
+        return get_db_connection().execute(
+            'SELECT admin_id, tel, job_num FROM admin WHERE admin_id = ?', (admin_id,)).fetchone()
+
+    def update_profile(self, admin_id, tel, job_num, password=None):
+        conn = get_db_connection()
+        query = 'UPDATE admin SET tel = ?, job_num = ?'
+        params = [tel, job_num]
+        if password:
+            query += ', password = ?'
+            params.append(password)
+        query += ' WHERE admin_id = ?'
+        params.append(admin_id)
+        try:
+            conn.execute(query, params)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise StorageError(str(e)) from e
+
+
+class DeviceRepo:
+    def all(self):
+        return get_db_connection().execute('SELECT device_id, key_hash FROM device_keys').fetchall()
+
+    def set_key(self, device_id, key_hash, created_ms):
+        """Create the device or rotate its key."""
+        conn = get_db_connection()
+        cur = conn.execute('UPDATE device_keys SET key_hash = ?, created_ms = ? WHERE device_id = ?',
+                           (key_hash, created_ms, device_id))
+        if cur.rowcount == 0:
+            conn.execute('INSERT INTO device_keys (device_id, key_hash, created_ms) VALUES (?, ?, ?)',
+                         (device_id, key_hash, created_ms))
+        conn.commit()
+
+    def delete(self, device_id):
+        conn = get_db_connection()
+        cur = conn.execute('DELETE FROM device_keys WHERE device_id = ?', (device_id,))
+        conn.commit()
+        return cur.rowcount > 0
+
+
+class LeaseRepo:
+    def acquire(self, name, owner, expires_ms, now_ms):
+        """Take or extend the lease ``name`` until ``expires_ms``; returns True if ``owner`` now holds it."""
+        conn = get_db_connection(readonly=False)
+        conn.execute('''INSERT INTO job_leases (name, owner, expires_ms) VALUES (?, ?, ?)
+                        ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_ms = excluded.expires_ms
+                        WHERE job_leases.owner = excluded.owner OR job_leases.expires_ms < ?''',
+                     (name, owner, expires_ms, now_ms))
+        conn.commit()
+        row = conn.execute('SELECT owner FROM job_leases WHERE name = ?', (name,)).fetchone()
+        return row is not None and row['owner'] == owner
+
+    def release(self, name, owner):
+        conn = get_db_connection(readonly=False)
+        conn.execute('DELETE FROM job_leases WHERE name = ? AND owner = ?', (name, owner))
+        conn.commit()
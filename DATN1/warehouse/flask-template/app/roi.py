@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class RoiTracker:
+    """Remembers where each camera recently found QR codes.
+
+    Fixed-mount cameras see codes in the same few places, so ``upload_image``
+    first decodes a padded crop around each recent region and falls back to
+    the full frame only when all of them miss. A region decays out once it
+    has not produced a hit for ``ttl_seconds``. Cameras are kept in
+    last-use order and the least recently seen is dropped beyond
+    ``max_cameras``, as in the rate limiter.
+    """
+
+    def __init__(self, padding=0.5, ttl_seconds=30, max_regions=3, max_cameras=256, min_size=32):
+        self.padding = padding
+        self.ttl_seconds = ttl_seconds
+        self.max_regions = max_regions
+        self.max_cameras = max_cameras
+        self.min_size = min_size
+        self._cameras = OrderedDict()
+        self._lock = threading.Lock()
+
+    def candidates(self, camera, width, height):
+        """Padded crop boxes ``(x0, y0, x1, y1)`` to try first, most recent hit first."""
+        now = time.monotonic()
+        with self._lock:
+            regions = self._cameras.get(camera)
+            if not regions:
+                return []
+            regions[:] = [r for r in regions if now - r[1] < self.ttl_seconds]
+            boxes = [self._pad(box, width, height) for box, _ in regions]
+        return boxes
+
+    def _pad(self, box, width, height):
+        x0, y0, x1, y1 = box
+        pad = max(self.min_size, int(max(x1 - x0, y1 - y0) * self.padding))
+        return max(0, x0 - pad), max(0, y0 - pad), min(width, x1 + pad), min(height, y1 + pad)
+
+    def record_hit(self, camera, points, offset=(0, 0)):
+        """Remember the bounding box of ``points`` (corners in crop coordinates) for ``camera``."""
+        xs = [float(p[0]) + offset[0] for p in points]
+        ys = [float(p[1]) + offset[1] for p in points]
+        box = (int(min(xs)), int(min(ys)), int(max(xs)) + 1, int(max(ys)) + 1)
+        now = time.monotonic()
+        with self._lock:
+            regions = self._cameras.pop(camera, [])
+            # Drop regions this hit overlaps; it supersedes them
+            regions = [r for r in regions if not _overlaps(r[0], box)]
+            regions.insert(0, (box, now))
+            del regions[self.max_regions:]
+            self._cameras[camera] = regions
+            while len(self._cameras) > self.max_cameras:
+                self._cameras.popitem(last=False)
+
+    def camera_count(self):
+        return len(self._cameras)
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def get_roi_tracker(app=None):
+    app = app or current_app._get_current_object()
+    tracker = app.extensions.get('qr_roi')
+    if tracker is None:
+        config = app.config
+        tracker = app.extensions['qr_roi'] = RoiTracker(
+            config['QR_ROI_PADDING'], config['QR_ROI_TTL_SECONDS'],
+            config['QR_ROI_MAX_REGIONS'], config['QR_ROI_MAX_CAMERAS'])
+    return tracker
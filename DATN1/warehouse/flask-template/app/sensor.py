@@ -1,112 +1,203 @@
 import logging
-from flask import Blueprint, jsonify, request
-from instance.database import get_db_connection
-from .utils import login_required
-from datetime import datetime, timedelta
-from app import socketio 
+import math
+from flask import Blueprint, current_app, g, jsonify, request
+from .repositories import get_repos
+from .utils import format_timestamp, login_required, now_timestamp, HOUR_MS
+from .cache import cached_response, invalidate, SENSOR
+from .devices import device_key_required
+from .ratelimit import rate_limited
+from .metrics import INGEST_DUPLICATES, INGEST_ROWS
+from .events import broadcast
+from .correlation import get_correlator, save_match
+from .dedupe import DUPLICATE, get_deduper
 sensor_bp = Blueprint('sensor', __name__)
 
 logger = logging.getLogger(__name__)
 
+# Device clocks may run slightly fast; further ahead than this is rejected
+MAX_CLOCK_AHEAD_MS = 60 * 1000
+
+def sensor_to_dict(row):
+    return {
+        'temperature': row['temperature'],
+        'humidity': row['humidity'],
+        'weight': row['weight'],
+        'timestamp': row['timestamp']
+    }
+
+def sensor_history(repos):
+    """Hourly readings older than one hour, newest first (at most 10)."""
+    now_ms, _ = now_timestamp()
+    return [sensor_to_dict(row) for row in repos.sensors.hourly(until_ms=now_ms - HOUR_MS, limit=10)]
+
+def rematch_scans(repos, scale, timestamp_ms, weight):
+    """Feed a reading to the correlator and store/broadcast scans it now matches better."""
+    for pair_id, qr_code, scan_ms, match in get_correlator().add_reading(scale, timestamp_ms, weight):
+        save_match(repos, pair_id, qr_code, scan_ms, scale, match)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def parse_reading(data, device_id=None):
+    """Validate one reading payload; returns ``(reading, None)`` or ``(None, error message)``.
+
+    An authenticated ``device_id`` takes precedence over the one in the payload.
+    """
+    if not isinstance(data, dict):
+        return None, 'Each reading must be a JSON object'
+    temperature = data.get('temperature')
+    humidity = data.get('humidity')
+    weight = data.get('weight')
+    seq = data.get('seq')
+    timestamp_ms = data.get('timestamp_ms')
+    device_id = device_id or data.get('device_id')
+
+    if temperature is None or humidity is None:
+        return None, 'Temperature and humidity are required'
+    if not _is_number(temperature) or not _is_number(humidity):
+        return None, 'Temperature and humidity must be numbers'
+    if weight is not None and (not _is_number(weight) or weight < 0):
+        return None, 'Weight must be a non-negative number'
+    if device_id is not None and (not isinstance(device_id, str) or not device_id):
+        return None, 'device_id must be a non-empty string'
+    if seq is not None:
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            return None, 'seq must be a non-negative integer'
+    if timestamp_ms is not None:
+        if not isinstance(timestamp_ms, int) or isinstance(timestamp_ms, bool) or timestamp_ms < 0:
+            return None, 'timestamp_ms must be a non-negative integer (epoch ms)'
+        if timestamp_ms > now_timestamp()[0] + MAX_CLOCK_AHEAD_MS:
+            return None, 'timestamp_ms is in the future; check the device clock'
+    return {'temperature': temperature, 'humidity': humidity, 'weight': weight,
+            'device_id': device_id, 'seq': seq, 'timestamp_ms': timestamp_ms}, None
+
+def _dedupe_key(reading):
+    return reading['seq'] is not None and reading['device_id'] is not None
+
+def store_readings(readings):
+    """Store validated readings and notify listeners; returns ``(stored, duplicates)``.
+
+    Readings whose ``(device_id, seq)`` is already known are dropped by the
+    in-memory deduper before any write. The rest go in one transaction, where
+    the unique index catches replays the deduper could not rule out. A seq
+    without a device_id cannot be told apart from another device's, so
+    those readings are stored without deduplication.
+    """
+    deduper = get_deduper()
+    fresh = []
+    duplicates = 0
+    for reading in readings:
+        if _dedupe_key(reading) and deduper.check(reading['device_id'], reading['seq']) == DUPLICATE:
+            INGEST_DUPLICATES.inc('memory')
+            duplicates += 1
+        else:
+            fresh.append(reading)
+    if not fresh:
+        return [], duplicates
+
+    current_ms, current_time = now_timestamp()
+    for reading in fresh:
+        if reading['timestamp_ms'] is None:
+            reading['timestamp_ms'], reading['timestamp'] = current_ms, current_time
+        else:
+            reading['timestamp'] = format_timestamp(reading['timestamp_ms'])
+    repos = get_repos()
+    flags = repos.sensors.insert_many([
+        (r['temperature'], r['humidity'], r['weight'], r['timestamp_ms'], r['timestamp'], r['device_id'], r['seq'])
+        for r in fresh])
+    stored = []
+    for reading, was_stored in zip(fresh, flags):
+        if _dedupe_key(reading):
+            deduper.record(reading['device_id'], reading['seq'])
+        if was_stored:
+            stored.append(reading)
+        else:
+            INGEST_DUPLICATES.inc('index')
+            duplicates += 1
+    if not stored:
+        return stored, duplicates
+
+    invalidate(SENSOR)
+    INGEST_ROWS.inc('sensor_data', amount=len(stored))
+    for reading in stored:
+        if reading['weight'] is not None:
+            rematch_scans(repos, reading['device_id'] or 'default', reading['timestamp_ms'], reading['weight'])
+    latest = max(stored, key=lambda r: r['timestamp_ms'])
+    logger.info("Sensor data recorded: %d reading(s), latest Temperature=%s, Humidity=%s, Weight=%s",
+                len(stored), latest['temperature'], latest['humidity'], latest['weight'])
+    broadcast('new_sensor_data', {
+        'temperature': latest['temperature'],
+        'humidity': latest['humidity'],
+        'weight': latest['weight'],
+        'timestamp': latest['timestamp']
+    }, 'sensors', latest['device_id'])
+    return stored, duplicates
+
 @sensor_bp.route('/api/sensor', methods=['POST'])
+@device_key_required
+@rate_limited
 def sensor_data_api():
+    """Store one reading, or a JSON list of up to ``SENSOR_BATCH_MAX`` readings in one transaction.
+
+    Readings may carry ``device_id`` and ``seq``; a retried reading is
+    acknowledged again but stored only once. ``timestamp_ms`` (epoch ms) is
+    the device's reading time; the receive time is used without it.
+    """
     try:
         data = request.json
         if not data:
             logger.error("No JSON data provided for sensor_data_api")
             return jsonify({'status': 'error', 'message': 'No JSON data provided'}), 400
 
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
-        weight = data.get('weight')
-
-        if temperature is None or humidity is None:
-            return jsonify({'status': 'error', 'message': 'Temperature and humidity are required'}), 400
-
-        if not isinstance(temperature, (int, float)) or not isinstance(humidity, (int, float)):
-            return jsonify({'status': 'error', 'message': 'Temperature and humidity must be numbers'}), 400
-
-        if weight is not None and (not isinstance(weight, (int, float)) or weight < 0):
-            return jsonify({'status': 'error', 'message': 'Weight must be a non-negative number'}), 400
-
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('''INSERT INTO sensor_data (temperature, humidity, weight, timestamp)
-                     VALUES (?, ?, ?, ?)''',
-                  (temperature, humidity, weight, current_time))
-        conn.commit()
-        
-        logger.info(f"Sensor data recorded: Temperature={temperature}, Humidity={humidity}, Weight={weight}")
-        
-        socketio.emit('new_sensor_data', {
-            'temperature': temperature,
-            'humidity': humidity,
-            'weight': weight,
-            'timestamp': current_time
-        }, namespace='/')
-
+        batch = isinstance(data, list)
+        items = data if batch else [data]
+        if len(items) > current_app.config['SENSOR_BATCH_MAX']:
+            return jsonify({'status': 'error',
+                            'message': f"At most {current_app.config['SENSOR_BATCH_MAX']} readings per batch"}), 400
+        readings = []
+        for i, item in enumerate(items):
+            reading, error = parse_reading(item, g.get('device_id'))
+            if error:
+                return jsonify({'status': 'error', 'message': f'Reading {i}: {error}' if batch else error}), 400
+            readings.append(reading)
+
+        stored, duplicates = store_readings(readings)
+
+        if batch:
+            return jsonify({'status': 'success', 'stored': len(stored), 'duplicates': duplicates})
+        if duplicates:
+            return jsonify({'status': 'success', 'message': 'Duplicate reading ignored', 'duplicate': True})
         return jsonify({'status': 'success', 'message': 'Sensor data received and stored'})
     except Exception as e:
-        logger.error(f"Error processing sensor data: {str(e)}", exc_info=True)
+        logger.error("Error processing sensor data: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @sensor_bp.route('/api/sensor_data', methods=['GET'])
 @login_required
+@cached_response(ttl=1, tags=(SENSOR,))
 def get_sensor_data_realtime():
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT * FROM sensor_data ORDER BY timestamp DESC LIMIT 1')
-        row = c.fetchone()
+        row = get_repos().sensors.latest()
 
         if row:
-            return jsonify({
-                'temperature': row['temperature'],
-                'humidity': row['humidity'],
-                'weight': row['weight'],
-                'timestamp': row['timestamp']
-            })
+            return jsonify(sensor_to_dict(row))
         logger.debug("No real-time sensor data available.")
         return jsonify({'status': 'error', 'message': 'No sensor data available'}), 404
     except Exception as e:
-        logger.error(f"Error retrieving real-time sensor data: {str(e)}", exc_info=True)
+        logger.error("Error retrieving real-time sensor data: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# Lists only readings older than an hour, which fresh readings do not change, so it is not
+# tagged SENSOR: the TTL alone keeps it current
 @sensor_bp.route('/api/sensor_data_history', methods=['GET'])
 @login_required
+@cached_response(ttl=60)
 def get_sensor_data_history():
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        cutoff_time = datetime.now() - timedelta(hours=1)
-        c.execute('''
-            SELECT * FROM sensor_data
-            WHERE timestamp <= ?
-            ORDER BY timestamp DESC
-        ''', (cutoff_time.strftime('%Y-%m-%d %H:%M:%S'),))
-        filtered_rows = c.fetchall()
-
-        historical = []
-        last_time = None
-        for row in filtered_rows:
-            current_time = datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
-
-            if last_time is None or (last_time - current_time).total_seconds() >= 3600:
-                historical.append({
-                    'temperature': row['temperature'],
-                    'humidity': row['humidity'],
-                    'weight': row['weight'],
-                    'timestamp': row['timestamp']
-                })
-                last_time = current_time
-
-            if len(historical) >= 10:
-                break
-
-        logger.info(f"Lấy được {len(historical)} bản ghi cảm biến lịch sử.")
+        historical = sensor_history(get_repos())
+
+        logger.info("Lấy được %s bản ghi cảm biến lịch sử.", len(historical))
         try:
             return jsonify(historical)
         except ConnectionResetError:
@@ -114,7 +205,7 @@ def get_sensor_data_history():
             return ("", 204)
 
     except Exception as e:
-        logger.error(f"Error retrieving sensor data history: {str(e)}", exc_info=True)
+        logger.error("Error retrieving sensor data history: %s", e, exc_info=True)
         try:
             return jsonify({'status': 'error', 'message': str(e)}), 500
         except ConnectionResetError:
@@ -0,0 +1,73 @@
+"""Socket.IO message queues for running several worker processes.
+
+With ``Config.SOCKETIO_MESSAGE_QUEUE`` set, every emit is published on the
+queue and each worker delivers it to its own connected clients. A worker can
+then emit to clients connected to any other worker. Flask-SocketIO picks the
+backend from the URL: ``redis://`` (needs ``redis``), ``kafka://``,
+``zmq+tcp://``, or anything else through Kombu (e.g. ``amqp://``, needs
+``kombu``). ``local://`` selects ``LocalManager`` below.
+"""
+import threading
+from collections import defaultdict
+import socketio as python_socketio
+
+_channels = defaultdict(list)
+_channels_lock = threading.Lock()
+
+
+class LocalManager(python_socketio.PubSubManager):
+    """In-process stand-in for a message queue.
+
+    Every manager on the same channel in this process shares one bus. Tests
+    can run several SocketIO servers side by side and check that an emit on
+    one reaches clients of the others, without Redis or a broker. It does not
+    cross process boundaries. ``close()`` takes the manager off the bus when
+    its server is shut down or replaced.
+    """
+    name = 'local'
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = None
+
+    def initialize(self):
+        if not self.write_only:
+            # The server's queue class blocks only the calling green thread under eventlet/gevent
+            self._inbox = self.server.eio.create_queue()
+            with _channels_lock:
+                _channels[self.channel].append(self._inbox)
+        super().initialize()
+
+    def close(self):
+        with _channels_lock:
+            inboxes = _channels.get(self.channel, [])
+            if self._inbox in inboxes:
+                inboxes.remove(self._inbox)
+            if not inboxes:
+                _channels.pop(self.channel, None)
+
+    def _publish(self, data):
+        with _channels_lock:
+            inboxes = list(_channels.get(self.channel, ()))
+        for inbox in inboxes:
+            if inbox is not self._inbox:
+                inbox.put(data)
+
+    def _listen(self):
+        # Once closed, nothing is put in the inbox and the listener stays idle
+        while True:
+            yield self._inbox.get()
+
+
+def socketio_options(config):
+    """Keyword arguments for ``socketio.init_app`` from the app config."""
+    options = {'async_mode': config['SOCKETIO_ASYNC_MODE']}
+    if config['SOCKETIO_SERIALIZER'] != 'default':
+        options['serializer'] = config['SOCKETIO_SERIALIZER']
+    url = config['SOCKETIO_MESSAGE_QUEUE']
+    if url and url.startswith('local://'):
+        options['client_manager'] = LocalManager(url, channel=config['SOCKETIO_CHANNEL'])
+    elif url:
+        options['message_queue'] = url
+        options['channel'] = config['SOCKETIO_CHANNEL']
+    return options
@@ -1,5 +1,10 @@
+import time
+from datetime import datetime
 from flask import flash, redirect, url_for, session
 
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+HOUR_MS = 3600 * 1000
+
 def login_required(f):
     """Decorator to require user login before accessing a route."""
     def wrap(*args, **kwargs):
@@ -8,4 +13,13 @@ def login_required(f):
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     wrap.__name__ = f.__name__
-    return wrap
\ No newline at end of file
+    return wrap
+
+def now_timestamp():
+    """Return the current time as (epoch milliseconds, local TIMESTAMP_FORMAT string)."""
+    ms = time.time_ns() // 1_000_000
+    return ms, format_timestamp(ms)
+
+def format_timestamp(ms):
+    """Format epoch milliseconds as the local-time string the API has always returned."""
+    return datetime.fromtimestamp(ms / 1000).strftime(TIMESTAMP_FORMAT)
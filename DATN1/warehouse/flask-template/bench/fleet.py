@@ -0,0 +1,237 @@
+"""Simulated ESP32 fleet: offline end-to-end load test against create_app().
+
+Runs N sensor nodes posting to /api/sensor, M cameras uploading QR images to
+/upload_image and K dashboard clients that poll the read API while holding a
+Socket.IO connection, all in-process on a throwaway database. Reports
+throughput and p50/p99 latency per route, plus the fan-out delay from a
+sensor POST to its 'new_sensor_data' event reaching each dashboard.
+
+    python bench/fleet.py --sensors 20 --cameras 4 --dashboards 10 --duration 30
+    python bench/fleet.py --compare bench/results/<earlier>.json
+
+Results are saved to bench/results/<time>-<commit>.json for comparison
+between commits. Fan-out delay includes up to --poll-ms of dashboard
+polling, so compare it between runs with the same setting.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe latency samples keyed by route."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, status=None):
+        with self._lock:
+            self.samples[route].append(seconds)
+            if status is not None:
+                self.statuses[route][status] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for route, values in sorted(self.samples.items()):
+            values = sorted(values)
+            report[route] = {
+                'count': len(values),
+                'throughput_per_s': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+                'statuses': dict(self.statuses.get(route, {})),
+            }
+        return report
+
+
+def qr_images(count):
+    """PNG bytes of distinct QR codes, encoded once up front."""
+    import cv2
+    encoder = cv2.QRCodeEncoder.create()
+    images = []
+    for i in range(count):
+        code = cv2.resize(encoder.encode(f'BENCH-{i}'), (300, 300), interpolation=cv2.INTER_NEAREST)
+        code = cv2.copyMakeBorder(code, 40, 40, 40, 40, cv2.BORDER_CONSTANT, value=255)
+        images.append(cv2.imencode('.png', code)[1].tobytes())
+    return images
+
+
+def sensor_node(app, node, args, recorder, sent, stop):
+    client = app.test_client()
+    interval = 1 / args.sensor_hz if args.sensor_hz else 0
+    seq = 0
+    while not stop.is_set():
+        seq += 1
+        # The weight doubles as a unique tag so dashboards can match the broadcast to this POST
+        weight = node * 1_000_000 + seq
+        start = time.perf_counter()
+        sent[weight] = start
+        response = client.post('/api/sensor', json={'temperature': 21.5, 'humidity': 40.0, 'weight': weight})
+        recorder.add('POST /api/sensor', time.perf_counter() - start, response.status_code)
+        if interval:
+            stop.wait(max(0, interval - (time.perf_counter() - start)))
+
+
+def camera(app, cam, args, recorder, images, stop):
+    client = app.test_client()
+    interval = 1 / args.camera_hz if args.camera_hz else 0
+    frame = 0
+    while not stop.is_set():
+        image = images[(cam + frame) % len(images)]
+        frame += 1
+        start = time.perf_counter()
+        response = client.post('/upload_image', content_type='multipart/form-data',
+                               data={'image': (io.BytesIO(image), f'cam{cam}.png')})
+        recorder.add('POST /upload_image', time.perf_counter() - start, response.status_code)
+        if interval:
+            stop.wait(max(0, interval - (time.perf_counter() - start)))
+
+
+def dashboard(app, socketio, args, recorder, fanout, sent, stop):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['flag'] = True
+    sio = socketio.test_client(app, flask_test_client=client)
+    routes = ('/api/sensor_data', '/api/latest_data', '/api/inventory', '/api/sensor_data_history')
+    next_poll = 0
+    turn = 0
+    while not stop.is_set():
+        now = time.perf_counter()
+        for event in sio.get_received('/'):
+            if event['name'] == 'new_sensor_data':
+                started = sent.get(event['args'][0]['weight'])
+                if started is not None:
+                    fanout.add('new_sensor_data', now - started)
+        if args.poll_hz and now >= next_poll:
+            route = routes[turn % len(routes)]
+            turn += 1
+            response = client.get(route)
+            recorder.add(f'GET {route}', time.perf_counter() - now, response.status_code)
+            next_poll = now + 1 / args.poll_hz
+        stop.wait(args.poll_ms / 1000)
+    sio.disconnect()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='fleet-')
+    os.chdir(workdir)
+    os.environ['DATABASE'] = os.path.join(workdir, 'bench.db')
+    os.environ['DEVICE_AUTH_REQUIRED'] = '0'
+    sys.path.insert(0, PROJECT_DIR)
+    from app import create_app
+
+    app, socketio = create_app()
+    if not args.rate_limits:
+        app.config['RATE_LIMITS'] = {}
+    images = qr_images(max(1, args.cameras))
+
+    recorder, fanout = Recorder(), Recorder()
+    sent = {}
+    stop = threading.Event()
+    threads = [threading.Thread(target=sensor_node, args=(app, i, args, recorder, sent, stop))
+               for i in range(args.sensors)]
+    threads += [threading.Thread(target=camera, args=(app, i, args, recorder, images, stop))
+                for i in range(args.cameras)]
+    threads += [threading.Thread(target=dashboard, args=(app, socketio, args, recorder, fanout, sent, stop))
+                for _ in range(args.dashboards)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'commit': git_commit(),
+        'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {name: getattr(args, name) for name in
+                   ('sensors', 'cameras', 'dashboards', 'duration', 'sensor_hz', 'camera_hz',
+                    'poll_hz', 'poll_ms', 'rate_limits')},
+        'elapsed_s': round(elapsed, 3),
+        'routes': recorder.summary(elapsed),
+        'fanout': fanout.summary(elapsed),
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"commit {result['commit']}  {result['elapsed_s']} s  {result['config']}")
+    for section in ('routes', 'fanout'):
+        print(f"\n{section}")
+        print(f"  {'name':32} {'count':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}  statuses")
+        for name, row in result[section].items():
+            line = (f"  {name:32} {row['count']:>7} {row['throughput_per_s']:>9} "
+                    f"{row['p50_ms']:>9} {row['p99_ms']:>9}  {row['statuses'] or ''}")
+            old = (baseline or {}).get(section, {}).get(name)
+            if old:
+                line += (f"  [p50 {row['p50_ms'] - old['p50_ms']:+.3f} ms,"
+                         f" p99 {row['p99_ms'] - old['p99_ms']:+.3f} ms,"
+                         f" req/s {row['throughput_per_s'] - old['throughput_per_s']:+.2f}]")
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sensors', type=int, default=10)
+    parser.add_argument('--cameras', type=int, default=2)
+    parser.add_argument('--dashboards', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--sensor-hz', type=float, default=1.0, help='per node; 0 = as fast as possible')
+    parser.add_argument('--camera-hz', type=float, default=2.0, help='per camera; 0 = as fast as possible')
+    parser.add_argument('--poll-hz', type=float, default=1.0, help='dashboard HTTP polls per second')
+    parser.add_argument('--poll-ms', type=float, default=5.0, help='dashboard Socket.IO receive poll interval')
+    parser.add_argument('--rate-limits', action='store_true', help='keep Config.RATE_LIMITS in force')
+    parser.add_argument('--compare', help='earlier result file to diff against')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    print_report(result, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nsaved {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,116 @@ import os
 import secrets
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', secrets.token_hex(16))
-    PERMANENT_SESSION_LIFETIME = timedelta(minutes=10)
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = timedelta(minutes=10)
+
+    # SQLite connection pool
+    DATABASE = os.getenv('DATABASE', os.path.join(basedir, 'database.db'))
+    DB_WRITE_POOL_SIZE = 2
+    DB_READ_POOL_SIZE = 4
+    DB_STATEMENT_CACHE = 256
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_CACHE_SIZE_KB = 16 * 1024
+    DB_MMAP_SIZE = 64 * 1024 * 1024
+    EPOCH_BACKFILL_BATCH = 5000
+
+    # Columnar archive of closed UTC days of sensor_data, memory-mapped by /api/sensor_archive
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(basedir, 'archive'))
+    ARCHIVE_GRACE_HOURS = 2
+    ARCHIVE_INTERVAL_SECONDS = 3600
+    ARCHIVE_MAX_BUCKETS = 10000
+
+    # Storage backend: 'sqlite' (raw sqlite3) or 'sqlalchemy' (SQLAlchemy Core)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///' + DATABASE)
+    SQLALCHEMY_POOL_SIZE = 5
+    SQLALCHEMY_MAX_OVERFLOW = 10
+    SQLALCHEMY_POOL_RECYCLE = 1800
+
+    # Read-API response cache; CACHE_TTLS overrides per endpoint, in seconds
+    CACHE_ENABLED = True
+    CACHE_MAX_ENTRIES = 256
+    CACHE_TTLS = {}
+
+    # Ingest routes (/api/sensor, /upload_image) require a per-device key header
+    DEVICE_AUTH_REQUIRED = os.getenv('DEVICE_AUTH_REQUIRED', '1') == '1'
+    DEVICE_KEY_HEADER = 'X-Device-Key'
+    # Background reload of keys changed through other workers (0 = only on this worker's changes)
+    DEVICE_KEY_REFRESH_SECONDS = 30
+
+    # Ingest admission control: endpoint -> (tokens per second, burst) per device/IP
+    RATE_LIMITS = {
+        'sensor.sensor_data_api': (5, 20),
+        'qr.upload_image': (15, 30),
+    }
+    RATE_LIMIT_MAX_BUCKETS = 10000
+    RATE_LIMIT_IDLE_SECONDS = 300
+    CONCURRENCY_LIMITS = {'image_decode': 4}
+
+    # Sensor ingest: readings carrying device_id + seq are deduplicated; seq must keep
+    # increasing across device reboots. /api/sensor also takes a JSON list of readings.
+    SENSOR_DEDUPE_WINDOW = 256  # out-of-order seqs remembered below each device's highest
+    SENSOR_DEDUPE_MAX_DEVICES = 10000
+    SENSOR_BATCH_MAX = 500
+
+    # Optional line-protocol sensor listener beside HTTP (see app/line_listener.py),
+    # e.g. udp://0.0.0.0:5140 or tcp://0.0.0.0:5140; empty = off
+    SENSOR_LISTENER = os.getenv('SENSOR_LISTENER', '')
+    SENSOR_LISTENER_BATCH_SIZE = 100
+    SENSOR_LISTENER_FLUSH_MS = 200
+    SENSOR_LISTENER_MAX_LINE = 256
+    SENSOR_LISTENER_IDLE_SECONDS = 300
+
+    # Scan-to-weight matching: a scan takes the closest stable run of readings from its scale
+    # within the tolerance, else the nearest reading; CAMERA_SCALES maps camera -> scale device_id
+    CORRELATION_WINDOW_SECONDS = 300
+    CORRELATION_TOLERANCE_MS = 3000
+    CORRELATION_STABLE_READINGS = 3
+    CORRELATION_STABLE_DELTA = 0.05
+    CAMERA_SCALES = {}
+
+    # Per-camera QR regions: decode a padded crop around recent hits before the full frame
+    QR_ROI_ENABLED = True
+    QR_ROI_PADDING = 0.5  # fraction of the region's size added on each side
+    QR_ROI_TTL_SECONDS = 30
+    QR_ROI_MAX_REGIONS = 3
+    QR_ROI_MAX_CAMERAS = 256
+
+    # Prometheus text endpoint at /metrics
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+    # Request profiling: admins send PROFILE_HEADER, or 1 in PROFILE_SAMPLE_RATE requests (0 = off)
+    PROFILE_HEADER = 'X-Profile'
+    PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_TOP_N = 25
+    PROFILE_RING_SIZE = 20
+    # Log storage calls slower than this, with their statements and route (0 = off; when set,
+    # every connection gets a statement trace callback)
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '0'))
+
+    # Logging: records are queued and written by a background listener thread
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = {'werkzeug': 'INFO', 'engineio.server': 'WARNING', 'socketio.server': 'WARNING'}
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+    LOG_QUEUE_SIZE = 10000
+
+    # Blueprints to register (see app.BLUEPRINTS); e.g. BLUEPRINTS=sensor,metrics for a sensor-only node
+    BLUEPRINTS = tuple(os.getenv('BLUEPRINTS',
+                                 'auth,main,sensor,qr,inventory,dashboard,devices,metrics,profiling,archive').split(','))
+    # None picks the best installed server (eventlet); probing and importing it is most of startup time
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE') or None
+    # 'msgpack' sends binary MessagePack frames instead of JSON text (needs `pip install msgpack`)
+    SOCKETIO_SERIALIZER = os.getenv('SOCKETIO_SERIALIZER', 'default')
+    # Rooms a client may join on connect (see app/events.py); DEVICE_ZONES maps device/camera id -> zone
+    SOCKETIO_MAX_TOPICS = 32
+    DEVICE_ZONES = {}
+
+    # Multi-worker deployments: a message queue URL (redis://, amqp://, kafka://, zmq+tcp://)
+    # lets any worker emit to clients of every worker; 'local://' is an in-process stand-in
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
+    SOCKETIO_CHANNEL = 'warehouse'
+    # Background jobs run on one worker at a time, holding a lease renewed within this interval
+    JOB_LEASE_SECONDS = 60
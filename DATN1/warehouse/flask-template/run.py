@@ -1,8 +1,7 @@
-import logging
+import os
 from app import create_app
-logging.basicConfig(level=logging.DEBUG)
      
 app, socketio = create_app()
      
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    socketio.run(app, debug=True, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
\ No newline at end of file
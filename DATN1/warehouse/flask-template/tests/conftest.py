@@ -0,0 +1,37 @@
+import pytest
+from flask import Flask
+from app.database import close_db
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    """A bare app on an empty database file: no blueprints, Socket.IO or background jobs."""
+    app = Flask(__name__)
+    app.config.from_object('config.Config')
+    app.config.update(DATABASE=str(tmp_path / 'test.db'), SLOW_QUERY_MS=0)
+    app.teardown_appcontext(close_db)
+    return app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build the full app on a test database; keyword arguments override Config settings."""
+    def make(**config):
+        from app import create_app
+        database = str(tmp_path / 'app.db')
+        settings = {
+            'DATABASE': database,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database,
+            'ARCHIVE_DIR': str(tmp_path / 'archive'),
+            'BLUEPRINTS': ('auth', 'sensor'),
+            'SOCKETIO_ASYNC_MODE': 'threading',
+            'DEVICE_AUTH_REQUIRED': False,
+            'DEVICE_KEY_REFRESH_SECONDS': 0,
+            'RATE_LIMITS': {},
+            'LOG_FORMAT': 'text',
+            'SLOW_QUERY_MS': 0,
+        }
+        settings.update(config)
+        app, _ = create_app(settings)
+        return app
+    return make
@@ -0,0 +1,85 @@
+import math
+import numpy as np
+import pytest
+from app.archive import DAY_MS, HOUR_MS, Buckets, SensorArchive, _archive_job, aggregate_range, archive_closed_days
+from app.database import get_db_connection
+from app.migrations import backfill_epoch_timestamps
+from app.repositories import get_repos
+
+DAY = 19_000
+START_MS = DAY * DAY_MS
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+def _store(*readings):
+    """(timestamp_ms, temperature, weight) readings; humidity is always 50."""
+    get_repos().sensors.insert_many([(temperature, 50.0, weight, ts, 'text', None, None)
+                                     for ts, temperature, weight in readings])
+
+
+def test_buckets_aggregate_segments_and_skip_missing_values():
+    buckets = Buckets(START_MS, START_MS + 3 * HOUR_MS, HOUR_MS)
+    buckets.add(np.array([START_MS, START_MS + 10, START_MS + HOUR_MS]),
+                {'temperature': [1.0, 3.0, 10.0], 'humidity': [50.0] * 3, 'weight': [math.nan, 2.0, math.nan]})
+    buckets.add(np.array([START_MS + HOUR_MS + 5]),
+                {'temperature': [20.0], 'humidity': [50.0], 'weight': [math.nan]})
+    first, second = buckets.to_list()
+    assert first['timestamp_ms'] == START_MS
+    assert first['temperature'] == {'count': 2, 'mean': 2.0, 'min': 1.0, 'max': 3.0}
+    assert first['weight'] == {'count': 1, 'mean': 2.0, 'min': 2.0, 'max': 2.0}
+    assert second['timestamp_ms'] == START_MS + HOUR_MS
+    assert second['temperature'] == {'count': 2, 'mean': 15.0, 'min': 10.0, 'max': 20.0}
+    # Buckets without any reading are left out; columns without values are None
+    assert second['weight'] is None
+
+
+def test_aggregate_range_reads_archived_days_and_the_database_tail(app):
+    _store((START_MS + HOUR_MS, 10.0, 1.0), (START_MS + DAY_MS + HOUR_MS, 20.0, None),
+           (START_MS + 2 * DAY_MS + HOUR_MS, 30.0, None))
+    archive = SensorArchive(app.config['ARCHIVE_DIR'])
+    # Day 2 is still open: only days 0 and 1 are archived
+    assert archive_closed_days(archive, get_repos(), START_MS + 2 * DAY_MS + 3 * HOUR_MS, HOUR_MS) == 2
+    assert archive.days() == [DAY, DAY + 1]
+    assert archive.archived_until_day() == DAY + 2
+
+    # Archived days are served from the archive, not the table
+    conn = get_db_connection(readonly=False)
+    conn.execute('UPDATE sensor_data SET temperature = -1 WHERE timestamp_ms < ?', (START_MS + 2 * DAY_MS,))
+    conn.commit()
+    buckets = aggregate_range(archive, get_repos(), START_MS, START_MS + 3 * DAY_MS, DAY_MS).to_list()
+    assert [bucket['temperature']['mean'] for bucket in buckets] == [10.0, 20.0, 30.0]
+    assert buckets[0]['weight']['mean'] == 1.0
+
+    # A range that starts inside an archived day takes only its slice
+    buckets = aggregate_range(archive, get_repos(), START_MS + 2 * HOUR_MS, START_MS + 3 * DAY_MS, DAY_MS)
+    assert [bucket['temperature']['mean'] for bucket in buckets.to_list()] == [20.0, 30.0]
+
+    # Nothing left to archive until day 2 closes
+    assert archive_closed_days(archive, get_repos(), START_MS + 2 * DAY_MS + 3 * HOUR_MS, HOUR_MS) == 0
+
+
+def test_unparseable_legacy_timestamps_do_not_start_the_archive_in_1970(app):
+    # backfill_epoch_timestamps stores 0 for text it cannot parse
+    _store((0, 5.0, None), (START_MS + HOUR_MS, 10.0, None))
+    archive = SensorArchive(app.config['ARCHIVE_DIR'])
+    assert archive_closed_days(archive, get_repos(), START_MS + DAY_MS + 3 * HOUR_MS, HOUR_MS) == 1
+    assert archive.days() == [DAY]
+
+
+def test_archive_waits_for_the_epoch_backfill(app):
+    _store((START_MS + HOUR_MS, 10.0, None))
+    conn = get_db_connection(readonly=False)
+    conn.execute("INSERT INTO sensor_data (temperature, humidity, timestamp) VALUES (20, 50, '2022-01-08 12:00:00')")
+    conn.commit()
+    archive = SensorArchive(app.config['ARCHIVE_DIR'])
+    assert _archive_job(app, lambda: None) == 0
+    assert archive.archived_until_day() is None
+
+    backfill_epoch_timestamps()
+    assert _archive_job(app, lambda: None) == 2
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: the test session itself may already have imported OpenCV
+SENSOR_NODE = '''
+import json, sys
+from app import create_app
+app, _ = create_app({
+    'DATABASE': sys.argv[1], 'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[1],
+    'ARCHIVE_DIR': sys.argv[2], 'BLUEPRINTS': ('sensor', 'devices', 'metrics'),
+    'SOCKETIO_ASYNC_MODE': 'threading', 'DEVICE_AUTH_REQUIRED': False, 'DEVICE_KEY_REFRESH_SECONDS': 0,
+    'LOG_FORMAT': 'text',
+})
+client = app.test_client()
+status = [client.post('/api/sensor', json={'temperature': 20.0, 'humidity': 50.0, 'weight': 1.5}).status_code,
+          client.get('/metrics').status_code]
+print(json.dumps({'status': status, 'loaded': sorted(m for m in ('cv2', 'numpy', 'PIL', 'app.qr')
+                                                         if m in sys.modules)}))
+'''
+
+
+def test_sensor_only_node_never_imports_the_vision_stack(tmp_path):
+    result = subprocess.run([sys.executable, '-c', SENSOR_NODE, str(tmp_path / 'app.db'), str(tmp_path / 'archive')],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report == {'status': [200, 200], 'loaded': []}
@@ -0,0 +1,27 @@
+from app.cache import SENSOR, TTLCache
+
+
+def test_entry_expires_or_goes_stale_on_invalidate(monkeypatch):
+    cache = TTLCache()
+    clock = [100.0]
+    monkeypatch.setattr('app.cache.time.monotonic', lambda: clock[0])
+    assert cache.get_or_set(('a',), lambda: 1, ttl=5, tags=(SENSOR,)) == 1
+    assert cache.get_or_set(('a',), lambda: 2, ttl=5, tags=(SENSOR,)) == 1
+    cache.invalidate(SENSOR)
+    assert cache.get_or_set(('a',), lambda: 3, ttl=5, tags=(SENSOR,)) == 3
+    clock[0] += 5
+    assert cache.get(('a',)) is None
+
+
+def test_write_during_compute_is_not_cached():
+    cache = TTLCache()
+
+    def compute():
+        # A reading is stored after the view read the table but before its result is cached
+        cache.invalidate(SENSOR)
+        return 'before the write'
+
+    assert cache.get_or_set(('a',), compute, ttl=60, tags=(SENSOR,)) == 'before the write'
+    assert cache.get(('a',)) is None
+    assert cache.get_or_set(('a',), lambda: 'after the write', ttl=60, tags=(SENSOR,)) == 'after the write'
+    assert cache.get(('a',)) == 'after the write'
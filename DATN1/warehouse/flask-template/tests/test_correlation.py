@@ -0,0 +1,145 @@
+import pytest
+from app import socketio
+from app.correlation import Match, ScanWeightCorrelator, _recheck, get_correlator, match_scan
+from app.database import get_db_connection
+from app.repositories import get_repos
+
+SCAN_MS = 1_700_000_000_000
+
+
+@pytest.fixture
+def correlator():
+    return ScanWeightCorrelator(window_ms=60_000, tolerance_ms=3000, stable_count=3, stable_delta=0.05,
+                                camera_scales={'cam-1': 'scale-1'})
+
+
+def _feed(correlator, scale, readings):
+    updates = []
+    for offset_ms, weight in readings:
+        updates += correlator.add_reading(scale, SCAN_MS + offset_ms, weight)
+    return updates
+
+
+def test_stable_run_beats_a_nearer_single_reading(correlator):
+    _feed(correlator, 'scale-1', [(-2500, 1.00), (-2000, 1.02), (-1500, 1.01), (-10, 4.0)])
+    assert correlator.match('scale-1', SCAN_MS) == Match(1.01, SCAN_MS - 1500, 'stable')
+
+
+def test_closest_stable_run_wins(correlator):
+    _feed(correlator, 'scale-1', [(-2900, 1.0), (-2800, 1.0), (-2700, 1.0), (500, 2.0), (600, 2.0), (700, 2.04)])
+    assert correlator.match('scale-1', SCAN_MS) == Match(2.013, SCAN_MS + 700, 'stable')
+
+
+def test_nearest_reading_without_a_stable_run(correlator):
+    _feed(correlator, 'scale-1', [(-1000, 1.0), (200, 2.0), (900, 3.0)])
+    assert correlator.match('scale-1', SCAN_MS) == Match(2.0, SCAN_MS + 200, 'nearest')
+
+
+def test_tolerance_edges(correlator):
+    _feed(correlator, 'scale-1', [(-3001, 1.0), (3001, 2.0)])
+    assert correlator.match('scale-1', SCAN_MS) is None
+    _feed(correlator, 'scale-1', [(3000, 3.0)])
+    assert correlator.match('scale-1', SCAN_MS) == Match(3.0, SCAN_MS + 3000, 'nearest')
+    assert correlator.match('scale-1', SCAN_MS - 6000) == Match(1.0, SCAN_MS - 3001, 'nearest')
+    assert correlator.match('scale-2', SCAN_MS) is None
+
+
+def test_late_readings_are_kept_in_order_and_old_ones_expire(correlator):
+    _feed(correlator, 'scale-1', [(0, 1.0), (2000, 2.0), (1000, 3.0)])
+    window = correlator._windows['scale-1']
+    assert window.times == [SCAN_MS, SCAN_MS + 1000, SCAN_MS + 2000]
+    _feed(correlator, 'scale-1', [(200_000, 4.0)])
+    assert correlator.match('scale-1', SCAN_MS) is None
+
+
+def test_scale_for_camera(correlator):
+    assert correlator.scale_for('cam-1') == 'scale-1'
+    assert correlator.scale_for('cam-2') is None
+    _feed(correlator, 'scale-9', [(0, 1.0)])
+    assert correlator.scale_for('cam-2') == 'scale-9'
+    assert correlator.scale_for('cam-1') == 'scale-1'
+
+
+def test_pending_scan_is_rematched_until_stable(correlator):
+    _feed(correlator, 'scale-1', [(-500, 1.0)])
+    match = correlator.match('scale-1', SCAN_MS)
+    correlator.watch(7, 'scale-1', 'Q1', SCAN_MS, match)
+    # Another scale's readings do not touch it
+    assert _feed(correlator, 'scale-2', [(100, 5.0)]) == []
+    assert _feed(correlator, 'scale-1', [(100, 2.0)]) == [(7, 'Q1', SCAN_MS, Match(2.0, SCAN_MS + 100, 'nearest'))]
+    assert _feed(correlator, 'scale-1', [(300, 2.0)]) == []
+    assert _feed(correlator, 'scale-1', [(400, 2.01)]) == [
+        (7, 'Q1', SCAN_MS, Match(2.003, SCAN_MS + 400, 'stable'))]
+    # Stable matches are final
+    assert 7 not in correlator._pending
+    assert _feed(correlator, 'scale-1', [(450, 2.0)]) == []
+
+
+def test_pending_scan_expires_after_the_tolerance(correlator):
+    correlator.watch(7, 'scale-1', 'Q1', SCAN_MS, None)
+    assert _feed(correlator, 'scale-1', [(3001, 2.0)]) == []
+    assert correlator._pending == {}
+    # Stable matches and unknown scales are never watched
+    correlator.watch(8, 'scale-1', 'Q2', SCAN_MS, Match(1.0, SCAN_MS, 'stable'))
+    correlator.watch(9, None, 'Q3', SCAN_MS, None)
+    assert correlator._pending == {}
+
+
+def test_match_stored_picks_the_scale_nearest_the_scan(correlator):
+    rows = [('scale-1', SCAN_MS - 2000, 1.0), ('scale-2', SCAN_MS - 100, 2.0), (None, SCAN_MS + 50, 3.0),
+            ('scale-2', SCAN_MS + 200, 2.02), ('scale-2', SCAN_MS + 300, 2.01)]
+    assert correlator.match_stored(rows, None, SCAN_MS) == ('default', Match(3.0, SCAN_MS + 50, 'nearest'))
+    assert correlator.match_stored(rows, 'scale-2', SCAN_MS) == ('scale-2', Match(2.01, SCAN_MS + 300, 'stable'))
+    assert correlator.match_stored(rows, 'scale-3', SCAN_MS) == ('scale-3', None)
+    assert correlator.match_stored([], None, SCAN_MS) == (None, None)
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(CAMERA_SCALES={'cam-1': 'scale-1'})
+    with app.app_context():
+        yield app
+
+
+def _store_weights(*readings):
+    get_repos().sensors.insert_many([(20.0, 50.0, weight, SCAN_MS + offset_ms, 'text', scale, None)
+                                     for scale, offset_ms, weight in readings])
+
+
+def test_match_scan_falls_back_to_readings_another_worker_stored(app):
+    # This worker's window is empty: the scale reported to another worker
+    _store_weights(('scale-1', -200, 5.0), ('scale-1', -100, 5.0), ('scale-1', 0, 5.01), ('scale-2', 10, 9.0))
+    assert match_scan(get_repos(), 'cam-1', SCAN_MS) == ('scale-1', Match(5.003, SCAN_MS, 'stable'))
+    # A window hit needs no query
+    get_correlator().add_reading('scale-1', SCAN_MS + 5, 6.0)
+    assert match_scan(get_repos(), 'cam-1', SCAN_MS) == ('scale-1', Match(6.0, SCAN_MS + 5, 'nearest'))
+
+
+def _scan_weight(pair_id):
+    return tuple(get_db_connection(readonly=False).execute(
+        'SELECT scale, weight, method FROM scan_weights WHERE id = ?', (pair_id,)).fetchone())
+
+
+def test_recheck_stores_a_better_match_from_the_database(app, monkeypatch):
+    monkeypatch.setattr(socketio, 'sleep', lambda seconds: None)
+    sent = []
+    monkeypatch.setattr('app.correlation.broadcast', lambda *args: sent.append(args))
+    repos = get_repos()
+    pair_id = repos.scans.record_weight('Q1', SCAN_MS, 'scale-1', 1.0, SCAN_MS - 2000, 'nearest')
+    _store_weights(('scale-1', 100, 2.0), ('scale-1', 200, 2.0), ('scale-1', 300, 2.0))
+
+    _recheck(app, pair_id, 'Q1', SCAN_MS, 'scale-1')
+    assert _scan_weight(pair_id) == ('scale-1', 2.0, 'stable')
+    assert [(event, data['weight'], topic) for event, data, topic, _ in sent] == [
+        ('scan_weight_updated', 2.0, 'qr-scans')]
+
+
+def test_recheck_leaves_matches_this_worker_already_stored(app, monkeypatch):
+    monkeypatch.setattr(socketio, 'sleep', lambda seconds: None)
+    sent = []
+    monkeypatch.setattr('app.correlation.broadcast', lambda *args: sent.append(args))
+    pair_id = get_repos().scans.record_weight('Q1', SCAN_MS, 'scale-1', 2.0, SCAN_MS + 100, 'nearest')
+    _store_weights(('scale-1', 100, 2.0))
+    get_correlator().add_reading('scale-1', SCAN_MS + 100, 2.0)
+    _recheck(app, pair_id, 'Q1', SCAN_MS, 'scale-1')
+    assert sent == []
@@ -0,0 +1,49 @@
+from app.dedupe import DUPLICATE, NEW, UNKNOWN, SeqDeduper
+
+
+def test_unseen_device_is_left_to_the_index():
+    deduper = SeqDeduper(window=4)
+    assert deduper.check('esp', 1) == UNKNOWN
+    # check() records nothing
+    assert deduper.check('esp', 1) == UNKNOWN
+
+
+def test_high_water_mark_and_window():
+    deduper = SeqDeduper(window=4)
+    deduper.record('esp', 10)
+    assert deduper.check('esp', 10) == DUPLICATE
+    assert deduper.check('esp', 11) == NEW
+    # Late arrivals inside the window are new until recorded
+    assert deduper.check('esp', 8) == NEW
+    deduper.record('esp', 8)
+    assert deduper.check('esp', 8) == DUPLICATE
+    # At or below high - window only the unique index can tell
+    assert deduper.check('esp', 6) == UNKNOWN
+    assert deduper.check('esp', 2) == UNKNOWN
+
+    deduper.record('esp', 20)
+    assert deduper.check('esp', 10) == UNKNOWN
+    assert deduper.check('esp', 20) == DUPLICATE
+    assert deduper.check('esp', 19) == NEW
+    assert deduper.check('other', 20) == UNKNOWN
+
+
+def test_seen_set_is_trimmed_below_the_window():
+    deduper = SeqDeduper(window=4)
+    for seq in range(100):
+        deduper.record('esp', seq)
+    assert all(seq > 99 - 4 for seq in deduper._devices['esp'].seen)
+    assert deduper.check('esp', 99) == DUPLICATE
+    assert deduper.check('esp', 97) == DUPLICATE
+
+
+def test_least_recently_seen_device_is_evicted():
+    deduper = SeqDeduper(window=4, max_devices=2)
+    deduper.record('a', 1)
+    deduper.record('b', 1)
+    deduper.record('a', 2)
+    deduper.record('c', 1)
+    assert deduper.device_count() == 2
+    assert deduper.check('a', 2) == DUPLICATE
+    assert deduper.check('b', 1) == UNKNOWN
+    assert deduper.check('c', 1) == DUPLICATE
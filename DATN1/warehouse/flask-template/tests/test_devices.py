@@ -0,0 +1,99 @@
+import time
+import pytest
+from app.devices import get_registry, hash_key
+from app.repositories import get_repos
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(BLUEPRINTS=('auth', 'sensor', 'devices'), DEVICE_AUTH_REQUIRED=True)
+
+
+@pytest.fixture
+def admin(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['flag'] = True
+    return client
+
+
+def _post_reading(client, key=None):
+    headers = {'X-Device-Key': key} if key is not None else {}
+    return client.post('/api/sensor', json={'temperature': 20.0, 'humidity': 50.0}, headers=headers)
+
+
+def test_missing_or_invalid_key_is_rejected(app):
+    client = app.test_client()
+    assert _post_reading(client).status_code == 401
+    assert _post_reading(client, '').status_code == 401
+    response = _post_reading(client, 'not-a-key')
+    assert response.status_code == 401
+    assert response.json == {'status': 'error', 'message': 'Missing or invalid device key'}
+
+
+def test_issued_key_is_accepted_and_names_the_device(app, admin):
+    response = admin.post('/api/devices', json={'device_id': 'scale-1'})
+    assert response.json['header'] == 'X-Device-Key'
+    assert _post_reading(app.test_client(), response.json['key']).status_code == 200
+    with app.app_context():
+        assert get_repos().sensors.latest()['temperature'] == 20.0
+    assert admin.get('/api/devices').json == ['scale-1']
+
+
+def test_rotated_key_replaces_the_old_one(app, admin):
+    old = admin.post('/api/devices', json={'device_id': 'scale-1'}).json['key']
+    new = admin.post('/api/devices', json={'device_id': 'scale-1'}).json['key']
+    client = app.test_client()
+    assert _post_reading(client, old).status_code == 401
+    assert _post_reading(client, new).status_code == 200
+
+
+def test_revoked_key_is_rejected(app, admin):
+    key = admin.post('/api/devices', json={'device_id': 'scale-1'}).json['key']
+    assert admin.delete('/api/devices/scale-1').json['status'] == 'success'
+    assert _post_reading(app.test_client(), key).status_code == 401
+    assert admin.delete('/api/devices/scale-1').status_code == 404
+    assert admin.get('/api/devices').json == []
+
+
+def test_device_routes_need_an_admin(app):
+    client = app.test_client()
+    assert client.get('/api/devices').status_code == 302
+    assert client.post('/api/devices', json={'device_id': 'scale-1'}).status_code == 302
+    assert client.delete('/api/devices/scale-1').status_code == 302
+
+
+def test_device_id_is_required(admin):
+    for body in ({}, {'device_id': ''}, {'device_id': 7}):
+        response = admin.post('/api/devices', json=body)
+        assert response.status_code == 400
+        assert response.json['message'] == 'device_id is required'
+
+
+def test_verify_never_queries_the_database(app):
+    with app.app_context():
+        get_repos().devices.set_key('scale-1', hash_key('key'), 0)
+        # Issued through another worker: unknown here until the next reload
+        assert get_registry().verify('key') is None
+        get_registry().reload()
+        assert get_registry().verify('key') == 'scale-1'
+
+
+def test_keys_from_other_workers_are_picked_up_in_the_background(make_app):
+    app = make_app(DEVICE_AUTH_REQUIRED=True, DEVICE_KEY_REFRESH_SECONDS=0.01)
+    try:
+        with app.app_context():
+            get_repos().devices.set_key('scale-1', hash_key('key'), 0)
+        deadline = time.monotonic() + 2
+        while _post_reading(app.test_client(), 'key').status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _post_reading(app.test_client(), 'key').status_code == 200
+        with app.app_context():
+            get_repos().devices.delete('scale-1')
+        deadline = time.monotonic() + 2
+        while _post_reading(app.test_client(), 'key').status_code != 401 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _post_reading(app.test_client(), 'key').status_code == 401
+    finally:
+        # Stops the refresh task
+        app.extensions.pop('device_keys')
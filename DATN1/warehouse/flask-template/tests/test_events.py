@@ -0,0 +1,64 @@
+import pytest
+from app import socketio
+from app.events import TOPICS, broadcast
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(DEVICE_ZONES={'scale-1': 'zone-A', 'cam-1': 'zone-A'}, SOCKETIO_MAX_TOPICS=3)
+
+
+def _events(client):
+    return [(message['name'], message['args'][0]['n']) for message in client.get_received()]
+
+
+def _broadcast_all(app):
+    with app.app_context():
+        broadcast('new_sensor_data', {'n': 1}, 'sensors', 'scale-1')
+        broadcast('new_sensor_data', {'n': 2}, 'sensors', 'scale-2')
+        broadcast('new_qr_scan', {'n': 3}, 'qr-scans', 'cam-1')
+        broadcast('inventory_updated', {'n': 4}, 'inventory')
+
+
+def test_topic_source_and_zone_rooms(app):
+    every = socketio.test_client(app, auth={'topics': ['sensors']})
+    device = socketio.test_client(app, auth={'topics': ['sensors/scale-2']})
+    zone = socketio.test_client(app, auth={'topics': ['sensors/zone-A', 'qr-scans/zone-A']})
+    query = socketio.test_client(app, query_string='topics=inventory,sensors/scale-1')
+    _broadcast_all(app)
+    assert _events(every) == [('new_sensor_data', 1), ('new_sensor_data', 2)]
+    assert _events(device) == [('new_sensor_data', 2)]
+    assert _events(zone) == [('new_sensor_data', 1), ('new_qr_scan', 3)]
+    assert _events(query) == [('new_sensor_data', 1), ('inventory_updated', 4)]
+
+
+def test_member_of_several_matching_rooms_gets_each_event_once(app):
+    client = socketio.test_client(app, auth={'topics': ['sensors', 'sensors/scale-1', 'sensors/zone-A']})
+    _broadcast_all(app)
+    assert _events(client) == [('new_sensor_data', 1), ('new_sensor_data', 2)]
+
+
+def test_no_topics_joins_every_topic(app):
+    clients = [socketio.test_client(app), socketio.test_client(app, auth={'token': 'x'})]
+    _broadcast_all(app)
+    for client in clients:
+        assert _events(client) == [('new_sensor_data', 1), ('new_sensor_data', 2), ('new_qr_scan', 3),
+                                   ('inventory_updated', 4)]
+    assert len(TOPICS) == 3
+
+
+def test_unknown_topics_are_ignored(app):
+    client = socketio.test_client(app, auth={'topics': ['bogus/scale-1', 7, 'inventory']})
+    empty = socketio.test_client(app, auth={'topics': ['bogus']})
+    _broadcast_all(app)
+    assert _events(client) == [('inventory_updated', 4)]
+    # Asking only for unknown topics joins nothing rather than everything
+    assert _events(empty) == []
+
+
+def test_topics_beyond_the_cap_are_ignored(app):
+    client = socketio.test_client(app, auth={'topics': ['sensors/scale-2', 'sensors/scale-2', 'bogus',
+                                                        'qr-scans', 'inventory']})
+    _broadcast_all(app)
+    # Only the first SOCKETIO_MAX_TOPICS entries count, valid or not
+    assert _events(client) == [('new_sensor_data', 2)]
@@ -0,0 +1,35 @@
+from app.database import init_db
+from app.jobs import acquire_lease, run_exclusive
+from app.migrations import run_migrations
+
+
+def test_job_skipped_while_another_worker_holds_the_lease(db_app):
+    with db_app.app_context():
+        init_db()
+        run_migrations()
+        assert acquire_lease('job', 60, owner='other')
+    assert run_exclusive(db_app, 'job', lambda renew: 'ran') is None
+
+
+def test_job_stops_when_its_lease_is_taken_over(db_app):
+    with db_app.app_context():
+        init_db()
+        run_migrations()
+    done = []
+
+    def job(renew):
+        for step in range(3):
+            renew()
+            done.append(step)
+            if step == 0:
+                # The holder stalled past its TTL and another worker took the job over
+                with db_app.app_context():
+                    assert acquire_lease('job', -1)
+                    assert acquire_lease('job', 60, owner='other')
+        return 'finished'
+
+    assert run_exclusive(db_app, 'job', job) is None
+    assert done == [0]
+    with db_app.app_context():
+        # The new holder keeps its lease
+        assert not acquire_lease('job', 60)
@@ -0,0 +1,136 @@
+import socket
+import time
+import pytest
+from app.database import get_db_connection
+from app.devices import get_registry, hash_key
+from app.line_listener import SensorLineListener, parse_line, start_listener
+from app.metrics import LISTENER_LINE_ERRORS, LISTENER_PACKETS
+from app.repositories import get_repos
+from app.sensor import store_readings
+from app.utils import now_timestamp
+
+
+def _rows(app):
+    with app.app_context():
+        return [tuple(row) for row in get_db_connection(readonly=False).execute(
+            'SELECT device_id, seq, temperature, weight FROM sensor_data ORDER BY id')]
+
+
+def _errors(reason):
+    return LISTENER_LINE_ERRORS.value(reason)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_parse_line():
+    assert parse_line('esp 1700000000000 21.5 40') == ('esp', {
+        'timestamp_ms': 1700000000000, 'temperature': 21.5, 'humidity': 40.0, 'weight': None, 'seq': None})
+    assert parse_line('esp - 21.5 40 1.25 7') == ('esp', {
+        'timestamp_ms': None, 'temperature': 21.5, 'humidity': 40.0, 'weight': 1.25, 'seq': 7})
+    assert parse_line('esp - 21.5 40 - 7')[1]['weight'] is None
+    for line in ('esp 1 2', 'esp - 1 2 3 4 5', 'esp - warm 40', 'esp x 21 40', 'esp - 21 40 - 1.5'):
+        with pytest.raises(ValueError):
+            parse_line(line)
+
+
+@pytest.fixture
+def listener(make_app):
+    def make(**config):
+        app = make_app(**config)
+        return SensorLineListener(app, 'udp', '127.0.0.1', 0)
+    return make
+
+
+def test_valid_lines_are_stored_and_bad_ones_counted(listener):
+    udp = listener(SENSOR_LISTENER_BATCH_SIZE=100)
+    future_ms = now_timestamp()[0] + 3_600_000
+    errors = {reason: _errors(reason) for reason in ('malformed', 'invalid')}
+    packets = LISTENER_PACKETS.value('udp', 'error')
+    udp.handle_packet(b'\n'.join([
+        b'# comment lines and blank lines are skipped',
+        b'',
+        b'esp - 21.5 40 1.25 7',
+        b'esp - 21.5 40 - 7',
+        b'esp - 21.5',
+        b'esp - 21.5 40 -1',
+        b'esp %d 21.5 40' % future_ms,
+        b'esp - 21.5 40 - -3',
+        b'\xff\xfe - 1 2',
+        b'other - 22 41',
+    ]))
+    assert _errors('malformed') - errors['malformed'] == 2
+    assert _errors('invalid') - errors['invalid'] == 3
+    assert LISTENER_PACKETS.value('udp', 'error') == packets + 1
+    assert _rows(udp.app) == []
+    udp.flush()
+    # The replayed seq is dropped by the dedupe, as over HTTP
+    assert _rows(udp.app) == [('esp', 7, 21.5, 1.25), ('other', None, 22.0, None)]
+
+
+def test_device_field_is_the_device_id_without_auth(listener):
+    udp = listener(DEVICE_AUTH_REQUIRED=False)
+    udp.handle_packet(b'scale-1 - 20 50 1.5 1\n')
+    udp.flush()
+    assert _rows(udp.app) == [('scale-1', 1, 20.0, 1.5)]
+
+
+def test_device_field_is_the_key_with_auth(listener):
+    udp = listener(DEVICE_AUTH_REQUIRED=True)
+    with udp.app.app_context():
+        get_repos().devices.set_key('scale-1', hash_key('secret-key'), 0)
+        get_registry().reload()
+    unauthorized = _errors('unauthorized')
+    udp.handle_packet(b'secret-key - 20 50 1.5 1\nscale-1 - 20 50 1.5 2\nwrong - 20 50\n')
+    udp.flush()
+    # The key resolves to its device; a bare device_id is not a key
+    assert _rows(udp.app) == [('scale-1', 1, 20.0, 1.5)]
+    assert _errors('unauthorized') - unauthorized == 2
+
+
+def test_flushes_when_the_batch_is_full(listener, monkeypatch):
+    batches = []
+    monkeypatch.setattr('app.line_listener.store_readings',
+                        lambda readings: (batches.append(len(readings)), store_readings(readings))[1])
+    udp = listener(SENSOR_LISTENER_BATCH_SIZE=3)
+    udp.handle_packet(b'a - 20 50\nb - 20 50\n')
+    assert batches == []
+    udp.handle_packet(b'c - 20 50\nd - 20 50\n')
+    assert batches == [4]
+    assert len(_rows(udp.app)) == 4
+    udp.flush()
+    assert batches == [4]
+
+
+def test_flushes_on_time_over_udp(make_app):
+    app = make_app(SENSOR_LISTENER='udp://127.0.0.1:0', SENSOR_LISTENER_BATCH_SIZE=100,
+                   SENSOR_LISTENER_FLUSH_MS=20)
+    port = app.extensions['sensor_listener'].port
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.sendto(b'esp - 20 50 - 1\nesp - 21 50 - 2\n', ('127.0.0.1', port))
+    assert _wait_for(lambda: len(_rows(app)) == 2)
+
+
+def test_tcp_closes_connections_with_overlong_lines(make_app):
+    app = make_app(SENSOR_LISTENER='tcp://127.0.0.1:0', SENSOR_LISTENER_MAX_LINE=32,
+                   SENSOR_LISTENER_FLUSH_MS=20)
+    port = app.extensions['sensor_listener'].port
+    too_long = _errors('too_long')
+    with socket.create_connection(('127.0.0.1', port), timeout=2) as client:
+        client.sendall(b'esp - 20 50\n' + b'x' * 64)
+        assert client.recv(1) == b''
+    assert _errors('too_long') == too_long + 1
+    # Complete lines before the overlong one were still taken
+    assert _wait_for(lambda: _rows(app) == [('esp', None, 20.0, None)])
+
+
+def test_listener_url_is_validated(make_app):
+    app = make_app()
+    for url in ('http://127.0.0.1:5140', 'udp://127.0.0.1'):
+        app.config['SENSOR_LISTENER'] = url
+        with pytest.raises(ValueError):
+            start_listener(app)
@@ -0,0 +1,59 @@
+import json
+import logging
+import queue
+import sys
+from app.logs import LOG_RECORDS_DROPPED, JSONFormatter, NonBlockingQueueHandler
+
+
+def _record(msg='Stored %d readings from %s', args=(3, 'scale-1'), level=logging.INFO, exc_info=None, **extra):
+    return logging.getLogger('app.test').makeRecord('app.test', level, __file__, 1, msg, args, exc_info, extra=extra)
+
+
+def _error():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_json_line_has_the_message_and_extra_fields():
+    entry = json.loads(JSONFormatter().format(_record(device_id='scale-1', rows=3, when=object())))
+    assert entry['level'] == 'INFO'
+    assert entry['logger'] == 'app.test'
+    assert entry['msg'] == 'Stored 3 readings from scale-1'
+    assert (entry['device_id'], entry['rows']) == ('scale-1', 3)
+    # Values JSON cannot encode are written with str()
+    assert entry['when'].startswith('<object object')
+    assert len(entry['ts']) == len('2026-01-01T00:00:00.000')
+    assert 'exc' not in entry and 'args' not in entry
+
+
+def test_json_line_carries_the_traceback():
+    line = JSONFormatter().format(_record(level=logging.ERROR, exc_info=_error()))
+    assert '\n' not in line
+    assert json.loads(line)['exc'].endswith('ValueError: boom')
+
+
+def test_plain_args_are_formatted_on_the_listener():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    record = handler.prepare(_record())
+    assert (record.msg, record.args) == ('Stored %d readings from %s', (3, 'scale-1'))
+
+
+def test_mutable_args_and_tracebacks_are_captured_on_the_caller():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    rows = [1, 2]
+    record = handler.prepare(_record('Rows %s', (rows,), exc_info=_error()))
+    rows.append(3)
+    assert (record.msg, record.args, record.exc_info) == ('Rows [1, 2]', None, None)
+    assert json.loads(JSONFormatter().format(record))['exc'].endswith('ValueError: boom')
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    log_queue = queue.Queue(maxsize=2)
+    handler = NonBlockingQueueHandler(log_queue)
+    before = LOG_RECORDS_DROPPED.value()
+    for i in range(5):
+        handler.handle(_record('Record %d', (i,)))
+    assert [log_queue.get_nowait().getMessage() for _ in range(2)] == ['Record 0', 'Record 1']
+    assert LOG_RECORDS_DROPPED.value() == before + 3
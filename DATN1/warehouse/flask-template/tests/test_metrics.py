@@ -0,0 +1,41 @@
+import threading
+from app import metrics
+from app.metrics import Counter, Histogram
+
+
+def test_render_while_new_series_are_added(monkeypatch):
+    monkeypatch.setattr(metrics, 'REGISTRY', [])
+    counter = Counter('test_total', 'Test counter.', ('n',))
+    histogram = Histogram('test_seconds', 'Test histogram.', ('n',))
+    stop = threading.Event()
+
+    def writer():
+        n = 0
+        # New label values keep arriving, but the series stay few enough to render quickly
+        while not stop.is_set():
+            counter.inc(n % 100)
+            histogram.observe(0.01, n % 100)
+            n += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(200):
+            counter.render()
+            histogram.render()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_render_format(monkeypatch):
+    monkeypatch.setattr(metrics, 'REGISTRY', [])
+    counter = Counter('test_total', 'Test counter.', ('stage',))
+    counter.inc('a"b', amount=2)
+    assert counter.render() == ['# HELP test_total Test counter.', '# TYPE test_total counter',
+                                'test_total{stage="a\\"b"} 2']
+    histogram = Histogram('test_seconds', 'Test histogram.', buckets=(0.1, 1.0))
+    histogram.observe(0.5)
+    assert histogram.render()[2:] == ['test_seconds_bucket{le="0.1"} 0', 'test_seconds_bucket{le="1.0"} 1',
+                                      'test_seconds_bucket{le="+Inf"} 1', 'test_seconds_sum 0.5',
+                                      'test_seconds_count 1']
@@ -0,0 +1,110 @@
+import sqlite3
+import pytest
+from app.database import get_db_connection, init_db
+from app.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+LATEST = MIGRATIONS[-1][0]
+
+# Hot queries as the sqlite repositories issue them -> the index (and constraint) the plan must use
+HOT_QUERIES = [
+    ('SELECT * FROM sensor_data ORDER BY timestamp_ms DESC LIMIT 1', (),
+     'INDEX idx_sensor_data_timestamp_ms'),
+    ('SELECT weight FROM sensor_data ORDER BY timestamp_ms DESC LIMIT 1', (),
+     'INDEX idx_sensor_data_timestamp_ms'),
+    ('''SELECT timestamp_ms, temperature, humidity, weight FROM sensor_data
+        WHERE timestamp_ms >= ? AND timestamp_ms < ? ORDER BY timestamp_ms''', (0, 1),
+     'INDEX idx_sensor_data_timestamp_ms (timestamp_ms>? AND timestamp_ms<?)'),
+    ('SELECT device_id, timestamp_ms, weight FROM sensor_data '
+     'WHERE timestamp_ms >= ? AND timestamp_ms <= ? AND weight IS NOT NULL ORDER BY timestamp_ms', (0, 1),
+     'INDEX idx_sensor_data_timestamp_ms (timestamp_ms>? AND timestamp_ms<?)'),
+    ('SELECT qr_code, name, timestamp FROM QRdate ORDER BY timestamp_ms DESC LIMIT 1', (),
+     'INDEX idx_qrdate_timestamp_ms'),
+    ('SELECT * FROM inventory ORDER BY timestamp_ms DESC LIMIT ?', (10,),
+     'INDEX idx_inventory_timestamp_ms'),
+    ('SELECT name FROM inventory WHERE qr_code = ? LIMIT 1', ('Q',),
+     'INDEX sqlite_autoindex_inventory_1 (qr_code=?)'),
+    ('SELECT quantity FROM inventory WHERE qr_code = ? AND name = ?', ('Q', 'n'),
+     'INDEX sqlite_autoindex_inventory_1 (qr_code=? AND name=?)'),
+    ('SELECT id FROM scan_weights WHERE scan_ms >= ?', (0,),
+     'INDEX idx_scan_weights_scan_ms (scan_ms>?)'),
+    ('SELECT id FROM sensor_data WHERE device_id = ? AND seq = ? AND seq IS NOT NULL', ('esp', 1),
+     'INDEX idx_sensor_data_device_seq (device_id=? AND seq=?)'),
+]
+
+
+def _create_legacy_schema(conn):
+    """The schema and data of a database.db from before migrations existed."""
+    conn.executescript('''
+        CREATE TABLE admin (admin_id TEXT PRIMARY KEY, password TEXT, tel TEXT, job_num TEXT);
+        CREATE TABLE inventory (id INTEGER PRIMARY KEY, qr_code TEXT, name TEXT, weight REAL,
+                                quantity INTEGER DEFAULT 1, timestamp TEXT, UNIQUE(qr_code, name));
+        CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, temperature REAL, humidity REAL, weight REAL,
+                                  timestamp TEXT);
+        CREATE TABLE QRdate (id INTEGER PRIMARY KEY, qr_code TEXT UNIQUE, name TEXT, timestamp TEXT);
+        INSERT INTO sensor_data (temperature, humidity, weight, timestamp)
+            VALUES (21.5, 40, 1.2, '2024-01-02 03:04:05');
+        INSERT INTO inventory (qr_code, name, weight, timestamp) VALUES ('Q', 'n', 1.0, '2024-01-02 03:04:05');
+        INSERT INTO QRdate (qr_code, name, timestamp) VALUES ('Q', 'QR Item', '2024-01-02 03:04:05');
+    ''')
+    conn.commit()
+
+
+@pytest.fixture(params=['fresh', 'legacy'])
+def migrated(request, db_app):
+    with db_app.app_context():
+        conn = get_db_connection(readonly=False)
+        if request.param == 'legacy':
+            _create_legacy_schema(conn)
+        init_db()
+        assert run_migrations() == len(MIGRATIONS)
+        yield conn
+
+
+def test_migrations_reach_latest_version(migrated):
+    assert get_schema_version(migrated) == LATEST
+    # Already at the latest version: nothing left to apply
+    assert run_migrations() == 0
+
+
+def test_legacy_rows_survive(db_app):
+    with db_app.app_context():
+        conn = get_db_connection(readonly=False)
+        _create_legacy_schema(conn)
+        init_db()
+        run_migrations()
+        row = conn.execute('SELECT temperature, timestamp, device_id, seq FROM sensor_data').fetchone()
+        assert tuple(row) == (21.5, '2024-01-02 03:04:05', None, None)
+        assert conn.execute('SELECT quantity FROM inventory WHERE qr_code = ?', ('Q',)).fetchone()[0] == 1
+
+
+@pytest.mark.parametrize('sql, params, expected', HOT_QUERIES)
+def test_hot_query_uses_index(migrated, sql, params, expected):
+    plan = ' | '.join(row['detail'] for row in migrated.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+    assert expected in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_seq_index_rejects_replays_only(migrated):
+    insert = 'INSERT OR IGNORE INTO sensor_data (temperature, humidity, device_id, seq) VALUES (1, 2, ?, ?)'
+    assert migrated.execute(insert, ('esp', 1)).rowcount == 1
+    assert migrated.execute(insert, ('esp', 1)).rowcount == 0
+    assert migrated.execute(insert, ('other', 1)).rowcount == 1
+    # Readings without a seq are never deduplicated
+    assert migrated.execute(insert, ('esp', None)).rowcount == 1
+    assert migrated.execute(insert, ('esp', None)).rowcount == 1
+    migrated.rollback()
+
+
+def test_failed_migration_rolls_back(db_app, monkeypatch):
+    def broken(conn):
+        conn.execute('CREATE TABLE half_done (id INTEGER)')
+        conn.execute('SELECT * FROM missing_table')
+
+    monkeypatch.setattr('app.migrations.MIGRATIONS', MIGRATIONS + [(LATEST + 1, 'broken', broken)])
+    with db_app.app_context():
+        init_db()
+        with pytest.raises(sqlite3.OperationalError):
+            run_migrations()
+        conn = get_db_connection(readonly=False)
+        assert get_schema_version(conn) == LATEST
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
@@ -0,0 +1,65 @@
+import pytest
+from app.profiling import RequestProfiler, get_profiler
+
+
+def test_sampling_picks_one_in_n_requests():
+    assert [RequestProfiler(sample_rate=3).sampled() for _ in range(3)] == [False] * 3
+    profiler = RequestProfiler(sample_rate=3)
+    assert [profiler.sampled() for _ in range(7)] == [False, False, True, False, False, True, False]
+    assert not any(RequestProfiler(sample_rate=0).sampled() for _ in range(10))
+
+
+def test_one_profile_at_a_time():
+    profiler = RequestProfiler()
+    profile = profiler.start()
+    assert profiler.start() is None
+    profiler.discard(profile)
+    profile = profiler.start()
+    assert profile is not None
+    profiler.finish(profile, 0.0)
+
+
+def test_ring_keeps_the_last_profiles():
+    profiler = RequestProfiler(top_n=3, ring_size=2)
+    for path in ('/a', '/b', '/c'):
+        profiler.finish(profiler.start(), 0.0, path=path)
+    assert [(record['id'], record['path']) for record in profiler.profiles] == [(2, '/b'), (3, '/c')]
+    assert all(len(record['top']) <= 3 for record in profiler.profiles)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(BLUEPRINTS=('auth', 'sensor', 'profiling'))
+
+
+def _admin(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['flag'] = True
+    return client
+
+
+def test_profile_header_needs_an_admin(app):
+    response = app.test_client().get('/api/sensor', headers={'X-Profile': '1'})
+    assert 'X-Profile-Id' not in response.headers
+    assert not get_profiler(app).profiles
+
+    admin = _admin(app)
+    assert 'X-Profile-Id' not in admin.get('/api/sensor').headers
+    response = admin.get('/api/sensor', headers={'X-Profile': '1'})
+    assert response.headers['X-Profile-Id'] == '1'
+    profiles = admin.get('/api/profiles').json
+    assert [(p['id'], p['path'], p['status']) for p in profiles] == [(1, '/api/sensor', response.status_code)]
+    assert profiles[0]['top']
+
+
+def test_sampled_requests_are_profiled(make_app):
+    app = make_app(BLUEPRINTS=('auth', 'sensor', 'profiling'), PROFILE_SAMPLE_RATE=2, PROFILE_RING_SIZE=2)
+    client = app.test_client()
+    ids = [client.get('/api/sensor').headers.get('X-Profile-Id') for _ in range(6)]
+    assert ids == [None, '1', None, '2', None, '3']
+    assert [p['id'] for p in get_profiler(app).profiles] == [2, 3]
+
+
+def test_profiles_need_an_admin(app):
+    assert app.test_client().get('/api/profiles').status_code == 302
@@ -0,0 +1,94 @@
+import io
+import pytest
+from app import ratelimit
+from app.metrics import RATE_LIMIT_REJECTIONS
+from app.ratelimit import ConcurrencyLimiter, TokenBucketLimiter, get_concurrency_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    limiter = TokenBucketLimiter()
+    assert [limiter.check('route', 'a', 2, 3) for _ in range(3)] == [0, 0, 0]
+    assert limiter.check('route', 'a', 2, 3) == pytest.approx(0.5)
+    # Other clients and routes have their own buckets
+    assert limiter.check('route', 'b', 2, 3) == 0
+    assert limiter.check('other', 'a', 2, 3) == 0
+    clock[0] += 0.5
+    assert limiter.check('route', 'a', 2, 3) == 0
+    assert limiter.check('route', 'a', 2, 3) == pytest.approx(0.5)
+    # Refill stops at the burst size
+    clock[0] += 60
+    assert [limiter.check('route', 'a', 2, 3) for _ in range(4)][-1] > 0
+    assert limiter.rejected == {'route': 3}
+
+
+def test_idle_and_excess_buckets_are_evicted(clock):
+    limiter = TokenBucketLimiter(max_buckets=3, idle_seconds=10)
+    for client in 'abc':
+        limiter.check('route', client, 1, 1)
+        clock[0] += 1
+    limiter.check('route', 'a', 1, 1)
+    assert list(limiter._buckets) == [('route', 'b'), ('route', 'c'), ('route', 'a')]
+    # Over the cap: the least recently used bucket goes
+    limiter.check('route', 'd', 1, 1)
+    assert list(limiter._buckets) == [('route', 'c'), ('route', 'a'), ('route', 'd')]
+    clock[0] += 10
+    limiter.check('route', 'e', 1, 1)
+    assert list(limiter._buckets) == [('route', 'e')]
+    # An evicted bucket comes back full
+    assert limiter.check('route', 'a', 1, 1) == 0
+
+
+def test_concurrency_limiter_rejects_instead_of_queueing():
+    limiter = ConcurrencyLimiter(2, 'section')
+    before = RATE_LIMIT_REJECTIONS.value('concurrency', 'section')
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+    assert (limiter.active, limiter.rejected) == (2, 1)
+    assert RATE_LIMIT_REJECTIONS.value('concurrency', 'section') == before + 1
+
+
+def test_rate_limited_route_answers_429_with_retry_after(make_app):
+    app = make_app(BLUEPRINTS=('auth', 'sensor', 'metrics'), RATE_LIMITS={'sensor.sensor_data_api': (0.1, 2)})
+    before = RATE_LIMIT_REJECTIONS.value('rate', 'sensor.sensor_data_api')
+    client = app.test_client()
+    reading = {'temperature': 20.0, 'humidity': 50.0}
+    assert [client.post('/api/sensor', json=reading).status_code for _ in range(2)] == [200, 200]
+    response = client.post('/api/sensor', json=reading)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '10'
+    assert RATE_LIMIT_REJECTIONS.value('rate', 'sensor.sensor_data_api') == before + 1
+    assert 'rate_limit_rejections_total{limiter="rate",name="sensor.sensor_data_api"}' in \
+        app.test_client().get('/metrics').get_data(as_text=True)
+
+
+def _upload(client):
+    return client.post('/upload_image', data={'image': (io.BytesIO(b'img'), 'frame.jpg')},
+                       content_type='multipart/form-data')
+
+
+def test_image_decode_slot_covers_only_the_decode(make_app, monkeypatch):
+    app = make_app(BLUEPRINTS=('auth', 'sensor', 'qr'), CONCURRENCY_LIMITS={'image_decode': 1})
+    with app.app_context():
+        limiter = get_concurrency_limiter('image_decode')
+    active = {}
+    monkeypatch.setattr('app.qr._decode_upload',
+                        lambda image_file, camera: active.setdefault('decode', limiter.active) and 'Q1')
+    monkeypatch.setattr('app.qr.broadcast', lambda *args: active.setdefault('broadcast', limiter.active))
+    monkeypatch.setattr('app.qr.recheck_later', lambda *args: None)
+    client = app.test_client()
+    assert _upload(client).status_code == 200
+    assert active == {'decode': 1, 'broadcast': 0}
+
+    assert limiter.try_acquire()
+    response = _upload(client)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,190 @@
+"""One suite for every storage backend: routes must see the same results from each."""
+import pytest
+from flask import current_app
+from app.database import init_db
+from app.migrations import run_migrations
+from app.repositories import DuplicateError, get_repos
+from app.utils import HOUR_MS
+
+BASE_MS = 1_700_000_000_000 // HOUR_MS * HOUR_MS
+
+
+@pytest.fixture(params=['sqlite', 'sqlalchemy'])
+def repos(request, db_app):
+    db_app.config.update(STORAGE_BACKEND=request.param,
+                         SQLALCHEMY_DATABASE_URI='sqlite:///' + db_app.config['DATABASE'])
+    with db_app.app_context():
+        init_db()
+        run_migrations()
+        yield get_repos()
+        engine = db_app.extensions.get('sqlalchemy_engine')
+        if engine is not None:
+            engine.dispose()
+
+
+def _reading(ts_ms, temperature=20.0, weight=None, device_id=None, seq=None):
+    return (temperature, 50.0, weight, ts_ms, f'ts-{ts_ms}', device_id, seq)
+
+
+def test_sensor_latest(repos):
+    assert repos.sensors.latest() is None
+    assert repos.sensors.latest_weight() is None
+    repos.sensors.insert(21.0, 40.0, 1.5, BASE_MS + 2, 'b')
+    repos.sensors.insert(20.0, 41.0, None, BASE_MS + 1, 'a')
+    row = repos.sensors.latest()
+    assert (row['temperature'], row['humidity'], row['weight'], row['timestamp']) == (21.0, 40.0, 1.5, 'b')
+    assert repos.sensors.latest_weight() == 1.5
+
+
+def test_sensor_insert_many_skips_replayed_seq(repos):
+    stored = repos.sensors.insert_many([
+        _reading(BASE_MS, device_id='esp', seq=1),
+        _reading(BASE_MS + 1, device_id='esp', seq=2),
+        _reading(BASE_MS + 2, device_id='esp', seq=1),
+        _reading(BASE_MS + 3, device_id='other', seq=1),
+        _reading(BASE_MS + 4),
+        _reading(BASE_MS + 5),
+    ])
+    assert stored == [True, True, False, True, True, True]
+    assert repos.sensors.insert(1.0, 2.0, None, BASE_MS + 6, 'x', 'esp', 2) is False
+    assert repos.sensors.insert(1.0, 2.0, None, BASE_MS + 7, 'x', 'esp', 3) is True
+
+
+def test_sensor_insert_many_is_one_transaction(repos):
+    # As in a request: the failed batch is abandoned when its app context is torn down
+    with current_app.app_context(), pytest.raises(Exception):
+        repos.sensors.insert_many([_reading(BASE_MS, device_id='esp', seq=1),
+                                   _reading(BASE_MS + 1, temperature=object())])
+    assert repos.sensors.latest() is None
+
+
+def test_sensor_hourly_returns_one_row_per_hour(repos):
+    repos.sensors.insert_many([
+        _reading(BASE_MS + 10, temperature=1.0),
+        _reading(BASE_MS + 20, temperature=2.0),
+        # Two readings share the latest ms of the hour, as a batch does
+        _reading(BASE_MS + 30, temperature=2.5),
+        _reading(BASE_MS + 30, temperature=3.0),
+        _reading(BASE_MS + HOUR_MS + 5, temperature=4.0),
+        _reading(BASE_MS + 3 * HOUR_MS, temperature=5.0),
+    ])
+    rows = repos.sensors.hourly()
+    assert [(row['timestamp_ms'], row['temperature']) for row in rows] == [
+        (BASE_MS + 3 * HOUR_MS, 5.0), (BASE_MS + HOUR_MS + 5, 4.0), (BASE_MS + 30, 3.0)]
+    assert len(repos.sensors.hourly(limit=2)) == 2
+    rows = repos.sensors.hourly(since_ms=BASE_MS + 15, until_ms=BASE_MS + 2 * HOUR_MS)
+    assert [row['timestamp_ms'] for row in rows] == [BASE_MS + HOUR_MS + 5, BASE_MS + 30]
+    assert repos.sensors.hourly(until_ms=BASE_MS + 20)[0]['timestamp_ms'] == BASE_MS + 20
+
+
+def test_sensor_ranges(repos):
+    assert repos.sensors.first_timestamp_ms() is None
+    repos.sensors.insert_many([_reading(BASE_MS + i, weight=float(i) if i % 2 else None,
+                                        device_id='scale' if i % 2 else None) for i in range(10)])
+    assert repos.sensors.first_timestamp_ms() == BASE_MS
+    # Legacy text timestamps that could not be parsed are stored as 0
+    repos.sensors.insert(1.0, 2.0, None, 0, 'garbled')
+    assert repos.sensors.first_timestamp_ms() == BASE_MS
+    assert [tuple(row) for row in repos.sensors.weight_readings(BASE_MS + 2, BASE_MS + 5)] == [
+        ('scale', BASE_MS + 3, 3.0), ('scale', BASE_MS + 5, 5.0)]
+    chunks = list(repos.sensors.iter_readings(BASE_MS + 1, BASE_MS + 8, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert [row[0] for chunk in chunks for row in chunk] == [BASE_MS + i for i in range(1, 8)]
+    assert tuple(chunks[0][0]) == (BASE_MS + 1, 20.0, 50.0, 1.0)
+
+
+def test_inventory(repos):
+    assert repos.inventory.add('Q1', 'bolt', 1.5, BASE_MS, 'a') == (True, 'bolt', 1.5, 1)
+    assert repos.inventory.add('Q1', 'bolt', 9.9, BASE_MS + 2, 'c') == (False, 'bolt', 1.5, 2)
+    repos.inventory.add('Q2', 'nut', 0.5, BASE_MS + 1, 'b')
+    assert repos.inventory.name_for_qr('Q1') == 'bolt'
+    assert repos.inventory.name_for_qr('missing') is None
+    assert [row['qr_code'] for row in repos.inventory.recent()] == ['Q1', 'Q2']
+    assert [row['qr_code'] for row in repos.inventory.recent(limit=1)] == ['Q1']
+
+    assert repos.inventory.remove_one('Q1', 'bolt') is True
+    assert repos.inventory.recent()[0]['quantity'] == 1
+    assert repos.inventory.remove_one('Q1', 'bolt') is True
+    assert repos.inventory.remove_one('Q1', 'bolt') is False
+    assert [row['qr_code'] for row in repos.inventory.recent()] == ['Q2']
+
+
+def test_scans(repos):
+    assert repos.scans.latest() is None
+    assert repos.scans.record('Q1', 'QR Item', BASE_MS, 'a') is True
+    assert repos.scans.record('Q2', 'QR Item', BASE_MS + 1, 'b') is True
+    assert repos.scans.record('Q1', 'QR Item', BASE_MS + 2, 'c') is False
+    assert dict(repos.scans.latest()) == {'qr_code': 'Q1', 'name': 'QR Item', 'timestamp': 'c'}
+
+    first = repos.scans.record_weight('Q1', BASE_MS, None, None, None, None)
+    second = repos.scans.record_weight('Q2', BASE_MS + 1, 'scale', 2.0, BASE_MS, 'nearest')
+    assert first != second
+    repos.scans.update_weight(first, 'scale', 3.0, BASE_MS + 5, 'stable')
+
+
+def test_admins(repos):
+    repos.admins.create('alice', 'pw', '123', 'J1')
+    with pytest.raises(DuplicateError):
+        repos.admins.create('alice', 'other', '456', 'J2')
+    assert repos.admins.authenticate('alice', 'pw')
+    assert not repos.admins.authenticate('alice', 'wrong')
+    assert dict(repos.admins.get('alice')) == {'admin_id': 'alice', 'tel': '123', 'job_num': 'J1'}
+    assert repos.admins.get('bob') is None
+
+    repos.admins.update_profile('alice', '789', 'J3')
+    assert dict(repos.admins.get('alice')) == {'admin_id': 'alice', 'tel': '789', 'job_num': 'J3'}
+    assert repos.admins.authenticate('alice', 'pw')
+    repos.admins.update_profile('alice', '789', 'J3', password='new')
+    assert repos.admins.authenticate('alice', 'new')
+
+
+def test_devices(repos):
+    repos.devices.set_key('scale-1', 'hash-a', BASE_MS)
+    repos.devices.set_key('scale-2', 'hash-b', BASE_MS)
+    repos.devices.set_key('scale-1', 'hash-c', BASE_MS + 1)
+    assert {row['device_id']: row['key_hash'] for row in repos.devices.all()} == {'scale-1': 'hash-c',
+                                                                                 'scale-2': 'hash-b'}
+    assert repos.devices.delete('scale-1') is True
+    assert repos.devices.delete('scale-1') is False
+    assert [row['device_id'] for row in repos.devices.all()] == ['scale-2']
+
+
+def test_leases(repos):
+    assert repos.leases.acquire('job', 'a', BASE_MS + 60, BASE_MS)
+    # Held by another worker until it expires
+    assert not repos.leases.acquire('job', 'b', BASE_MS + 60, BASE_MS + 1)
+    assert repos.leases.acquire('job', 'a', BASE_MS + 120, BASE_MS + 50)
+    assert not repos.leases.acquire('job', 'b', BASE_MS + 180, BASE_MS + 100)
+    assert repos.leases.acquire('job', 'b', BASE_MS + 180, BASE_MS + 121)
+    assert not repos.leases.acquire('job', 'a', BASE_MS + 200, BASE_MS + 122)
+    # Only the holder can release
+    repos.leases.release('job', 'a')
+    assert not repos.leases.acquire('job', 'a', BASE_MS + 200, BASE_MS + 123)
+    repos.leases.release('job', 'b')
+    assert repos.leases.acquire('job', 'a', BASE_MS + 200, BASE_MS + 124)
+    assert repos.leases.acquire('other', 'b', BASE_MS + 200, BASE_MS + 124)
+
+
+@pytest.mark.parametrize('upsert', [True, False])
+def test_scan_inserted_by_another_worker_mid_record(repos, monkeypatch, upsert):
+    if not hasattr(repos.scans, 'engine'):
+        pytest.skip('SQLite serializes the UPDATE and INSERT in one write transaction')
+    from sqlalchemy import event
+    from app.repositories import sqlalchemy_core
+    if not upsert:
+        monkeypatch.setattr(sqlalchemy_core, '_CONFLICT_INSERTS', {})
+    engine = repos.scans.engine
+    other = sqlalchemy_core.ScanRepo(engine)
+
+    def race(conn, cursor, statement, parameters, context, executemany):
+        # The other worker commits the same new code just before this one inserts it
+        if statement.startswith('INSERT INTO "QRdate"') and not race.done:
+            race.done = True
+            other.record('Q1', 'QR Item', BASE_MS, 'a')
+    race.done = False
+    event.listen(engine, 'before_cursor_execute', race)
+    try:
+        assert repos.scans.record('Q1', 'QR Item', BASE_MS + 1, 'b') is False
+    finally:
+        event.remove(engine, 'before_cursor_execute', race)
+    assert dict(repos.scans.latest()) == {'qr_code': 'Q1', 'name': 'QR Item', 'timestamp': 'b'}
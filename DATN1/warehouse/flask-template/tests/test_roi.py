@@ -0,0 +1,96 @@
+import pytest
+from app import roi
+from app.metrics import QR_DECODE_ATTEMPTS, QR_ROI_LOOKUPS
+from app.roi import RoiTracker, get_roi_tracker
+
+SQUARE = [(100, 100), (200, 100), (200, 200), (100, 200)]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(roi.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_hit_is_padded_and_clamped_to_the_frame(clock):
+    tracker = RoiTracker(padding=0.5, min_size=32)
+    tracker.record_hit('cam', SQUARE)
+    assert tracker.candidates('cam', 1000, 1000) == [(50, 50, 251, 251)]
+    assert tracker.candidates('cam', 220, 180) == [(50, 50, 220, 180)]
+    # Points found in a crop are stored in frame coordinates
+    tracker.record_hit('cam', [(0, 0), (10, 10)], offset=(500, 600))
+    assert tracker.candidates('cam', 1000, 1000)[0] == (468, 568, 543, 643)
+    assert tracker.candidates('other', 1000, 1000) == []
+
+
+def test_regions_decay_after_the_ttl(clock):
+    tracker = RoiTracker(ttl_seconds=30)
+    tracker.record_hit('cam', SQUARE)
+    clock[0] += 20
+    tracker.record_hit('cam', [(600, 600), (700, 700)])
+    clock[0] += 15
+    assert tracker.candidates('cam', 1000, 1000) == [(550, 550, 751, 751)]
+    clock[0] += 15
+    assert tracker.candidates('cam', 1000, 1000) == []
+
+
+def test_regions_are_capped_and_overlapping_hits_replace_each_other(clock):
+    tracker = RoiTracker(padding=0, min_size=0, max_regions=2)
+    for x in (0, 300, 600):
+        tracker.record_hit('cam', [(x, 0), (x + 100, 100)])
+    assert tracker.candidates('cam', 1000, 1000) == [(600, 0, 701, 101), (300, 0, 401, 101)]
+    tracker.record_hit('cam', [(350, 50), (450, 150)])
+    assert tracker.candidates('cam', 1000, 1000) == [(350, 50, 451, 151), (600, 0, 701, 101)]
+
+
+def test_least_recently_seen_camera_is_dropped(clock):
+    tracker = RoiTracker(max_cameras=2)
+    tracker.record_hit('a', SQUARE)
+    tracker.record_hit('b', SQUARE)
+    tracker.record_hit('a', SQUARE)
+    tracker.record_hit('c', SQUARE)
+    assert tracker.camera_count() == 2
+    assert tracker.candidates('b', 1000, 1000) == []
+    assert tracker.candidates('a', 1000, 1000) and tracker.candidates('c', 1000, 1000)
+
+
+@pytest.fixture
+def app(make_app):
+    from app.qr import load_vision
+    load_vision()
+    app = make_app(BLUEPRINTS=('auth', 'sensor', 'qr'))
+    with app.app_context():
+        yield app
+
+
+def _frame(x, y):
+    import cv2
+    import numpy as np
+    code = cv2.QRCodeEncoder.create().encode('ITEM-1')
+    code = cv2.resize(code, (code.shape[1] * 8, code.shape[0] * 8), interpolation=cv2.INTER_NEAREST)
+    canvas = np.full((800, 1000), 255, np.uint8)
+    canvas[y:y + code.shape[0], x:x + code.shape[1]] = code
+    return cv2.cvtColor(canvas, cv2.COLOR_GRAY2RGB)
+
+
+def _attempts(*stages):
+    return [QR_DECODE_ATTEMPTS.value(stage, result) for stage in stages for result in ('success', 'miss')]
+
+
+def test_tracked_region_is_tried_first_with_the_original_stage_only(app):
+    from app.qr import decode_qr_tracked
+    stages = ('roi original', 'roi grayscale', 'original', 'grayscale')
+    assert decode_qr_tracked(_frame(100, 100), 'cam') == 'ITEM-1'
+    assert len(get_roi_tracker().candidates('cam', 1000, 800)) == 1
+
+    before, lookups = _attempts(*stages), (QR_ROI_LOOKUPS.value('hit'), QR_ROI_LOOKUPS.value('miss'))
+    assert decode_qr_tracked(_frame(110, 90), 'cam') == 'ITEM-1'
+    assert [b - a for a, b in zip(before, _attempts(*stages))] == [1, 0, 0, 0, 0, 0, 0, 0]
+
+    # The code moved: the crop gets one attempt, then the full frame the whole cascade
+    before = _attempts(*stages)
+    assert decode_qr_tracked(_frame(700, 500), 'cam') == 'ITEM-1'
+    assert [b - a for a, b in zip(before, _attempts(*stages))] == [0, 1, 0, 0, 1, 0, 0, 0]
+    assert (QR_ROI_LOOKUPS.value('hit'), QR_ROI_LOOKUPS.value('miss')) == (lookups[0] + 1, lookups[1] + 1)
+    assert len(get_roi_tracker().candidates('cam', 1000, 800)) == 2
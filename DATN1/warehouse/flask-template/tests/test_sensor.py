@@ -0,0 +1,75 @@
+import pytest
+from app.repositories import get_repos
+
+
+@pytest.fixture(params=['sqlite', 'sqlalchemy'])
+def client(request, make_app):
+    app = make_app(STORAGE_BACKEND=request.param)
+    with app.test_client() as client:
+        yield client
+
+
+def _reading(seq=None, device_id='esp', **fields):
+    reading = {'temperature': 20.0, 'humidity': 50.0, 'device_id': device_id, 'seq': seq}
+    reading.update(fields)
+    return reading
+
+
+def _stored(client):
+    with client.application.app_context():
+        return [(row[0], row[1]) for chunk in get_repos().sensors.iter_readings(0, 2 ** 62)
+                for row in chunk]
+
+
+def test_single_reading_is_acknowledged_once(client):
+    response = client.post('/api/sensor', json=_reading(seq=1))
+    assert response.status_code == 200
+    assert 'duplicate' not in response.json
+    response = client.post('/api/sensor', json=_reading(seq=1))
+    assert response.status_code == 200
+    assert response.json['duplicate'] is True
+
+
+def test_batch_counts_stored_and_duplicates(client):
+    response = client.post('/api/sensor', json=[_reading(seq=seq) for seq in (0, 1, 2, 2, 3)])
+    assert response.json == {'status': 'success', 'stored': 4, 'duplicates': 1}
+    # A restarted worker only has the unique index to go on
+    client.application.extensions.pop('sensor_dedupe')
+    response = client.post('/api/sensor', json=[_reading(seq=3), _reading(seq=4), _reading(seq=3, device_id='b')])
+    assert response.json == {'status': 'success', 'stored': 2, 'duplicates': 1}
+
+
+def test_seq_without_device_id_is_stored_without_dedupe(client):
+    for _ in range(2):
+        response = client.post('/api/sensor', json=_reading(seq=7, device_id=None))
+        assert response.status_code == 200
+        assert 'duplicate' not in response.json
+    assert len(_stored(client)) == 2
+
+
+def test_invalid_reading_rejects_the_whole_batch(client):
+    response = client.post('/api/sensor', json=[_reading(seq=1), _reading(seq=2, humidity='x')])
+    assert response.status_code == 400
+    assert response.json['message'].startswith('Reading 1:')
+    assert _stored(client) == []
+
+
+def test_failing_batch_is_rolled_back(client, monkeypatch):
+    # Storage fails on the second row, after the first was written in the same transaction
+    readings = [_reading(seq=1, timestamp_ms=1_000), _reading(seq=2, timestamp_ms=2_000)]
+    monkeypatch.setattr('app.sensor.format_timestamp',
+                        lambda ms: object() if ms == 2_000 else '1970-01-01 00:00:01')
+    response = client.post('/api/sensor', json=readings)
+    assert response.status_code == 500
+    assert _stored(client) == []
+    # Nothing was recorded as seen, so the device can retry the same seqs
+    monkeypatch.undo()
+    response = client.post('/api/sensor', json=readings)
+    assert response.json['stored'] == 2
+    assert _stored(client) == [(1_000, 20.0), (2_000, 20.0)]
+
+
+def test_batch_size_is_capped(make_app):
+    app = make_app(SENSOR_BATCH_MAX=2)
+    response = app.test_client().post('/api/sensor', json=[_reading(seq=seq) for seq in range(3)])
+    assert response.status_code == 400
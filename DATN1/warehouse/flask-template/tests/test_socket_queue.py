@@ -0,0 +1,56 @@
+import time
+from flask import Flask
+from flask_socketio import SocketIO
+from app import socket_queue
+from app.socket_queue import LocalManager
+
+
+def _workers(count, handled):
+    """SocketIO servers on one local bus; ``handled[i]`` lists the emits worker ``i`` delivered to its clients.
+
+    The Flask-SocketIO test client refuses message queues, so delivery is observed on each manager.
+    """
+    workers = []
+    for i in range(count):
+        socketio = SocketIO(Flask(f'worker{i}'), async_mode='threading', client_manager=LocalManager(channel='test'))
+        manager = socketio.server.manager
+        original = manager._handle_emit
+        manager._handle_emit = (lambda original, i: lambda message: (
+            handled.setdefault(i, []).append(message['event']), original(message)))(original, i)
+        socketio.server.manager_initialized = True
+        manager.initialize()
+        workers.append(socketio)
+    return workers
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_emit_on_one_worker_is_delivered_by_every_worker():
+    handled = {}
+    workers = _workers(2, handled)
+    try:
+        workers[0].emit('new_sensor_data', {'weight': 7}, namespace='/')
+        assert _wait_for(lambda: len(handled) == 2)
+        time.sleep(0.05)
+        # The emitting worker delivers directly, the other from the bus; each exactly once
+        assert handled == {0: ['new_sensor_data'], 1: ['new_sensor_data']}
+    finally:
+        for socketio in workers:
+            socketio.server.manager.close()
+    assert 'test' not in socket_queue._channels
+
+
+def test_closed_worker_leaves_the_bus():
+    handled = {}
+    workers = _workers(2, handled)
+    workers[1].server.manager.close()
+    workers[0].emit('new_sensor_data', {'weight': 1}, namespace='/')
+    assert not _wait_for(lambda: 1 in handled, timeout=0.2)
+    assert handled == {0: ['new_sensor_data']}
+    workers[0].server.manager.close()
+    assert 'test' not in socket_queue._channels